@@ -10,10 +10,6 @@ within the disk image, PackageSymbolDumper mounts, traverses, and dumps symbols
 for all applicable frameworks and dylibs found within.
 
 Required tools for Linux:
-    pax
-    gzip
-    tar
-    xar (http://code.google.com/p/xar/)
     xpwn's dmg (https://github.com/planetbeing/xpwn)
 
 Created on Apr 11, 2012
@@ -21,29 +17,64 @@ Created on Apr 11, 2012
 @author: mrmiller
 '''
 import argparse
+import bz2
 import concurrent.futures
 import errno
-import glob
+import hashlib
+import itertools
 import logging
+import multiprocessing
 import os
 import shutil
-import subprocess
 import sys
 import tempfile
+import threading
+import time
+import zlib
+from contextlib import closing
 
-from scrapesymbols.gathersymbols import process_paths
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
 
+import cpio
+import dump_scheduler
+import macho
+import metrics
+import package_store
+import staging
+import symbol_sink
+from planner import Planner
+import xar
+from dump_scheduler import DumpScheduler, DumpTask
+from parse_pbzx import ParallelDecoder, PbzxError, decode_pbzx, lzma
+from pipeline import Stage, run_pipeline
+from streams import IterReader
+from symbol_index import SymbolIndex, parse_symbol_filename
 
-def expand_pkg(pkg_path, out_path):
-    '''
-    Expands the contents of an installer package to some directory.
+# Directories within a payload that hold the binaries we dump symbols for.
+SYMBOL_DIRECTORIES = (
+    'System/Library/Frameworks/',
+    'System/Library/PrivateFrameworks/',
+    'usr/lib/',
+)
+
+# Staging space to reserve for a payload's extracted binaries, as a multiple
+# of the compressed payload's size, and for payloads of unknown size.
+PAYLOAD_EXPANSION = 3
+UNKNOWN_PAYLOAD_SIZE = 1024 * 1024 * 1024
+
+# How often, in seconds, the symbol files written so far are flushed to disk
+# and checkpointed, besides whenever a payload is finished.
+CHECKPOINT_INTERVAL = 60
+
+# The architectures we dump symbols for by default; crash reports never
+# reference the i386 and ppc slices in older updates.
+DEFAULT_ARCHS = ('x86_64', 'x86_64h', 'arm64', 'arm64e')
 
-    @param pkg_path: a path to an installer package (.pkg)
-    @param out_path: a path to hold the package contents
-    '''
-    subprocess.check_call('cd "{dest}" && xar -x -f "{src}"'.format(src=pkg_path, dest=out_path), shell=True)
 
-def filter_files(function, path):
+def filter_files(function, path, prune=None):
     '''
     Yield file paths matching a filter function by walking the
     hierarchy rooted at path.
@@ -51,22 +82,40 @@ def filter_files(function, path):
     @param function: a function taking in a filename that returns true to
         include the path
     @param path: the root path of the hierarchy to traverse
+    @param prune: an optional function taking in a directory name that
+        returns true to skip the directory and everything beneath it
     '''
-    for root, _dirs, files in os.walk(path):
-        for filename in files:
-            if function(filename):
-                yield os.path.join(root, filename)
+    # scandir tells us whether each entry is a directory without another
+    # stat call, which matters on a mirror with hundreds of thousands of
+    # metadata files.
+    pending = [path]
+    while pending:
+        directory = pending.pop()
+        try:
+            entries = list(scandir(directory))
+        except OSError as e:
+            logging.warning('Could not list {}: {}'.format(directory, e))
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if prune is None or not prune(entry.name):
+                    pending.append(entry.path)
+            elif function(entry.name):
+                yield entry.path
+
+def is_package_name(filename):
+    return os.path.splitext(filename)[1] == '.pkg'
 
 def find_packages(path):
     '''
     Returns a list of installer packages (as determined by the .pkg extension)
-    found within path.
+    found within path. Bundle packages and hidden directories are not
+    searched.
 
     @param path: root path to search for .pkg files
     '''
-    return filter_files(lambda filename:
-                            os.path.splitext(filename)[1] == '.pkg',
-                        path)
+    return filter_files(is_package_name, path,
+                        lambda name: is_package_name(name) or name.startswith('.'))
 
 def find_all_packages(paths):
     '''
@@ -79,163 +128,888 @@ def find_all_packages(paths):
         for pkg in find_packages(path):
             yield pkg
 
-def find_payloads(path):
+def load_reposado(main_dir):
     '''
-    Returns a list of possible installer package payload paths.
+    Import reposadocommon configured with the preferences.plist in
+    main_dir, or return None if reposado isn't installed.
 
-    @param path: root path for an installer package
+    @param main_dir: the directory holding reposado's preferences.plist
     '''
-    return filter_files(lambda filename:
-                            'Payload' in filename or '.pax.gz' in filename,
-                        path)
+    try:
+        import reposadolib.reposadocommon as reposadocommon
+    except ImportError:
+        return None
+    reposadocommon.get_main_dir = lambda: main_dir
+    return reposadocommon
 
-def extract_payload(payload_path, output_path):
+def find_product_packages(products, local_path, product_ids=None):
     '''
-    Extracts the contents of an installer package payload to a given directory.
+    Yield the local paths of the downloaded installer packages of products,
+    oldest product first, without walking the mirror.
 
-    @param payload_path: path to an installer package's payload
-    @param output_path: output path for the payload's contents
-    @return True for success, False for failure.
+    @param products: reposado product info, a dict mapping product ids to
+        dicts with a CatalogEntry
+    @param local_path: a function mapping a package URL to its local path
+    @param product_ids: if given, only packages of these products are
+        yielded
     '''
-    header = open(payload_path, 'rb').read(2)
-    try:
-        if header == 'BZ':
-            logging.info('Extracting bzip2 payload')
-            extract = 'bzip2'
-            subprocess.check_call('cd {dest} && {extract} -dc {payload} | pax -r -k -s ":^/::"'.format(extract=extract, payload=payload_path, dest=output_path), shell=True)
-            return True
-        elif header == '\x1f\x8b':
-            logging.info('Extracting gzip payload')
-            extract = 'gzip'
-            subprocess.check_call('cd {dest} && {extract} -dc {payload} | pax -r -k -s ":^/::"'.format(extract=extract, payload=payload_path, dest=output_path), shell=True)
-            return True
-        elif header == 'pb':
-            logging.info('Extracting pbzx payload')
-            extract = 'parse_pbzx.py'
-
-            payload_dir = os.path.dirname(payload_path)
-            # First, unpack the PBZX into cpio parts.
-            subprocess.check_call(['parse_pbzx.py', payload_path], cwd=payload_dir)
-            # Next, decompress any parts that are .xz, and feed them all into pax.
-            pax_proc = subprocess.Popen(['pax', '-r', '-k', '-s', ':^/::'], stdin=subprocess.PIPE, cwd=output_path)
-            for part in sorted(glob.glob(os.path.join(payload_dir, 'Payload.part*'))):
-                if part.endswith('.xz'):
-                    logging.info('Extracting xz part {}'.format(part))
-                    # This would be easier if we pulled in the lzma module...
-                    xz_proc = subprocess.Popen(['xz', '-dc', part], stdout=subprocess.PIPE, cwd=payload_dir)
-                    shutil.copyfileobj(xz_proc.stdout, pax_proc.stdin)
-                    xz_proc.wait()
-                else:
-                    logging.info('Copying plain cpio part {}'.format(part))
-                    with open(part, 'rb') as f:
-                        shutil.copyfileobj(f, pax_proc.stdin)
-            pax_proc.stdin.close()
-            pax_proc.wait()
-            return True
-        else:
-            # Unsupported format
-            logging.error('Unknown payload format: 0x{0:x}{1:x}'.format(ord(header[0]), ord(header[1])))
-            return False
+    entries = []
+    for product_id, product in products.items():
+        if product_ids and product_id not in product_ids:
+            continue
+        entry = product.get('CatalogEntry') or {}
+        entries.append((entry.get('PostDate'), product_id, entry))
+    entries.sort(key=lambda e: (e[0] is not None, e[0], e[1]))
+    seen = set()
+    for _post_date, product_id, entry in entries:
+        for package in entry.get('Packages', []):
+            url = package.get('URL')
+            if not url or not is_package_name(url):
+                continue
+            path = local_path(url)
+            if path in seen:
+                continue
+            seen.add(path)
+            if os.path.isfile(path):
+                yield path
+            else:
+                logging.debug('{}: {} was not downloaded'.format(product_id, url))
 
-    except subprocess.CalledProcessError:
-        return False
+def find_reposado_packages(main_dir, product_ids=None, fallback_paths=()):
+    '''
+    Yield the downloaded installer packages listed in reposado's product
+    info. If reposado or its product info isn't available, packages are
+    searched for in fallback_paths instead.
 
-def shutil_error_handler(caller, path, excinfo):
-    logging.error('Could not remove "{path}": {info}'.format(path=path, info=excinfo))
+    @param main_dir: the directory holding reposado's preferences.plist
+    @param product_ids: if given, only packages of these products are
+        yielded
+    @param fallback_paths: list of root paths to search for .pkg files
+    '''
+    reposadocommon = load_reposado(main_dir)
+    products = reposadocommon.getProductInfo() if reposadocommon else None
+    if not products:
+        logging.warning('No reposado product info, searching for packages instead')
+        for pkg in find_all_packages(fallback_paths):
+            yield pkg
+        return
+    logging.info('Finding packages of {} products'.format(
+        len(product_ids) if product_ids else len(products)))
+    for pkg in find_product_packages(products,
+                                     reposadocommon.getLocalPathNameFromURL,
+                                     product_ids):
+        yield pkg
 
+def find_subpackages(archive):
+    '''
+    Returns a list of the installer packages nested within an installer
+    package.
 
-def write_symbol_file(dest, filename, contents):
-    full_path = os.path.join(dest, filename)
-    try:
-        os.makedirs(os.path.dirname(full_path))
-        open(full_path, 'wb').write(contents)
-    except os.error as e:
-        if e.errno != errno.EEXIST:
+    @param archive: a xar.XarArchive for an installer package
+    '''
+    return [m for m in archive.files()
+            if os.path.splitext(m.basename)[1] == '.pkg']
+
+def open_subpackage(archive, member):
+    '''
+    Returns a xar.XarArchive for an installer package nested within another.
+    Nested packages stored without an encoding are read in place; encoded
+    ones can only be read from start to end, so they are decoded to a
+    temporary file first.
+
+    @param archive: a xar.XarArchive for the outer installer package
+    @param member: the xar.XarMember of the nested package
+    '''
+    f = archive.open(member)
+    if member.encoding != xar.ENCODING_NONE:
+        decoded = tempfile.TemporaryFile()
+        try:
+            shutil.copyfileobj(f, decoded, cpio.BLOCK_SIZE)
+        except:
+            decoded.close()
             raise
+        f = decoded
+    return xar.XarArchive(f)
 
-def dump_symbols_from_payload(executor, dump_syms, payload_path, dest):
+def find_payloads(archive):
     '''
-    Dumps all the symbols found inside the payload of an installer package.
+    Returns a list of possible installer package payloads.
 
-    @param dump_syms: path to the dump_syms executable
-    @param payload_path: path to an installer package's payload
-    @param dest: output path for symbols
+    @param archive: a xar.XarArchive for an installer package
     '''
-    temp_dir = None
-    logging.info('Dumping symbols from payload: ' + payload_path)
-    try:
-        temp_dir = tempfile.mkdtemp()
-        logging.info('Extracting payload to {path}.'.format(path=temp_dir))
-        if not extract_payload(payload_path, temp_dir):
-            logging.error('Could not extract payload: ' + payload_path)
+    return [m for m in archive.files()
+            if 'Payload' in m.basename or '.pax.gz' in m.basename]
+
+def format_checksum(checksum):
+    '''
+    Returns a xar (algorithm, hex digest) checksum as a single string, or
+    None if there isn't one.
+    '''
+    if checksum is None or not checksum[1]:
+        return None
+    return '{}:{}'.format(*checksum)
+
+def content_digest(path, offset=0, size=None):
+    '''
+    Returns the SHA-1 digest of size bytes of the file at path starting at
+    offset, or of the rest of the file if size is None, in the form
+    sha1:HEX.
+    '''
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        remaining = size
+        while remaining is None or remaining > 0:
+            data = f.read(cpio.BLOCK_SIZE if remaining is None
+                          else min(cpio.BLOCK_SIZE, remaining))
+            if not data:
+                break
+            digest.update(data)
+            if remaining is not None:
+                remaining -= len(data)
+    return 'sha1:' + digest.hexdigest()
+
+class PayloadError(Exception):
+    '''An installer package payload is in a format we can't read.'''
+    pass
+
+
+def read_blocks(f, size=cpio.BLOCK_SIZE):
+    '''
+    Yield the contents of the file object f in blocks of `size` bytes.
+    '''
+    while True:
+        data = f.read(size)
+        if not data:
             return
+        yield data
+
+def decode_gzip(f):
+    '''
+    Yield the decompressed contents of the gzip stream in f. Concatenated
+    gzip members are decoded one after the other; trailing padding is ignored.
+    '''
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for data in read_blocks(f):
+        while data:
+            yield decompressor.decompress(data)
+            data = decompressor.unused_data
+            if data:
+                yield decompressor.flush()
+                if not data.startswith(b'\x1f\x8b'):
+                    return
+                decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    yield decompressor.flush()
+
+def decode_bzip2(f):
+    '''
+    Yield the decompressed contents of the bzip2 stream in f. Concatenated
+    bzip2 streams are decoded one after the other; trailing padding is ignored.
+    '''
+    decompressor = bz2.BZ2Decompressor()
+    for data in read_blocks(f):
+        while data:
+            try:
+                decompressed = decompressor.decompress(data)
+            except EOFError:
+                # The previous stream ended exactly at a block boundary.
+                decompressed = None
+            if decompressed is not None:
+                yield decompressed
+                data = decompressor.unused_data
+            if data:
+                if not data.startswith(b'BZh'):
+                    return
+                decompressor = bz2.BZ2Decompressor()
+
+def decode_payload(f, pbzx_decoder=None):
+    '''
+    Return an iterator over the decompressed cpio stream of the installer
+    package payload read from the file object f.
+
+    @param f: a file object positioned at the start of the payload
+    @param pbzx_decoder: an optional parse_pbzx.ParallelDecoder to use for
+        pbzx payloads; they are decoded serially if None
+    '''
+    header = f.read(2)
+    if hasattr(f, 'seek'):
+        f.seek(-len(header), os.SEEK_CUR)
+    else:
+        f = IterReader(itertools.chain([header], read_blocks(f)))
+    if header == b'BZ':
+        logging.info('Extracting bzip2 payload')
+        return decode_bzip2(f)
+    elif header == b'\x1f\x8b':
+        logging.info('Extracting gzip payload')
+        return decode_gzip(f)
+    elif header == b'pb':
+        logging.info('Extracting pbzx payload')
+        return pbzx_decoder.decode(f) if pbzx_decoder else decode_pbzx(f)
+    elif header == b'07':
+        logging.info('Extracting uncompressed cpio payload')
+        return read_blocks(f)
+    raise PayloadError('Unknown payload format: {0!r}'.format(header))
+
+def parse_archs(text):
+    '''
+    Returns the list of architectures in the comma-separated text, or None
+    if it is "all".
+    '''
+    if text == 'all':
+        return None
+    return [arch.strip() for arch in text.split(',') if arch.strip()]
+
+def select_slices(slices, archs=None):
+    '''
+    Returns the slices whose architecture is in archs, or all of them if
+    archs is None.
+    '''
+    if archs is None:
+        return slices
+    return [s for s in slices if s.arch in archs]
+
+def needs_dump(path, symbol_index=None, archs=None, done_archs=()):
+    '''
+    Returns False if the Mach-O binary at path has no slices in archs that
+    aren't in done_archs, or symbols for all of them are already in
+    symbol_index.
+    '''
+    try:
+        slices = [s for s in select_slices(macho.read_slices_from_path(path), archs)
+                  if s.arch not in done_archs]
+    except (macho.MachOError, IOError) as e:
+        logging.warning('Could not read Mach-O headers from {}: {}'.format(path, e))
+        return True
+    if symbol_index is None:
+        return bool(slices)
+    debug_file = os.path.basename(path)
+    return not all(s.debug_id is not None and (debug_file, s.debug_id) in symbol_index
+                   for s in slices)
 
-        # dump the symbols for the payload contents
-        system_library = os.path.join('System', 'Library')
-        subdirectories = [os.path.join(system_library, 'Frameworks'), os.path.join(system_library, 'PrivateFrameworks'), os.path.join('usr', 'lib')]
-        paths_to_dump = map(lambda d: os.path.join(temp_dir, d), subdirectories)
+def extract_binaries(entries, output_path, symbol_index=None, archs=None,
+                     checkpointed=None, stop=None):
+    '''
+    Write the Mach-O binaries under SYMBOL_DIRECTORIES from a sequence of
+    cpio entries to a given directory. Everything else is skipped without
+    being written.
+
+    @param entries: an iterable of cpio.CpioEntry
+    @param output_path: output path for the binaries
+    @param symbol_index: an optional SymbolIndex; binaries whose slices
+        are all already in it are removed again after being read
+    @param archs: an optional list of architectures; binaries with no
+        slices for any of them are removed again after being read
+    @param checkpointed: an optional dict of the architectures already
+        dumped for each binary, keyed by its path in the payload; binaries
+        with nothing else to dump are removed again after being read
+    @param stop: an optional threading.Event; once it is set, no more
+        binaries are written
+    @return the number of binaries written
+    '''
+    checkpointed = checkpointed or {}
+    count = 0
+    known = 0
+    for entry in entries:
+        if stop is not None and stop.is_set():
+            break
+        name = cpio.normalize_name(entry.name)
+        if name is None or not entry.isreg() or not name.startswith(SYMBOL_DIRECTORIES):
+            continue
+        header = entry.read(macho.SNIFF_SIZE)
+        if not macho.is_macho(header):
+            continue
+        full_path = os.path.join(output_path, name)
+        try:
+            os.makedirs(os.path.dirname(full_path))
+        except os.error as e:
+            if e.errno != errno.EEXIST:
+                raise
+        with open(full_path, 'wb') as f:
+            f.write(header)
+            shutil.copyfileobj(entry, f, cpio.BLOCK_SIZE)
+        if ((symbol_index is not None or archs is not None or name in checkpointed) and
+            not needs_dump(full_path, symbol_index, archs, checkpointed.get(name, ()))):
+            os.unlink(full_path)
+            known += 1
+            continue
+        count += 1
+    if known:
+        logging.info('Skipped {} binaries with nothing to dump'.format(known))
+    return count
 
-        for filename, contents in process_paths(paths_to_dump, executor, dump_syms, False, platform='darwin'):
-            if filename and contents:
-                logging.info('Added symbol file ' + filename)
-                write_symbol_file(dest, filename, contents)
+def extract_payload(payload, output_path, pbzx_decoder=None, symbol_index=None,
+                    archs=None, run_metrics=None, pkg=None, checkpointed=None,
+                    stop=None):
+    '''
+    Extracts the binaries we want symbols for from an installer package
+    payload to a given directory.
 
+    @param payload: a file object for an installer package's payload
+    @param output_path: output path for the payload's contents
+    @param pbzx_decoder: an optional parse_pbzx.ParallelDecoder to use for
+        pbzx payloads; they are decoded serially if None
+    @param symbol_index: an optional SymbolIndex of binaries to skip
+    @param archs: an optional list of the architectures to extract
+        binaries for
+    @param run_metrics: an optional metrics.Metrics to record the time
+        spent decoding and extracting the payload in
+    @param pkg: the package the payload is from, for the metrics
+    @param checkpointed: an optional dict of the architectures of each
+        binary that were already dumped, which aren't extracted again
+    @param stop: an optional threading.Event; once it is set, extraction
+        is abandoned and False returned
+    @return True for success, False for failure.
+    '''
+    start = time.time()
+    decoded = None
+    count = 0
+    try:
+        decoded = metrics.TimedIter(decode_payload(payload, pbzx_decoder))
+        reader = cpio.CpioReader(IterReader(decoded))
+        count = extract_binaries(reader, output_path, symbol_index, archs, checkpointed, stop)
+        if stop is not None and stop.is_set():
+            logging.info('Stopped after extracting {} binaries'.format(count))
+            return False
+        logging.info('Extracted {} binaries'.format(count))
+        return True
+    except (PayloadError, cpio.CpioError, xar.XarError, PbzxError,
+            lzma.LZMAError, zlib.error, IOError) as e:
+        logging.error('Error extracting payload: {}'.format(e))
+        return False
     finally:
-        if temp_dir is not None:
-            shutil.rmtree(temp_dir, onerror=shutil_error_handler)
+        if run_metrics is not None and decoded is not None:
+            # Decoding happens as the cpio reader asks for data, so the time
+            # spent waiting on the decoder is split out from the rest.
+            payload_size = len(payload) if hasattr(payload, '__len__') else 0
+            run_metrics.record('decode', pkg, decoded.seconds, payload_size, decoded.bytes)
+            run_metrics.record('extract', pkg, time.time() - start - decoded.seconds,
+                               decoded.bytes, 0, count)
+
+
+class PackageJob(object):
+    '''
+    Tracks an installer package whose payloads are moving through the
+    processing pipeline.
+    '''
+    def __init__(self, pkg):
+        self.pkg = pkg
+        self.file = None
+        self.size = None
+        self.digest = None
+        self.started = time.time()
+        self.symbols = 0
+        self.failed = False
+        self.duplicate_of = None
+        self._lock = threading.Lock()
+        self._unextracted = 0
+        self._unfinished = 0
+
+    def add_payloads(self, count):
+        self._unextracted = self._unfinished = count
+
+    def payload_extracted(self):
+        '''
+        Note that one payload has been read, closing the package file once
+        all of them have.
+        '''
+        with self._lock:
+            self._unextracted -= 1
+            done = self._unextracted == 0
+        if done and self.file is not None:
+            self.file.close()
+
+    def payload_finished(self):
+        '''
+        Note that one payload has been completely processed. Returns True
+        once all of the package's payloads have.
+        '''
+        with self._lock:
+            self._unfinished -= 1
+            return self._unfinished == 0
+
+
+class PayloadJob(object):
+    '''
+    A payload of an installer package. Packages without payloads are
+    represented by a single PayloadJob with no stream, so that their
+    completion is still reported. digest identifies the payload's contents,
+    if the package lists a checksum for it, and checkpointed holds the
+    architectures of each binary in the payload that an earlier run already
+    dumped (see PackageStore.checkpoints).
+    '''
+    def __init__(self, package, name=None, stream=None, digest=None, checkpointed=None):
+        self.package = package
+        self.name = name
+        self.stream = stream
+        self.digest = digest
+        self.checkpointed = checkpointed or {}
+        self.extracted = False
+        self.temp_dir = None
+        self.staged = None
+
+    def release(self):
+        '''
+        Remove the directory the payload was extracted to.
+        '''
+        if self.staged is not None:
+            self.staged.release()
+            self.staged = None
+        self.temp_dir = None
+
+
+def find_archive_payloads(archive, name):
+    '''
+    Yield (name, stream, digest) for every payload in an installer package
+    opened as a xar archive, including those in nested packages. Members are
+    read in place from the archive. digest is the checksum the archive lists
+    for the payload's data, or None.
 
-def dump_symbols_from_package(executor, dump_syms, pkg, dest):
+    @param archive: a xar.XarArchive for an installer package
+    @param name: a name for the package to use in log messages
     '''
-    Dumps all the symbols found inside an installer package.
+    # check for any subpackages
+    for subpackage in find_subpackages(archive):
+        subpackage_name = name + '/' + subpackage.name
+        logging.info('Found subpackage at: ' + subpackage_name)
+        try:
+            subarchive = open_subpackage(archive, subpackage)
+        except (xar.XarError, zlib.error, EOFError, IOError) as e:
+            logging.error('Could not read subpackage {}: {}'.format(subpackage_name, e))
+            continue
+        for payload in find_archive_payloads(subarchive, subpackage_name):
+            yield payload
+
+    # dump symbols from any payloads (only expecting one) in the package
+    for payload in find_payloads(archive):
+        yield (name + '/' + payload.name, archive.open(payload),
+               format_checksum(payload.archived_checksum))
+
+def expand_package(pkg, run_metrics=None, store=None):
+    '''
+    Pipeline stage: open an installer package and yield a PayloadJob for
+    each of its payloads.
 
-    @param dump_syms: path to the dump_syms executable
     @param pkg: path to an installer package
-    @param dest: output path for symbols
+    @param run_metrics: an optional metrics.Metrics to record the time
+        spent reading the package's table of contents in
+    @param store: an optional package_store.PackageStore; a package
+        identical to one already processed, or being processed by this run,
+        yields no payloads, nor do payloads that were, and the others carry
+        the checkpoints of an earlier run that didn't finish the package
     '''
-    temp_dir = None
     logging.info('Dumping symbols from package: ' + pkg)
-    try:
-        temp_dir = tempfile.mkdtemp()
-        expand_pkg(pkg, temp_dir)
+    package = PackageJob(pkg)
+    payloads = []
+    run_metrics = run_metrics or metrics.Metrics()
+    with run_metrics.timer('expand', pkg) as timer:
+        try:
+            package.file = open(pkg, 'rb')
+            package.size = timer.bytes_in = os.fstat(package.file.fileno()).st_size
+            archive = xar.XarArchive(package.file)
+            package.digest = format_checksum(archive.toc_checksum)
+            payloads = list(find_archive_payloads(archive, pkg))
+            if store is not None and package.digest is not None:
+                package.duplicate_of = store.claim_package(package.digest, pkg)
+            if package.duplicate_of is not None:
+                logging.info('Skipping package identical to {}'.format(package.duplicate_of))
+                payloads = []
+        except (xar.XarError, IOError) as e:
+            logging.error('Could not read package {}: {}'.format(pkg, e))
+            package.failed = True
+        if store is not None:
+            unprocessed = [p for p in payloads if p[2] is None or store.claim_payload(p[2])]
+            if len(unprocessed) < len(payloads):
+                logging.info('Skipping {} payloads that were already processed'.format(
+                    len(payloads) - len(unprocessed)))
+            payloads = unprocessed
+        timer.items = len(payloads)
+    if not payloads:
+        if package.file is not None:
+            package.file.close()
+        package.add_payloads(1)
+        yield PayloadJob(package)
+        return
+    package.add_payloads(len(payloads))
+    for name, stream, digest in payloads:
+        checkpointed = store.checkpoints(pkg, name) if store is not None else None
+        if checkpointed:
+            logging.info('Resuming payload {} after {} checkpointed binaries'.format(
+                name, len(checkpointed)))
+        yield PayloadJob(package, name, stream, digest, checkpointed)
+
+def extract_payload_job(job, pbzx_decoder=None, symbol_index=None, archs=None,
+                        run_metrics=None, staging_area=None, stop=None):
+    '''
+    Pipeline stage: extract the binaries from a payload to a new temporary
+    directory, which is stored in job.temp_dir. Waits until staging_area
+    has room for the payload first.
+
+    @param job: a PayloadJob
+    @param pbzx_decoder: optional parallel decoder for pbzx payloads
+    @param symbol_index: an optional SymbolIndex of binaries to skip
+    @param archs: an optional list of the architectures to extract
+        binaries for
+    @param run_metrics: an optional metrics.Metrics to record timings in
+    @param staging_area: the staging.StagingArea to extract into; one in
+        the system temporary directory if None
+    @param stop: an optional threading.Event; once it is set, extraction
+        is abandoned and the payload's directory removed
+    '''
+    if job.stream is not None:
+        try:
+            if staging_area is None:
+                staging_area = staging.StagingArea()
+            if hasattr(job.stream, '__len__'):
+                estimate = len(job.stream) * PAYLOAD_EXPANSION
+            else:
+                estimate = UNKNOWN_PAYLOAD_SIZE
+            job.staged = staging_area.reserve(estimate)
+            job.temp_dir = job.staged.path
+            logging.info('Extracting payload {} to {}.'.format(job.name, job.temp_dir))
+            if extract_payload(job.stream, job.temp_dir, pbzx_decoder, symbol_index, archs,
+                               run_metrics, job.package.pkg, job.checkpointed, stop):
+                # Only the binaries to dump are left; free the rest of the
+                # estimate for other payloads.
+                job.staged.settle()
+                job.extracted = True
+            elif stop is not None and stop.is_set():
+                job.release()
+            else:
+                logging.error('Could not extract payload: ' + job.name)
+                job.package.failed = True
+                job.release()
+        except Exception:
+            job.release()
+            raise
+        finally:
+            job.stream = None
+            job.package.payload_extracted()
+    yield job
 
-        # check for any subpackages
-        for subpackage in find_packages(temp_dir):
-            logging.warning('UNTESTED: Found subpackage at: ' + subpackage)
-            dump_symbols_from_package(executor, dump_syms, subpackage, dest)
+def discard_payload_job(job):
+    '''
+    Pipeline discard hook for the extract and dump stages: clean up after a
+    PayloadJob that is dropped because the pipeline stopped.
+
+    @param job: a PayloadJob
+    '''
+    if job.stream is not None:
+        job.stream = None
+        job.package.payload_extracted()
+    job.release()
 
-        # dump symbols from any payloads (only expecting one) in the package
-        for payload in find_payloads(temp_dir):
-            dump_symbols_from_payload(executor, dump_syms, payload, dest)
+def find_dump_tasks(path, archs=None, symbol_index=None, checkpointed=None, store=None):
+    '''
+    Returns a DumpTask for each architecture of each binary extracted to
+    path.
 
+    @param path: the directory a payload's binaries were extracted to
+    @param archs: an optional list of the architectures to dump; other
+        slices of fat binaries are skipped
+    @param symbol_index: an optional SymbolIndex; slices already in it
+        are skipped
+    @param checkpointed: an optional dict of the architectures already
+        dumped for each binary, keyed by its path within path; they are
+        skipped
+    @param store: an optional package_store.PackageStore; slices without
+        a UUID are identified by a digest of their contents instead, and
+        skipped if it is recorded there
+    '''
+    checkpointed = checkpointed or {}
+    tasks = []
+
+    for directory in SYMBOL_DIRECTORIES:
+        for root, _dirs, files in os.walk(os.path.join(path, directory)):
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                name = os.path.relpath(full_path, path)
+                done_archs = checkpointed.get(name, ())
+                try:
+                    slices = macho.read_slices_from_path(full_path)
+                except (macho.MachOError, IOError) as e:
+                    # Let dump_syms have a go at it anyway.
+                    logging.warning('Could not read Mach-O headers from {}: {}'.format(full_path, e))
+                    if None in done_archs:
+                        continue
+                    digest = content_digest(full_path)
+                    if store is None or not store.has_binary(digest, filename, None):
+                        tasks.append(DumpTask(full_path, name, None, os.path.getsize(full_path),
+                                              digest))
+                    continue
+                for s in select_slices(slices, archs):
+                    if s.arch in done_archs:
+                        continue
+                    digest = None
+                    if s.debug_id is None:
+                        digest = content_digest(full_path, s.offset, s.size)
+                        if store is not None and store.has_binary(digest, filename, s.arch):
+                            continue
+                    elif symbol_index is not None and (filename, s.debug_id) in symbol_index:
+                        continue
+                    tasks.append(DumpTask(full_path, name, s.arch, s.size, digest))
+    return tasks
+
+def dump_payload_job(scheduler, job, archs=None, symbol_index=None, store=None):
+    '''
+    Pipeline stage: dump the symbols for the binaries extracted from a
+    payload. Yields a (job, result) tuple with a DumpResult for each binary
+    architecture, followed by (job, None) once the payload is finished.
+
+    @param scheduler: the DumpScheduler to run dump_syms with
+    @param job: a PayloadJob
+    @param archs: an optional list of the architectures to dump
+    @param symbol_index: an optional SymbolIndex of slices to skip
+    @param store: an optional package_store.PackageStore of the digests
+        of slices without a UUID to skip
+    '''
+    try:
+        if job.temp_dir is not None:
+            tasks = find_dump_tasks(job.temp_dir, archs, symbol_index, job.checkpointed, store)
+            logging.info('Dumping symbols from {} binaries in payload: {}'.format(len(tasks), job.name))
+            for result in scheduler.dump(tasks):
+                yield job, result
     finally:
-        if temp_dir is not None:
-            shutil.rmtree(temp_dir, onerror=shutil_error_handler)
+        job.release()
+    yield job, None
+
 
+class Checkpoints(object):
+    '''
+    Collects checkpoints for the binaries whose symbol files have been
+    added to sink, and commits them to store only once the sink has been
+    flushed, so that a checkpoint never covers a symbol file that could
+    still be lost. The pairs added to symbol_index and the digests of
+    dumped binaries without a UUID are written out at the same time, for
+    the same reason. They are saved at least every interval seconds.
+    '''
+    def __init__(self, store, sink, symbol_index, interval=CHECKPOINT_INTERVAL):
+        self.store = store
+        self.sink = sink
+        self.symbol_index = symbol_index
+        self.interval = interval
+        self._pending = []
+        self._binaries = []
+        self._saved = time.time()
 
-def read_processed_packages(tracking_file):
-    if tracking_file is None or not os.path.exists(tracking_file):
-        return set()
-    logging.info('Reading processed packages from {}'.format(tracking_file))
-    return set(open(tracking_file, 'rb').read().splitlines())
+    def add(self, job, task, symbol_file):
+        self._pending.append((job.package.pkg, job.name, task.name, task.arch, symbol_file))
+        if task.digest is not None:
+            self._binaries.append((task.digest, os.path.basename(task.name), task.arch,
+                                   job.package.pkg))
+        if time.time() - self._saved >= self.interval:
+            self.save()
 
+    def save(self):
+        self._saved = time.time()
+        if not self._pending:
+            return
+        self.sink.flush()
+        self.symbol_index.flush()
+        self.store.checkpoint(self._pending)
+        self.store.record_binaries(self._binaries)
+        self._pending = []
+        self._binaries = []
 
-def write_processed_packages(tracking_file, processed_packages):
-    if tracking_file is None:
-        return
-    logging.info('Writing {} processed packages to {}'.format(len(processed_packages), tracking_file))
-    open(tracking_file, 'wb').write('\n'.join(processed_packages))
 
+def process_packages(package_finder, sink, tracking_file, dump_syms,
+                     pbzx_threads=None, pbzx_window=None,
+                     extract_jobs=2, dump_jobs=2, queue_size=2,
+                     symbol_index_file=None, state_db=None,
+                     dump_processes=None, dump_memory=None,
+                     dump_timeout=dump_scheduler.DEFAULT_TIMEOUT,
+                     archs=DEFAULT_ARCHS, manifest_file=None, time_budget=None,
+                     metrics_file=None, profile_package=None, profile_file=None,
+                     staging_dir=None, staging_budget=None, memory_staging=None):
+    '''
+    Dump symbols from every package yielded by package_finder() that hasn't
+    been processed yet. Packages flow through a pipeline of stages, so that
+    one package can be decompressed while another is being dumped:
+
+        expand -> extract -> dump_syms -> write
+
+    extract_jobs and dump_jobs set how many payloads are extracted and dumped
+    at once, and queue_size how many may wait in front of each stage.
+    Symbols are added to sink (see symbol_sink) and the tracking file
+    updated on the calling thread.
+
+    Processed packages are recorded in the SQLite database state_db as they
+    finish, or in memory if it is None. Packages listed in tracking_file are
+    treated as processed, and the full list is written back to it at the end.
 
-def process_packages(package_finder, to, tracking_file, dump_syms):
-    processed_packages = read_processed_packages(tracking_file)
-    with concurrent.futures.ProcessPoolExecutor() as executor:
+    If symbol_index_file is given, it records every (debug_file, debug_id)
+    dumped so far, and binaries that are already in it aren't dumped again.
+    Symbol files for pairs that are already in it aren't added to sink, and
+    the pairs that are added are written to manifest_file, if given.
+
+    Up to dump_processes dump_syms processes run at once, largest binary
+    first, with their estimated memory use kept under dump_memory bytes.
+    One that runs for longer than dump_timeout seconds is killed; binaries
+    that can't be dumped are recorded in the state database.
+
+    Only slices of fat binaries whose architecture is in archs are dumped,
+    or all of them if archs is None.
+
+    If time_budget is given, packages are processed most expected new
+    symbols per second first (see planner), and only started if they are
+    expected to finish within time_budget seconds, with at least dump_timeout
+    seconds to spare. Once the time is up, extraction is abandoned and
+    running dump_syms processes are killed, and the run stops after
+    recording what has finished; unfinished packages are left for the next
+    run.
+
+    Timings for each stage are appended to metrics_file, if given (see
+    metrics). If profile_package is given, the stages are run under cProfile
+    for packages whose path contains it, and the profile is written to
+    profile_file.
+
+    Within a package, every binary architecture whose symbol file has been
+    added to sink (and flushed) is checkpointed in state_db. A run that
+    picks up a package an earlier run didn't finish skips the binaries
+    checkpointed for it, so sink must still hold what the earlier run wrote
+    (see symbol_sink.ZipSink's append).
+
+    Packages whose contents are identical to one already processed are
+    recorded as duplicates without being dumped, and payloads and binaries
+    without a UUID that were already processed as part of other packages
+    are skipped (see package_store).
+
+    Payloads are extracted under staging_dir (the system temporary directory
+    if None), waiting for others to be cleaned up rather than going over
+    staging_budget bytes (by default, most of the free space there). Small
+    payloads are extracted to /dev/shm instead, while they fit in
+    memory_staging bytes (by default, an eighth of physical memory; 0 turns
+    this off).
+    '''
+    processed_packages = package_store.PackageStore(state_db)
+    processed_packages.import_list(tracking_file)
+    symbol_index = SymbolIndex(symbol_index_file)
+    # Symbol files kept from an interrupted run belong in this run's manifest.
+    symbol_index.adopt([key for key in map(parse_symbol_filename, sink.recovered)
+                        if key is not None])
+    pbzx_threads = pbzx_threads or multiprocessing.cpu_count()
+    pbzx_window = pbzx_window or 2 * pbzx_threads
+    if memory_staging is None:
+        memory = dump_scheduler.physical_memory()
+        memory_staging = memory // 8 if memory else 0
+    staging_area = staging.StagingArea(staging_dir, staging_budget,
+                                       staging.default_memory_dir(), memory_staging)
+    run_metrics = metrics.Metrics(metrics_file)
+    checkpoints = Checkpoints(processed_packages, sink, symbol_index)
+    profiler = metrics.PackageProfiler(profile_package) if profile_package else None
+    planner = None
+    stop = threading.Event()
+    if time_budget is not None:
+        planner = Planner(processed_packages.history(), time.time() + time_budget,
+                          margin=dump_timeout or 0)
+
+    def new_packages():
         for pkg in package_finder():
             if pkg in processed_packages:
                 logging.info('Skipping already-processed package: {}'.format(pkg))
             else:
-                dump_symbols_from_package(executor, dump_syms, pkg, to)
-                processed_packages.add(pkg)
-                write_processed_packages(tracking_file, processed_packages)
+                yield pkg
+
+    def unprocessed_packages():
+        if planner is None:
+            return new_packages()
+        # Planning needs every package up front; without a budget they are
+        # streamed as the finder produces them.
+        return planner.plan(list(new_packages()))
+
+    deadline = None
+    try:
+        scheduler = DumpScheduler(dump_syms, dump_processes, dump_memory, dump_timeout)
+
+        def out_of_time():
+            logging.warning('Out of time, stopping with packages unfinished')
+            stop.set()
+            scheduler.cancel()
+
+        if planner is not None:
+            deadline = threading.Timer(max(planner.remaining(), 0), out_of_time)
+            deadline.daemon = True
+            deadline.start()
+        with closing(scheduler), \
+             concurrent.futures.ThreadPoolExecutor(max_workers=pbzx_threads) as pbzx_executor:
+            pbzx_decoder = ParallelDecoder(pbzx_executor, pbzx_window)
+            stages = [
+                Stage('expand', lambda pkg: expand_package(pkg, run_metrics, processed_packages),
+                      1, queue_size),
+                Stage('extract', lambda job: extract_payload_job(job, pbzx_decoder, symbol_index,
+                                                                 archs, run_metrics, staging_area,
+                                                                 stop),
+                      extract_jobs, queue_size, discard_payload_job),
+                Stage('dump', lambda job: dump_payload_job(scheduler, job, archs, symbol_index,
+                                                           processed_packages),
+                      dump_jobs, queue_size, discard_payload_job),
+            ]
+            if profiler is not None:
+                stages[0].function = profiler.wrap(stages[0].function, lambda pkg: pkg)
+                for stage in stages[1:]:
+                    stage.function = profiler.wrap(stage.function, lambda job: job.package.pkg)
+            for job, result in run_pipeline(unprocessed_packages(), stages, stop):
+                if result is not None:
+                    run_metrics.record('dump_syms', job.package.pkg, result.seconds,
+                                       result.task.size, len(result.contents or b''),
+                                       binary=result.task.name, arch=result.task.arch,
+                                       error=result.error)
+                if result is not None and result.error is not None:
+                    logging.error('Could not dump {} ({}): {}'.format(
+                        result.task.name, result.task.arch, result.error))
+                    processed_packages.record_failure(job.package.pkg, result.task.name,
+                                                      result.task.arch, result.error)
+                elif result is not None:
+                    key = parse_symbol_filename(result.filename)
+                    if key is not None and key in symbol_index:
+                        logging.info('Already have symbol file ' + result.filename)
+                    else:
+                        logging.info('Added symbol file ' + result.filename)
+                        with run_metrics.timer('write', job.package.pkg) as timer:
+                            timer.bytes_in = len(result.contents)
+                            sink.add(result.filename, result.contents)
+                        job.package.symbols += 1
+                        if key is not None:
+                            symbol_index.add(*key)
+                    checkpoints.add(job, result.task, result.filename)
+                else:
+                    # Everything from the payload is on disk before its
+                    # package can be recorded as finished.
+                    checkpoints.save()
+                    if job.extracted and job.digest is not None:
+                        processed_packages.record_payload(job.digest, job.package.pkg, job.name)
+                    if not job.package.payload_finished():
+                        continue
+                    package = job.package
+                    if package.failed:
+                        status = package_store.STATUS_ERROR
+                    elif package.duplicate_of is not None:
+                        status = package_store.STATUS_DUPLICATE
+                    else:
+                        status = package_store.STATUS_DONE
+                    processed_packages.record(
+                        package.pkg, status=status,
+                        size=package.size, digest=package.digest,
+                        started=package.started, symbols=package.symbols)
+                    run_metrics.record('package', package.pkg, time.time() - package.started,
+                                       package.size or 0, 0, package.symbols,
+                                       failed=package.failed)
+                    if planner is not None:
+                        planner.finished(package.pkg)
+            checkpoints.save()
+        if planner is not None and planner.skipped:
+            logging.info('Left {} packages for a later run'.format(len(planner.skipped)))
+    finally:
+        if deadline is not None:
+            deadline.cancel()
+            deadline.join()
+        if manifest_file is not None:
+            symbol_index.write_manifest(manifest_file, new_only=True)
+        symbol_index.close()
+        processed_packages.export_list(tracking_file)
+        processed_packages.close()
+        run_metrics.close()
+        if profiler is not None and profile_file is not None:
+            profiler.dump(profile_file)
 
 
 def main():
@@ -246,9 +1020,81 @@ def main():
     parser.add_argument('--tracking-file', type=str,
                         help='Path to a file in which to store information ' +
                         'about already-processed packages')
+    parser.add_argument('--state-db', type=str,
+                        help='Path to a SQLite database in which to record ' +
+                        'processed packages as they finish')
+    parser.add_argument('--symbol-index', type=str,
+                        help='Path to a file recording the symbols dumped ' +
+                        'so far; binaries listed in it are not dumped again')
+    parser.add_argument('--manifest', type=str,
+                        help='Path to a file in which to list the symbols ' +
+                        'dumped by this run, in the symbol index format')
+    parser.add_argument('--pbzx-threads', type=int,
+                        help='Number of threads to decompress pbzx chunks ' +
+                        'with (default: number of CPUs)')
+    parser.add_argument('--pbzx-window', type=int,
+                        help='Maximum number of pbzx chunks in flight at ' +
+                        'once (default: twice the number of threads)')
+    parser.add_argument('--extract-jobs', type=int, default=2,
+                        help='Number of payloads to extract at once')
+    parser.add_argument('--dump-jobs', type=int, default=2,
+                        help='Number of payloads to dump symbols from at once')
+    parser.add_argument('--dump-processes', type=int,
+                        help='Number of dump_syms processes to run at once ' +
+                        '(default: number of CPUs)')
+    parser.add_argument('--dump-memory', type=int, metavar='MB',
+                        help='Estimated memory the dump_syms processes ' +
+                        'may use between them (default: 3/4 of RAM)')
+    parser.add_argument('--dump-timeout', type=int, metavar='SECONDS',
+                        default=dump_scheduler.DEFAULT_TIMEOUT,
+                        help='Kill dump_syms if it runs for longer than this')
+    parser.add_argument('--archs', type=str, default=','.join(DEFAULT_ARCHS),
+                        help='Comma-separated list of the architectures to ' +
+                        'dump symbols for, or "all" (default: %(default)s)')
+    parser.add_argument('--time-budget', type=int, metavar='SECONDS',
+                        help='Process the packages expected to yield the ' +
+                        'most new symbols first, and stop before this much ' +
+                        'time has passed')
+    parser.add_argument('--staging-dir', type=str, metavar='DIR',
+                        help='Directory to extract payloads under ' +
+                        '(default: the system temporary directory)')
+    parser.add_argument('--staging-budget', type=int, metavar='MB',
+                        help='Disk space extracted payloads may use between ' +
+                        'them; extraction waits for space rather than going ' +
+                        'over (default: 90%% of the free space)')
+    parser.add_argument('--memory-staging', type=int, metavar='MB',
+                        help='Space in /dev/shm that small payloads may be ' +
+                        'extracted to (default: 1/8 of RAM; 0 to disable)')
+    parser.add_argument('--metrics', type=str, metavar='FILE',
+                        help='Append timings for each pipeline stage to FILE ' +
+                        'as JSON lines')
+    parser.add_argument('--profile-package', type=str, metavar='PATTERN',
+                        help='Run the stages for packages whose path ' +
+                        'contains PATTERN under cProfile')
+    parser.add_argument('--profile', type=str, metavar='FILE', default='package.prof',
+                        help='Where to write the --profile-package profile ' +
+                        '(default: %(default)s)')
+    parser.add_argument('--queue-size', type=int, default=2,
+                        help='Number of items allowed to wait between ' +
+                        'pipeline stages')
+    parser.add_argument('--reposado', type=str, metavar='DIR',
+                        help='Find packages from the product info of the ' +
+                        'reposado installation whose preferences.plist is ' +
+                        'in DIR, instead of searching for them')
+    parser.add_argument('--product-id', dest='product_ids', action='append',
+                        metavar='ID',
+                        help='With --reposado, only process packages of ' +
+                        'product ID (may be given more than once)')
     parser.add_argument('search', nargs='+',
-                        help='Paths to search recursively for packages')
-    parser.add_argument('to', type=str, help='destination path for the symbols')
+                        help='Paths to search recursively for packages ' +
+                        '(with --reposado, only if there is no product info)')
+    parser.add_argument('--zip-level', type=int, default=symbol_sink.DEFAULT_LEVEL,
+                        help='zlib compression level for a .zip destination')
+    parser.add_argument('--zip-threads', type=int, default=1,
+                        help='Number of threads to compress symbol files ' +
+                        'for a .zip destination with')
+    parser.add_argument('to', type=str, help='destination path for the symbols; ' +
+                        'a directory, or a .zip file to write them into')
     args = parser.parse_args()
 
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -259,12 +1105,32 @@ def main():
     if not args.search or not all(os.path.exists(p) for p in args.search):
         logging.error('Invalid search path')
         return
-    if not os.path.exists(args.to):
+    if not os.path.exists(args.to if os.path.splitext(args.to)[1] != '.zip'
+                          else os.path.dirname(os.path.abspath(args.to))):
         logging.error('Invalid path to destination')
         return
     def finder():
+        if args.reposado:
+            return find_reposado_packages(args.reposado, args.product_ids,
+                                          args.search)
         return find_all_packages(args.search)
-    process_packages(finder, args.to, args.tracking_file, args.dump_syms)
+    # Checkpoints in the state database refer to symbol files already in the
+    # destination, so an existing archive is added to rather than replaced.
+    with closing(symbol_sink.open_sink(args.to, args.zip_level, args.zip_threads,
+                                       append=args.state_db is not None)) as sink:
+        process_packages(finder, sink, args.tracking_file, args.dump_syms,
+                         args.pbzx_threads, args.pbzx_window,
+                         args.extract_jobs, args.dump_jobs, args.queue_size,
+                         args.symbol_index, args.state_db,
+                         args.dump_processes,
+                         args.dump_memory * 1024 * 1024 if args.dump_memory else None,
+                         args.dump_timeout,
+                         parse_archs(args.archs),
+                         args.manifest, args.time_budget,
+                         args.metrics, args.profile_package, args.profile,
+                         args.staging_dir,
+                         args.staging_budget * 1024 * 1024 if args.staging_budget else None,
+                         args.memory_staging * 1024 * 1024 if args.memory_staging is not None else None)
 
 
 if __name__ == '__main__':
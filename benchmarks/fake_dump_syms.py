@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+fake_dump_syms.py
+
+Stands in for Breakpad's dump_syms when benchmarking. It takes the same
+arguments (dump_syms [-a ARCH] BINARY), reads the whole slice the way
+dump_syms does, and prints a MODULE line with the slice's real debug id
+followed by FUNC lines amounting to about SYMBOLS_PER_BYTE of the slice's
+size, so the rest of the pipeline sees realistic output. The cost of
+dump_syms itself isn't modelled; set FAKE_DUMP_SYMS_SECONDS_PER_MB to add a
+delay proportional to the slice size.
+'''
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import macho
+
+SYMBOLS_PER_BYTE = 0.1
+READ_SIZE = 1024 * 1024
+
+
+def main():
+    args = sys.argv[1:]
+    arch = None
+    if len(args) == 3 and args[0] == '-a':
+        arch, path = args[1], args[2]
+    elif len(args) == 1:
+        path = args[0]
+    else:
+        print('usage: fake_dump_syms.py [-a ARCH] BINARY', file=sys.stderr)
+        return 1
+    try:
+        slices = macho.read_slices_from_path(path)
+    except (macho.MachOError, IOError) as e:
+        print('{}: {}'.format(path, e), file=sys.stderr)
+        return 1
+    matching = [s for s in slices if arch is None or s.arch == arch]
+    if not matching or matching[0].debug_id is None:
+        print('{}: no {} slice with a UUID'.format(path, arch), file=sys.stderr)
+        return 1
+    s = matching[0]
+    with open(path, 'rb') as f:
+        f.seek(s.offset)
+        remaining = s.size
+        while remaining > 0:
+            data = f.read(min(READ_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+    delay = float(os.environ.get('FAKE_DUMP_SYMS_SECONDS_PER_MB', 0))
+    if delay:
+        time.sleep(delay * s.size / (1024 * 1024))
+    name = os.path.basename(path)
+    out = sys.stdout
+    if hasattr(out, 'buffer'):
+        out = out.buffer
+    out.write('MODULE mac {} {} {}\n'.format(s.arch, s.debug_id, name).encode('utf-8'))
+    line_count = int(s.size * SYMBOLS_PER_BYTE) // 40
+    for i in range(line_count):
+        out.write('FUNC {:x} 10 0 bench_function_{}\n'.format(i * 16, i).encode('utf-8'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
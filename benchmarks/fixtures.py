@@ -0,0 +1,462 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+fixtures.py
+
+Builds synthetic installer packages to benchmark against, shaped like Apple
+system updates: a xar archive holding a Bom, a PackageInfo and a Payload,
+where the payload is an odc cpio archive compressed with gzip, bzip2 or
+pbzx (xz chunks, with some chunks stored raw the way Apple stores chunks
+that don't compress). The cpio archive holds thin and fat Mach-O binaries
+with LC_UUID load commands under the directories symbols are dumped from,
+mixed with resource files that are skipped.
+
+The contents are generated from a seed, so the same options produce the
+same bytes on every machine and with every version of this repository, and
+results from different commits can be compared. Fixtures are written to
+disk as they are built, so sizes up to several GB don't need that much
+memory.
+
+usage: fixtures.py OUTPUT_DIR [--size 64M] [--compression gzip,bzip2,pbzx]
+'''
+from __future__ import print_function
+
+import argparse
+import bz2
+import hashlib
+import json
+import logging
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import macho
+from parse_pbzx import lzma
+
+COMPRESSIONS = ('gzip', 'bzip2', 'pbzx', 'none')
+# Apple's pbzx payloads use 16MB chunks; smaller payloads get smaller
+# chunks so that they still have several.
+PBZX_CHUNK_SIZE = 16 * 1024 * 1024
+MIN_PBZX_CHUNKS = 8
+# Store every nth pbzx chunk raw, so both kinds of chunk are exercised.
+PBZX_RAW_EVERY = 4
+XZ_PRESET = 1
+MIN_BINARY_SIZE = 16 * 1024
+MAX_BINARY_SIZE = 64 * 1024 * 1024
+# The fraction of payload bytes that are Mach-O binaries.
+BINARY_FRACTION = 0.6
+# The fraction of binaries that are fat.
+FAT_FRACTION = 0.4
+# No binary holds more than 1/MIN_BINARIES of a payload's binary bytes.
+MIN_BINARIES = 16
+POOL_SIZE = 1024 * 1024
+BLOCK = 4096
+COPY_SIZE = 1024 * 1024
+
+MH_MAGIC_64 = 0xfeedfacf
+MH_DYLIB = 6
+FAT_ALIGN = 4096
+CPU_SUBTYPE_X86_64_ALL = 3
+CPU_SUBTYPE_ARM64E = 2
+CPU_SUBTYPE_I386_ALL = 3
+
+# (name, cputype, cpusubtype) of the slices of fat binaries; i386 is there
+# so that slices outside the default architectures are skipped.
+FAT_SLICES = (
+    [('x86_64', macho.CPU_TYPE_X86_64, CPU_SUBTYPE_X86_64_ALL),
+     ('arm64e', macho.CPU_TYPE_ARM64, CPU_SUBTYPE_ARM64E)],
+    [('x86_64', macho.CPU_TYPE_X86_64, CPU_SUBTYPE_X86_64_ALL),
+     ('i386', macho.CPU_TYPE_X86, CPU_SUBTYPE_I386_ALL)],
+)
+
+
+def parse_size(text):
+    '''
+    Parse a size such as 512K, 64M or 2G into bytes.
+    '''
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = text.strip().upper()
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def format_size(size):
+    for unit, factor in (('G', 1024 ** 3), ('M', 1024 ** 2), ('K', 1024)):
+        if size >= factor and size % factor == 0:
+            return '{}{}'.format(size // factor, unit)
+    return str(size)
+
+
+class Content(object):
+    '''
+    Deterministic file contents. Binaries are a mix of incompressible
+    blocks, zero padding and repetitive symbol names, which compresses
+    about as well as real system libraries.
+    '''
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        pool = []
+        counter = 0
+        while len(pool) * 32 < POOL_SIZE:
+            pool.append(hashlib.sha256('{}:{}'.format(seed, counter).encode('ascii')).digest())
+            counter += 1
+        self.pool = b''.join(pool)
+
+    def choice(self, n):
+        return int(self.rng.random() * n)
+
+    def blocks(self, size):
+        out = []
+        remaining = size
+        while remaining > 0:
+            length = min(BLOCK, remaining)
+            kind = self.rng.random()
+            if kind < 0.45:
+                start = self.choice(POOL_SIZE - length)
+                out.append(self.pool[start:start + length])
+            elif kind < 0.7:
+                out.append(b'\0' * length)
+            else:
+                name = '_OBJC_CLASS_$_Bench{:06d}\0'.format(self.choice(1000000)).encode('ascii')
+                out.append((name * (length // len(name) + 1))[:length])
+            remaining -= length
+        return b''.join(out)
+
+    def text(self, size):
+        line = '<key>BenchKey{:06d}</key><string>value {:06d}</string>\n'.format(
+            self.choice(1000000), self.choice(1000000)).encode('ascii')
+        return (line * (size // len(line) + 1))[:size]
+
+    def size(self, limit):
+        '''
+        Return a binary size between MIN_BINARY_SIZE and limit, spread
+        evenly on a log scale so there are many small binaries and a few
+        huge ones.
+        '''
+        size = int(MIN_BINARY_SIZE * 2 ** (self.rng.random() * 12))
+        return max(MIN_BINARY_SIZE, min(size, limit, MAX_BINARY_SIZE))
+
+
+def thin_macho(cputype, cpusubtype, uuid, body):
+    '''
+    Return a 64-bit Mach-O dylib with an LC_UUID load command, followed by
+    body.
+    '''
+    cmds = struct.pack('<II16s', macho.LC_UUID, 24, uuid)
+    header = struct.pack('<8I', MH_MAGIC_64, cputype, cpusubtype, MH_DYLIB, 1, len(cmds), 0, 0)
+    return header + cmds + body
+
+
+def fat_macho(slices):
+    '''
+    Return a fat Mach-O binary holding the thin binaries in slices, a list
+    of (cputype, cpusubtype, data).
+    '''
+    header = struct.pack('>II', macho.FAT_MAGIC, len(slices))
+    offset = FAT_ALIGN
+    body = []
+    for cputype, cpusubtype, data in slices:
+        header += struct.pack('>5I', cputype, cpusubtype, offset, len(data), 12)
+        padding = -len(data) % FAT_ALIGN
+        body.append(data + b'\0' * padding)
+        offset += len(data) + padding
+    return header + b'\0' * (FAT_ALIGN - len(header)) + b''.join(body)
+
+
+def make_uuid(seed, name, arch):
+    return hashlib.md5('{}:{}:{}'.format(seed, name, arch).encode('utf-8')).digest()
+
+
+def make_binary(content, seed, name, size):
+    '''
+    Return the data of a thin or fat binary of about size bytes.
+    '''
+    if content.rng.random() >= FAT_FRACTION:
+        return thin_macho(macho.CPU_TYPE_X86_64, CPU_SUBTYPE_X86_64_ALL,
+                          make_uuid(seed, name, 'x86_64'), content.blocks(size))
+    archs = FAT_SLICES[content.choice(len(FAT_SLICES))]
+    return fat_macho([(cputype, cpusubtype,
+                       thin_macho(cputype, cpusubtype, make_uuid(seed, name, arch),
+                                  content.blocks(size // len(archs))))
+                      for arch, cputype, cpusubtype in archs])
+
+
+class CpioWriter(object):
+    '''
+    Writes an odc cpio archive to the file object f.
+    '''
+    def __init__(self, f):
+        self.f = f
+        self.ino = 0
+        self.size = 0
+
+    def add(self, name, mode, data=b''):
+        self.ino += 1
+        encoded = name.encode('utf-8') + b'\0'
+        header = '070707{:06o}{:06o}{:06o}{:06o}{:06o}{:06o}{:06o}{:011o}{:06o}{:011o}'.format(
+            0, self.ino, mode, 0, 0, 1, 0, 0, len(encoded), len(data)).encode('ascii')
+        self.f.write(header)
+        self.f.write(encoded)
+        self.f.write(data)
+        self.size += len(data)
+
+    def close(self):
+        self.add('TRAILER!!!', 0)
+
+
+def write_cpio(f, seed, size):
+    '''
+    Write a payload cpio archive with about size bytes of file data to f.
+    Returns the number of binaries in it.
+    '''
+    content = Content(seed)
+    writer = CpioWriter(f)
+    directories = set()
+
+    def add_directories(name):
+        parent = os.path.dirname(name)
+        if parent and parent not in directories:
+            add_directories(parent)
+            directories.add(parent)
+            writer.add(parent, 0o040755)
+
+    binary_bytes = int(size * BINARY_FRACTION)
+    largest = binary_bytes // MIN_BINARIES
+    binaries = 0
+    while writer.size < binary_bytes:
+        kind = content.choice(3)
+        binary_size = content.size(min(largest, binary_bytes - writer.size))
+        if kind == 0:
+            framework = 'Bench{:04d}'.format(binaries)
+            name = './System/Library/Frameworks/{0}.framework/Versions/A/{0}'.format(framework)
+        elif kind == 1:
+            framework = 'PrivateBench{:04d}'.format(binaries)
+            name = './System/Library/PrivateFrameworks/{0}.framework/Versions/A/{0}'.format(framework)
+        else:
+            name = './usr/lib/libbench{:04d}.dylib'.format(binaries)
+        add_directories(name)
+        writer.add(name, 0o100755, make_binary(content, seed, name, binary_size))
+        binaries += 1
+        # Resources that sit next to the binaries but aren't dumped.
+        if kind != 2:
+            resource = os.path.join(os.path.dirname(name), 'Resources', 'Info.plist')
+            add_directories(resource)
+            writer.add(resource, 0o100644, content.text(4096))
+    resources = 0
+    while writer.size < size:
+        name = './System/Library/CoreServices/BenchResources/resource{:05d}.plist'.format(resources)
+        add_directories(name)
+        writer.add(name, 0o100644, content.text(min(content.size(size - writer.size), 1024 * 1024)))
+        resources += 1
+    writer.close()
+    return binaries
+
+
+def read_chunks(f, size=COPY_SIZE):
+    while True:
+        data = f.read(size)
+        if not data:
+            return
+        yield data
+
+
+def compress_payload(source, dest, compression, chunk_size=PBZX_CHUNK_SIZE,
+                     raw_every=PBZX_RAW_EVERY):
+    '''
+    Compress the cpio archive read from source into dest.
+    '''
+    if compression == 'none':
+        shutil.copyfileobj(source, dest, COPY_SIZE)
+    elif compression == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for data in read_chunks(source):
+            dest.write(compressor.compress(data))
+        dest.write(compressor.flush())
+    elif compression == 'bzip2':
+        compressor = bz2.BZ2Compressor(9)
+        for data in read_chunks(source):
+            dest.write(compressor.compress(data))
+        dest.write(compressor.flush())
+    elif compression == 'pbzx':
+        dest.write(b'pbzx' + struct.pack('>Q', chunk_size | (1 << 24)))
+        chunk = source.read(chunk_size)
+        n = 0
+        while chunk:
+            following = source.read(chunk_size)
+            flags = len(chunk) | ((1 << 24) if following else 0)
+            body = chunk
+            if (n + 1) % raw_every:
+                compressed = lzma.compress(chunk, format=lzma.FORMAT_XZ, preset=XZ_PRESET)
+                if len(compressed) < len(chunk):
+                    body = compressed
+            dest.write(struct.pack('>QQ', flags, len(body)))
+            dest.write(body)
+            chunk = following
+            n += 1
+    else:
+        raise ValueError('Unknown compression {}'.format(compression))
+
+
+def write_xar(path, members):
+    '''
+    Write a xar archive to path. members is a list of (name, source path,
+    gzip) tuples; members with gzip set are stored zlib-compressed, the
+    others as they are.
+    '''
+    temp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        stored = []
+        offset = 20
+        for name, source, gzip in members:
+            if gzip:
+                with open(source, 'rb') as f:
+                    data = f.read()
+                store_path = os.path.join(temp_dir, name)
+                with open(store_path, 'wb') as f:
+                    f.write(zlib.compress(data))
+                size = len(data)
+            else:
+                store_path = source
+                size = os.path.getsize(source)
+            digest = hashlib.sha1()
+            with open(store_path, 'rb') as f:
+                for data in read_chunks(f):
+                    digest.update(data)
+            length = os.path.getsize(store_path)
+            stored.append((name, store_path, offset, length, size, gzip, digest.hexdigest()))
+            offset += length
+        files = []
+        for i, (name, _path, offset, length, size, gzip, digest) in enumerate(stored):
+            encoding = 'application/x-gzip' if gzip else 'application/octet-stream'
+            files.append('<file id="{}"><data><length>{}</length><offset>{}</offset>'
+                         '<size>{}</size><encoding style="{}"/>'
+                         '<archived-checksum style="sha1">{}</archived-checksum>'
+                         '</data><name>{}</name><type>file</type></file>'.format(
+                             i + 1, length, offset, size, encoding, digest, name))
+        toc = ('<?xml version="1.0" encoding="UTF-8"?><xar><toc>'
+               '<checksum style="sha1"><offset>0</offset><size>20</size></checksum>'
+               '{}</toc></xar>'.format(''.join(files))).encode('utf-8')
+        compressed_toc = zlib.compress(toc)
+        with open(path, 'wb') as out:
+            out.write(struct.pack('>4sHHQQI', b'xar!', 28, 1, len(compressed_toc), len(toc), 1))
+            out.write(compressed_toc)
+            out.write(hashlib.sha1(compressed_toc).digest())
+            for _name, store_path, _offset, _length, _size, _gzip, _digest in stored:
+                with open(store_path, 'rb') as f:
+                    shutil.copyfileobj(f, out, COPY_SIZE)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def pbzx_chunk_size(size):
+    chunk_size = 1024 * 1024
+    while chunk_size < PBZX_CHUNK_SIZE and chunk_size * MIN_PBZX_CHUNKS * 2 <= size:
+        chunk_size *= 2
+    return chunk_size
+
+
+def make_package(path, size, compression, seed=1):
+    '''
+    Write a synthetic installer package to path whose payload holds about
+    size bytes of files. Returns a dict describing it.
+    '''
+    chunk_size = pbzx_chunk_size(size)
+    temp_dir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        cpio_path = os.path.join(temp_dir, 'cpio')
+        with open(cpio_path, 'wb') as f:
+            binaries = write_cpio(f, seed, size)
+        payload_path = os.path.join(temp_dir, 'Payload')
+        with open(cpio_path, 'rb') as source, open(payload_path, 'wb') as dest:
+            compress_payload(source, dest, compression, chunk_size)
+        bom_path = os.path.join(temp_dir, 'Bom')
+        with open(bom_path, 'wb') as f:
+            f.write(Content(seed).text(64 * 1024))
+        info_path = os.path.join(temp_dir, 'PackageInfo')
+        with open(info_path, 'wb') as f:
+            f.write('<pkg-info identifier="com.example.bench.{}" version="1.0"/>'.format(
+                seed).encode('utf-8'))
+        write_xar(path, [('Bom', bom_path, True), ('PackageInfo', info_path, True),
+                         ('Payload', payload_path, False)])
+        return {
+            'name': os.path.basename(path),
+            'compression': compression,
+            'size': size,
+            'seed': seed,
+            'pbzx_chunk_size': chunk_size if compression == 'pbzx' else None,
+            'binaries': binaries,
+            'cpio_bytes': os.path.getsize(cpio_path),
+            'payload_bytes': os.path.getsize(payload_path),
+            'package_bytes': os.path.getsize(path),
+        }
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for data in read_chunks(f):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def make_fixtures(output_dir, sizes, compressions, seed=1):
+    '''
+    Write a package for each size and compression to output_dir, skipping
+    any that already exist, along with a fixtures.json describing them.
+    Returns the description.
+    '''
+    manifest_path = os.path.join(output_dir, 'fixtures.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'rb') as f:
+            manifest = dict((p['name'], p) for p in json.loads(f.read().decode('utf-8')))
+    for size in sizes:
+        for compression in compressions:
+            name = 'bench-{}-{}-{}.pkg'.format(compression, format_size(size), seed)
+            path = os.path.join(output_dir, name)
+            if name in manifest and os.path.exists(path):
+                continue
+            logging.info('Building {}'.format(name))
+            package = make_package(path, size, compression, seed)
+            package['sha1'] = file_digest(path)
+            manifest[name] = package
+    packages = sorted(manifest.values(), key=lambda p: (p['size'], p['compression']))
+    with open(manifest_path, 'wb') as f:
+        f.write(json.dumps(packages, indent=2, sort_keys=True).encode('utf-8'))
+    return packages
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Build synthetic installer packages to benchmark with.')
+    parser.add_argument('output', help='Directory to write packages to')
+    parser.add_argument('--size', action='append', dest='sizes', metavar='SIZE',
+                        help='Bytes of files in each payload, e.g. 64M or 2G ' +
+                        '(may be given more than once; default: 64M)')
+    parser.add_argument('--compression', default=','.join(COMPRESSIONS[:3]),
+                        help='Comma-separated payload compressions, from ' +
+                        '{} (default: %(default)s)'.format(', '.join(COMPRESSIONS)))
+    parser.add_argument('--seed', type=int, default=1,
+                        help='Seed for the generated contents')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    sizes = [parse_size(s) for s in (args.sizes or ['64M'])]
+    for package in make_fixtures(args.output, sizes, args.compression.split(','), args.seed):
+        print('{name}: {binaries} binaries, {cpio_bytes} bytes of cpio, '
+              '{package_bytes} bytes packaged'.format(**package))
+
+
+if __name__ == '__main__':
+    main()
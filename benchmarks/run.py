@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+run.py
+
+Benchmarks the stages of symbol dumping against the synthetic packages
+from fixtures.py, with fake_dump_syms.py standing in for dump_syms:
+
+    expand    reading a package's xar table of contents
+    decode    decompressing its payloads
+    extract   decompressing and extracting the binaries to disk
+    pipeline  process_packages() from start to finish, writing a zip
+
+Each stage runs in a fresh process, so its peak RSS is its own; the peak
+disk use of its temporary files is sampled while it runs. Every
+measurement is repeated and the fastest run kept. Results are written as
+JSON along with the commit they were measured at, and can be compared with
+an earlier results file; a stage whose throughput drops by more than the
+threshold on the same fixture counts as a regression, and makes the
+comparison exit with status 1.
+
+usage: run.py [--fixtures DIR] [--size 64M] [--output results.json]
+              [--compare baseline.json]
+'''
+from __future__ import print_function
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import closing
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import fixtures
+
+STAGES = ('expand', 'decode', 'extract', 'pipeline')
+FAKE_DUMP_SYMS = os.path.join(BENCHMARK_DIR, 'fake_dump_syms.py')
+DISK_POLL_INTERVAL = 0.05
+DEFAULT_THRESHOLD = 0.1
+
+
+def directory_size(path):
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.lstat(os.path.join(root, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class DiskMonitor(object):
+    '''
+    Samples the total size of the files under path on a thread, keeping
+    the largest.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            self.peak = max(self.peak, directory_size(self.path))
+            if self._stop.wait(DISK_POLL_INTERVAL):
+                return
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, directory_size(self.path))
+
+
+def max_rss(who):
+    '''
+    Return the peak RSS in bytes of this process or, with
+    resource.RUSAGE_CHILDREN, of its largest child.
+    '''
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def payload_streams(pkg):
+    import xar
+    from PackageSymbolDumper import find_archive_payloads
+    archive = xar.XarArchive(open(pkg, 'rb'))
+    return list(find_archive_payloads(archive, pkg))
+
+
+def stage_expand(pkg, temp_dir):
+    payloads = payload_streams(pkg)
+    return dict(bytes_in=os.path.getsize(pkg), bytes_out=0, items=len(payloads))
+
+
+def stage_decode(pkg, temp_dir):
+    import concurrent.futures
+    from PackageSymbolDumper import decode_payload
+    from parse_pbzx import ParallelDecoder
+    threads = multiprocessing.cpu_count()
+    bytes_in = bytes_out = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        decoder = ParallelDecoder(executor, 2 * threads)
+        for _name, stream, _digest in payload_streams(pkg):
+            bytes_in += len(stream)
+            for data in decode_payload(stream, decoder):
+                bytes_out += len(data)
+    return dict(bytes_in=bytes_in, bytes_out=bytes_out, items=1)
+
+
+def stage_extract(pkg, temp_dir):
+    import concurrent.futures
+    from PackageSymbolDumper import DEFAULT_ARCHS, extract_payload
+    from parse_pbzx import ParallelDecoder
+    threads = multiprocessing.cpu_count()
+    bytes_in = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        decoder = ParallelDecoder(executor, 2 * threads)
+        for _name, stream, _digest in payload_streams(pkg):
+            bytes_in += len(stream)
+            if not extract_payload(stream, tempfile.mkdtemp(dir=temp_dir), decoder,
+                                   archs=DEFAULT_ARCHS):
+                raise RuntimeError('Could not extract {}'.format(pkg))
+    return dict(bytes_in=bytes_in, bytes_out=directory_size(temp_dir), items=1)
+
+
+def stage_pipeline(pkg, temp_dir):
+    import metrics
+    import symbol_sink
+    from PackageSymbolDumper import process_packages
+    output = os.path.join(temp_dir, 'symbols.zip')
+    metrics_file = os.path.join(temp_dir, 'metrics.jsonl')
+    with closing(symbol_sink.ZipSink(output, threads=multiprocessing.cpu_count())) as sink:
+        # Stage payloads on disk only, where the disk monitor sees them.
+        process_packages(lambda: [pkg], sink, None, FAKE_DUMP_SYMS,
+                         metrics_file=metrics_file, staging_dir=temp_dir,
+                         memory_staging=0)
+        count = sink.count
+    summary = metrics.summarize(metrics_file)
+    bytes_out = os.path.getsize(output) if os.path.exists(output) else 0
+    return dict(bytes_in=os.path.getsize(pkg), bytes_out=bytes_out, items=count,
+                stages=dict((stage, dict(seconds=round(totals['seconds'], 3),
+                                         bytes_in=totals['bytes_in'],
+                                         count=totals['count']))
+                            for stage, totals in summary['stages'].items()))
+
+
+def run_worker(stage, pkg):
+    '''
+    Run one stage on pkg in this process and print its measurements as
+    JSON.
+    '''
+    function = globals()['stage_' + stage]
+    temp_dir = tempfile.mkdtemp(prefix='bench-')
+    # Put everything the stage creates where the disk monitor can see it.
+    tempfile.tempdir = temp_dir
+    try:
+        monitor = DiskMonitor(temp_dir)
+        start = time.time()
+        try:
+            result = function(pkg, temp_dir)
+        finally:
+            seconds = time.time() - start
+            monitor.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    result.update(seconds=seconds, peak_disk=monitor.peak,
+                  peak_rss=max_rss(resource.RUSAGE_SELF),
+                  peak_child_rss=max_rss(resource.RUSAGE_CHILDREN))
+    print(json.dumps(result, sort_keys=True))
+
+
+def measure(stage, pkg, repeat):
+    '''
+    Run stage on pkg repeat times in fresh processes, returning the fastest
+    run's measurements with the largest peaks seen.
+    '''
+    best = None
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+                                          '--worker', stage, pkg])
+        result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+        if best is None:
+            best = result
+            continue
+        peaks = dict((key, max(best[key], result[key]))
+                     for key in ('peak_disk', 'peak_rss', 'peak_child_rss'))
+        if result['seconds'] < best['seconds']:
+            best = result
+        best.update(peaks)
+    best['mb_per_second'] = best['bytes_in'] / best['seconds'] / (1024 * 1024) if best['seconds'] else 0
+    return best
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                       cwd=REPO_DIR).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(packages, fixture_dir, stages, repeat):
+    results = []
+    for package in packages:
+        pkg = os.path.join(fixture_dir, package['name'])
+        for stage in stages:
+            logging.info('Running {} on {}'.format(stage, package['name']))
+            result = measure(stage, pkg, repeat)
+            result.update(package=package['name'], fixture_sha1=package['sha1'], stage=stage)
+            results.append(result)
+            print('{package:28} {stage:9} {seconds:8.2f}s {mb_per_second:8.1f} MB/s '
+                  'rss {rss:6.0f} MB  child rss {child_rss:6.0f} MB  disk {disk:7.0f} MB'.format(
+                      rss=result['peak_rss'] / 1048576.0,
+                      child_rss=result['peak_child_rss'] / 1048576.0,
+                      disk=result['peak_disk'] / 1048576.0, **result))
+    return {
+        'commit': git_commit(),
+        'time': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': multiprocessing.cpu_count(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    '''
+    Print the change in throughput of each stage measured in both results
+    on the same fixture. Returns the number of regressions: stages that got
+    slower by more than threshold.
+    '''
+    old = dict(((r['package'], r['fixture_sha1'], r['stage']), r) for r in baseline['results'])
+    regressions = 0
+    print('Compared with {} ({} CPUs, Python {}):'.format(
+        baseline.get('commit'), baseline.get('cpus'), baseline.get('python')))
+    for result in current['results']:
+        before = old.get((result['package'], result['fixture_sha1'], result['stage']))
+        if before is None or not before['mb_per_second']:
+            continue
+        change = result['mb_per_second'] / before['mb_per_second'] - 1
+        regressed = change < -threshold
+        regressions += regressed
+        print('{:28} {:9} {:8.1f} -> {:8.1f} MB/s {:+6.1%}{}'.format(
+            result['package'], result['stage'], before['mb_per_second'],
+            result['mb_per_second'], change, '  REGRESSION' if regressed else ''))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark symbol dumping against synthetic packages.')
+    parser.add_argument('--fixtures', default=os.path.join(BENCHMARK_DIR, 'fixtures'),
+                        help='Directory holding (or to build) the fixtures ' +
+                        '(default: %(default)s)')
+    parser.add_argument('--size', action='append', dest='sizes', metavar='SIZE',
+                        help='Payload size of the fixtures to run, e.g. 64M ' +
+                        '(may be given more than once; default: 64M)')
+    parser.add_argument('--compression', default=','.join(fixtures.COMPRESSIONS[:3]),
+                        help='Comma-separated payload compressions to run ' +
+                        '(default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='Seed of the fixtures to run')
+    parser.add_argument('--stage', action='append', dest='stages', choices=STAGES,
+                        help='Stage to run (may be given more than once; ' +
+                        'default: all)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of times to run each measurement')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', metavar='RESULTS',
+                        help='Compare with an earlier results file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Throughput drop that counts as a regression ' +
+                        '(default: %(default)s)')
+    parser.add_argument('--worker', nargs=2, metavar=('STAGE', 'PACKAGE'),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        logging.basicConfig(level=logging.WARNING)
+        run_worker(*args.worker)
+        return 0
+    logging.basicConfig(level=logging.INFO)
+
+    if not os.path.isdir(args.fixtures):
+        os.makedirs(args.fixtures)
+    sizes = [fixtures.parse_size(s) for s in (args.sizes or ['64M'])]
+    compressions = args.compression.split(',')
+    packages = [p for p in fixtures.make_fixtures(args.fixtures, sizes, compressions, args.seed)
+                if p['size'] in sizes and p['compression'] in compressions and
+                p['seed'] == args.seed]
+    results = run_benchmarks(packages, args.fixtures, args.stages or STAGES, args.repeat)
+    if args.output:
+        with open(args.output, 'wb') as f:
+            f.write(json.dumps(results, indent=2, sort_keys=True).encode('utf-8'))
+    if args.compare:
+        with open(args.compare, 'rb') as f:
+            baseline = json.loads(f.read().decode('utf-8'))
+        if compare(baseline, results, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
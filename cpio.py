@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+cpio.py
+
+A streaming reader for the cpio archives found inside installer package
+payloads. Supports the portable "odc" format (magic 070707) that pax and ditto
+write, and the SVR4 "newc"/"crc" formats (magic 070701/070702).
+
+Archives are read strictly front to back, so the input only needs a read()
+method; the data of entries that aren't read is skipped without being kept.
+'''
+import posixpath
+import stat
+
+ODC_MAGIC = b'070707'
+NEWC_MAGIC = b'070701'
+CRC_MAGIC = b'070702'
+TRAILER = 'TRAILER!!!'
+BLOCK_SIZE = 1024 * 1024
+
+
+class CpioError(Exception):
+    '''The input is not a well-formed cpio archive.'''
+    pass
+
+
+class CpioEntry(object):
+    '''
+    A member of a cpio archive. Its data can be read with read() until the
+    reader moves on to the next entry.
+    '''
+    def __init__(self, reader, name, mode, size, mtime):
+        self._reader = reader
+        self.name = name
+        self.mode = mode
+        self.size = size
+        self.mtime = mtime
+        self._remaining = size
+
+    def isreg(self):
+        return stat.S_ISREG(self.mode)
+
+    def isdir(self):
+        return stat.S_ISDIR(self.mode)
+
+    def issym(self):
+        return stat.S_ISLNK(self.mode)
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._reader._read_exactly(size)
+        self._remaining -= size
+        return data
+
+    def _skip(self):
+        while self._remaining:
+            self.read(BLOCK_SIZE)
+
+
+def normalize_name(name):
+    '''
+    Return the archive member name `name` as a relative path, or None if it
+    is absolute or would escape the extraction directory.
+    '''
+    if name.startswith('/'):
+        return None
+    name = posixpath.normpath(name)
+    if name == '.' or name == '..' or name.startswith('../'):
+        return None
+    return name
+
+
+class CpioReader(object):
+    '''
+    Iterates over the entries of the cpio archive read from the file object f.
+    '''
+    def __init__(self, f):
+        self._f = f
+        self._entry = None
+        self._padding = 0
+
+    def _read_exactly(self, size):
+        data = self._f.read(size)
+        if len(data) != size:
+            raise CpioError('Truncated cpio archive')
+        return data
+
+    def _read_header(self):
+        magic = self._read_exactly(6)
+        if magic == ODC_MAGIC:
+            header = self._read_exactly(70)
+            # dev, ino, mode, uid, gid, nlink, rdev
+            fields = [int(header[i:i + 6], 8) for i in range(0, 42, 6)]
+            mode = fields[2]
+            mtime = int(header[42:53], 8)
+            namesize = int(header[53:59], 8)
+            size = int(header[59:70], 8)
+            name = self._read_exactly(namesize)
+            data_padding = 0
+        elif magic in (NEWC_MAGIC, CRC_MAGIC):
+            header = self._read_exactly(104)
+            # ino, mode, uid, gid, nlink, mtime, filesize, devmajor,
+            # devminor, rdevmajor, rdevminor, namesize, check
+            fields = [int(header[i:i + 8], 16) for i in range(0, 104, 8)]
+            mode = fields[1]
+            mtime = fields[5]
+            size = fields[6]
+            namesize = fields[11]
+            # The header and name, and the file data, are each padded to a
+            # multiple of four bytes.
+            name = self._read_exactly(namesize + (-(110 + namesize) % 4))[:namesize]
+            data_padding = -size % 4
+        else:
+            raise CpioError('Unsupported cpio header magic: {0!r}'.format(magic))
+        name = name.rstrip(b'\0').decode('utf-8', 'replace')
+        return name, mode, size, mtime, data_padding
+
+    def __iter__(self):
+        while True:
+            if self._entry is not None:
+                self._entry._skip()
+                self._read_exactly(self._padding)
+                self._entry = None
+            try:
+                name, mode, size, mtime, self._padding = self._read_header()
+            except ValueError:
+                raise CpioError('Malformed cpio header')
+            if name == TRAILER:
+                return
+            self._entry = CpioEntry(self, name, mode, size, mtime)
+            yield self._entry
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+dump_scheduler.py
+
+Runs dump_syms over many binaries at once. Binaries from every payload being
+dumped share one queue ordered by size, largest first, so the few huge
+frameworks start early instead of holding up the end of a run. Each
+dump_syms process is charged an estimate of the memory it will need, and no
+new process is started while that would take the total over a budget. A
+process that runs for too long is killed, and its binary is reported as a
+failure rather than stopping the rest of the payload. Cancelling the
+scheduler kills the processes that are running as well as dropping the
+tasks that haven't started.
+'''
+import heapq
+import itertools
+import logging
+import multiprocessing
+import os
+import subprocess
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+DEFAULT_TIMEOUT = 20 * 60
+# dump_syms holds the whole binary plus the symbol data it builds from it;
+# this is a generous fit to what it uses on system frameworks.
+BASE_MEMORY = 64 * 1024 * 1024
+MEMORY_PER_BYTE = 6
+
+
+def physical_memory():
+    '''
+    Return the amount of physical memory in bytes, or None if it can't be
+    determined.
+    '''
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def estimate_memory(size):
+    '''
+    Return the estimated peak memory use of dump_syms on a slice of size
+    bytes.
+    '''
+    return BASE_MEMORY + MEMORY_PER_BYTE * size
+
+
+class DumpTask(object):
+    '''
+    One architecture of one binary to dump. name is the path of the binary
+    relative to the directory it was extracted to, and size is the size of
+    the slice being dumped. digest identifies the slice's contents when it
+    has no UUID to identify it by.
+    '''
+    def __init__(self, path, name, arch, size, digest=None):
+        self.path = path
+        self.name = name
+        self.arch = arch
+        self.size = size
+        self.digest = digest
+        self.memory = estimate_memory(size)
+
+    def __repr__(self):
+        return '<DumpTask {0} {1} {2} bytes>'.format(self.name, self.arch, self.size)
+
+
+class DumpResult(object):
+    '''
+    The outcome of a DumpTask: the relative filename and contents of the
+    symbol file, or an error message, and how long dump_syms ran for.
+    '''
+    def __init__(self, task, filename=None, contents=None, error=None):
+        self.task = task
+        self.filename = filename
+        self.contents = contents
+        self.error = error
+        self.seconds = 0
+
+
+def symbol_filename(contents):
+    '''
+    Return the debug_file/debug_id/debug_file.sym path for the symbol file
+    contents, or None if it doesn't start with a MODULE line.
+    '''
+    first_line = contents.split(b'\n', 1)[0].decode('utf-8', 'replace').rstrip('\r')
+    bits = first_line.split(' ', 4)
+    if len(bits) != 5 or bits[0] != 'MODULE':
+        return None
+    debug_id, debug_file = bits[3], bits[4]
+    return os.path.join(debug_file, debug_id, debug_file + '.sym')
+
+
+def kill_process(process):
+    try:
+        process.kill()
+    except OSError:
+        pass
+
+
+def run_dump_syms(dump_syms, task, timeout, on_start=None):
+    '''
+    Run dump_syms on task, killing it if it takes longer than timeout
+    seconds. on_start, if given, is called with the subprocess.Popen once
+    it has started. Returns a DumpResult.
+    '''
+    command = [dump_syms]
+    if task.arch:
+        command += ['-a', task.arch]
+    command.append(task.path)
+    try:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as e:
+        return DumpResult(task, error='Could not run dump_syms: {}'.format(e))
+    if on_start is not None:
+        on_start(process)
+    timed_out = []
+    def kill():
+        timed_out.append(True)
+        kill_process(process)
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer is not None:
+        timer.start()
+    try:
+        stdout, stderr = process.communicate()
+    finally:
+        if timer is not None:
+            timer.cancel()
+            # Don't leave its thread behind, even briefly.
+            timer.join()
+    if timed_out:
+        return DumpResult(task, error='Timed out after {} seconds'.format(timeout))
+    if process.returncode != 0:
+        message = stderr.decode('utf-8', 'replace').strip().splitlines()
+        return DumpResult(task, error='dump_syms exited with {}: {}'.format(
+            process.returncode, message[-1] if message else ''))
+    filename = symbol_filename(stdout)
+    if filename is None:
+        return DumpResult(task, error='dump_syms produced no MODULE line')
+    return DumpResult(task, filename, stdout)
+
+
+class DumpScheduler(object):
+    '''
+    Runs up to `processes` dump_syms processes at once, largest task first,
+    keeping the sum of their estimated memory under memory_budget bytes.
+    A task that doesn't fit even on its own is run by itself.
+    '''
+    def __init__(self, dump_syms, processes=None, memory_budget=None,
+                 timeout=DEFAULT_TIMEOUT):
+        self.dump_syms = dump_syms
+        self.processes = processes or multiprocessing.cpu_count()
+        if memory_budget is None:
+            memory = physical_memory()
+            memory_budget = memory * 3 // 4 if memory else None
+        self.memory_budget = memory_budget
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._heap = []
+        self._order = itertools.count()
+        self._running = 0
+        self._running_memory = 0
+        self._closed = False
+        self._cancelled = False
+        self._processes = set()
+        self._threads = []
+        for n in range(self.processes):
+            thread = threading.Thread(target=self._work, name='dump-syms-{}'.format(n))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def _fits(self, task):
+        return (self._running == 0 or self.memory_budget is None or
+                self._running_memory + task.memory <= self.memory_budget)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._closed and not (self._heap and self._fits(self._heap[0][2])):
+                    self._cond.wait()
+                if self._closed:
+                    return
+                _, _, task, results = heapq.heappop(self._heap)
+                self._running += 1
+                self._running_memory += task.memory
+            start = time.time()
+            started = []
+            try:
+                result = run_dump_syms(self.dump_syms, task, self.timeout,
+                                       lambda process: self._started(process, started))
+            except Exception as e:
+                logging.exception('Error dumping {}'.format(task.path))
+                result = DumpResult(task, error=str(e))
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._running_memory -= task.memory
+                    self._processes.difference_update(started)
+                    self._cond.notify_all()
+            if result.error is not None and self._cancelled:
+                result.error = 'Cancelled'
+            result.seconds = time.time() - start
+            results.put(result)
+
+    def _started(self, process, started):
+        started.append(process)
+        with self._cond:
+            self._processes.add(process)
+            cancelled = self._cancelled
+        if cancelled:
+            kill_process(process)
+
+    def dump(self, tasks):
+        '''
+        Queue tasks and yield a DumpResult for each of them as they finish.
+        '''
+        results = queue.Queue()
+        with self._cond:
+            for task in tasks:
+                if self._cancelled:
+                    results.put(DumpResult(task, error='Cancelled'))
+                else:
+                    heapq.heappush(self._heap, (-task.size, next(self._order), task, results))
+            count = len(tasks)
+            self._cond.notify_all()
+        for _ in range(count):
+            yield results.get()
+
+    def cancel(self):
+        '''
+        Stop dumping: running dump_syms processes are killed, and they, the
+        tasks that are waiting and any queued later finish straight away
+        with an error.
+        '''
+        with self._cond:
+            self._cancelled = True
+            waiting, self._heap = self._heap, []
+            running = list(self._processes)
+        for _, _, task, results in waiting:
+            results.put(DumpResult(task, error='Cancelled'))
+        for process in running:
+            kill_process(process)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
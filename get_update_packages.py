@@ -4,87 +4,318 @@ import argparse
 import concurrent.futures
 import logging
 import os
+import Queue
 import re
 import requests
+import requests.adapters
 import shutil
+import struct
 import subprocess
+import sys
 import tempfile
+import threading
 import urlparse
+import zlib
+from contextlib import closing
 
-from PackageSymbolDumper import process_packages, find_packages
+import hfsplus
+import symbol_sink
+import udif
+from PackageSymbolDumper import process_packages, find_packages, is_package_name
 
 OSX_RE = re.compile(r'10\.[0-9]+\.[0-9]+')
+INDEX_URL = 'https://km.support.apple.com/kb/index?page=downloads_browse&sort=recency&facet=all&category=PF6&locale=en_US&offset=%d'
+INDEX_PAGES = 16
+MAX_CONNECTIONS = 8
+READ_TIMEOUT = 60
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Disk images larger than this are downloaded in pieces of this size.
+RANGE_SIZE = 64 * 1024 * 1024
+# What reading a disk image in process can raise on an image it doesn't
+# understand; the external tools get a go at those images. Anything else,
+# such as running out of space while copying packages out, is a real error.
+DMG_READ_ERRORS = (udif.UdifError, hfsplus.HfsError, struct.error, zlib.error, EOFError)
 
 
-def extract_dmg(dmg_path, dest):
-    logging.info('extract_dmg({}, {})'.format(dmg_path, dest))
+def extract_dmg_with_tools(dmg_path, dest):
+    '''
+    Extract everything in a disk image to dest with xpwn's dmg and hfsplus
+    tools, for images extract_dmg_packages can't read.
+    '''
+    logging.info('extract_dmg_with_tools({}, {})'.format(dmg_path, dest))
     with tempfile.NamedTemporaryFile() as f:
         subprocess.check_call(['dmg', 'extract', dmg_path, f.name], stdout=open(os.devnull, 'wb'))
         subprocess.check_call(['hfsplus', f.name, 'extractall'], cwd=dest)
+    return list(find_packages(dest))
+
+
+def find_hfs_volume(image):
+    for partition in image.partitions:
+        try:
+            return hfsplus.HfsVolume(partition)
+        except hfsplus.HfsError:
+            continue
+    raise hfsplus.HfsError('No HFS+ partition in disk image')
+
+
+def extract_dmg_packages(dmg_path, dest):
+    '''
+    Copy just the installer packages out of a disk image to dest, reading
+    the image's chunks as they're needed instead of extracting the whole
+    disk first. Returns the paths of the copied packages.
+    '''
+    logging.info('extract_dmg_packages({}, {})'.format(dmg_path, dest))
+    packages = []
+    with open(dmg_path, 'rb') as f:
+        volume = find_hfs_volume(udif.UdifImage(f))
+        for hfs_file in volume.files():
+            if not is_package_name(hfs_file.name):
+                continue
+            local_path = os.path.join(dest, *hfs_file.path.split('/'))
+            if not os.path.isdir(os.path.dirname(local_path)):
+                os.makedirs(os.path.dirname(local_path))
+            logging.info('Extracting {} ({} bytes)'.format(hfs_file.path, hfs_file.size))
+            with open(local_path, 'wb') as out:
+                shutil.copyfileobj(volume.open(hfs_file), out, 1024 * 1024)
+            packages.append(local_path)
+    return packages
+
+
+def extract_dmg(dmg_path, dest):
+    '''
+    Extract the installer packages in a disk image to dest and return their
+    paths.
+    '''
+    try:
+        return extract_dmg_packages(dmg_path, dest)
+    except DMG_READ_ERRORS as e:
+        logging.warning('Could not read {} directly ({}: {}), extracting it instead'.format(
+            dmg_path, type(e).__name__, e))
+        shutil.rmtree(dest)
+        os.makedirs(dest)
+        return extract_dmg_with_tools(dmg_path, dest)
+
+
+def get_session(connections=MAX_CONNECTIONS):
+    '''
+    Return a requests session whose connection pool is large enough for
+    connections concurrent requests to one host.
+    '''
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=connections,
+                                            pool_maxsize=connections)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def fetch_index_page(session, index_url, page):
+    '''
+    Return the list of downloads on one page of the support downloads
+    index, or None if there is no such page.
+    '''
+    logging.info('get_update_packages: page ' + str(page))
+    res = session.get(index_url % page, timeout=READ_TIMEOUT)
+    if res.status_code != 200:
+        return None
+    return res.json().get('downloads', [])
 
 
-def get_update_packages():
-    for i in xrange(16):
-        logging.info('get_update_packages: page ' + str(i))
-        url = 'https://km.support.apple.com/kb/index?page=downloads_browse&sort=recency&facet=all&category=PF6&locale=en_US&offset=%d' % i
-        res = requests.get(url)
-        if res.status_code != 200:
-            break
-        data = res.json()
-        downloads = data.get('downloads', [])
-        if not downloads:
-            break
-        for d in downloads:
-            title = d.get('title', '')
-            if OSX_RE.search(title) and 'Combo' not in title:
-                logging.info('Title: ' + title)
-                if 'fileurl' in d:
-                    yield d['fileurl']
-                else:
-                    log.warn('No fileurl in download!')
-
-
-def fetch_url_to_file(url, download_dir):
+def get_update_packages(session, executor, index_url=INDEX_URL, pages=INDEX_PAGES):
+    '''
+    Yield the URLs of OS X update disk images from the support downloads
+    index. All pages are requested at once; they're read in order, stopping
+    at the first missing or empty page.
+    '''
+    jobs = [executor.submit(fetch_index_page, session, index_url, i) for i in xrange(pages)]
+    try:
+        for job in jobs:
+            downloads = job.result()
+            if not downloads:
+                break
+            for d in downloads:
+                title = d.get('title', '')
+                if OSX_RE.search(title) and 'Combo' not in title:
+                    logging.info('Title: ' + title)
+                    if 'fileurl' in d:
+                        yield d['fileurl']
+                    else:
+                        logging.warn('No fileurl in download!')
+    finally:
+        for job in jobs:
+            job.cancel()
+
+
+def fetch_range(session, url, filename, start, end):
+    '''
+    Download bytes start to end (inclusive) of url into the same place in
+    the existing file filename.
+    '''
+    r = session.get(url, stream=True, timeout=READ_TIMEOUT,
+                    headers={'Range': 'bytes={}-{}'.format(start, end),
+                             'Accept-Encoding': 'identity'})
+    r.raise_for_status()
+    if r.status_code != 206:
+        raise IOError('{} ignored a range request'.format(url))
+    with open(filename, 'r+b') as f:
+        f.seek(start)
+        for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            f.write(chunk)
+        if f.tell() != end + 1:
+            raise IOError('Short read of {} bytes {}-{}'.format(url, start, end))
+
+
+def fetch_url_to_file(session, url, download_dir, range_executor=None,
+                      range_size=RANGE_SIZE):
+    '''
+    Download url into download_dir. Large files from servers that accept
+    range requests are downloaded in range_size pieces on range_executor.
+    Returns the local filename, or None if it has already been downloaded.
+    '''
     filename = os.path.basename(urlparse.urlsplit(url).path)
     local_filename = os.path.join(download_dir, filename)
     if os.path.isfile(local_filename):
         logging.info('{} already exists, skipping'.format(local_filename))
         return None
-    r = requests.get(url, stream=True)
-    res_len = int(r.headers.get('content-length', '0'))
+    head = session.head(url, allow_redirects=True, timeout=READ_TIMEOUT,
+                        headers={'Accept-Encoding': 'identity'})
+    head.raise_for_status()
+    res_len = int(head.headers.get('content-length', '0'))
     logging.info('Downloading {} -> {} ({} bytes)'.format(url, local_filename, res_len))
-    with open(local_filename, 'wb') as f:
-        for chunk in r.iter_content(chunk_size=1024):
-            if chunk: # filter out keep-alive new chunks
+    if (range_executor is not None and res_len > range_size and
+        head.headers.get('accept-ranges') == 'bytes'):
+        # Fetch from the final URL so each range doesn't redirect again.
+        url = head.url
+        with open(local_filename, 'wb') as f:
+            f.truncate(res_len)
+        jobs = [range_executor.submit(fetch_range, session, url, local_filename,
+                                      start, min(start + range_size, res_len) - 1)
+                for start in xrange(0, res_len, range_size)]
+        try:
+            for job in jobs:
+                job.result()
+        except Exception:
+            for job in jobs:
+                job.cancel()
+            os.unlink(local_filename)
+            raise
+        return local_filename
+    r = session.get(url, stream=True, timeout=READ_TIMEOUT,
+                    headers={'Accept-Encoding': 'identity'})
+    r.raise_for_status()
+    try:
+        with open(local_filename, 'wb') as f:
+            for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
                 f.write(chunk)
+            if res_len and f.tell() != res_len:
+                raise IOError('Downloaded {} bytes of {}, expected {}'.format(
+                    f.tell(), url, res_len))
+    except Exception:
+        # A partial file would be skipped as already downloaded next time.
+        os.unlink(local_filename)
+        raise
     return local_filename
 
 
-def fetch_and_extract_dmg(url, tmpdir):
+def fetch_and_extract_dmg(session, url, tmpdir, range_executor=None, range_size=RANGE_SIZE):
     logging.info('fetch_and_extract_dmg: ' + url)
-    filename = fetch_url_to_file(url, tmpdir)
+    filename = fetch_url_to_file(session, url, tmpdir, range_executor, range_size)
     if not filename:
         return []
     # Extract dmg contents to a subdir
     subdir = tempfile.mkdtemp(dir=tmpdir)
-    extract_dmg(filename, subdir)
-    packages = list(find_packages(subdir))
+    packages = extract_dmg(filename, subdir)
     logging.info('fetch_and_extract_dmg({}): found packages: {}'.format(url, str(packages)))
     return packages
 
 
-def find_update_packages(tmpdir):
+def find_update_packages(tmpdir, index_url=INDEX_URL, download_jobs=2,
+                         range_jobs=4, queue_size=2, range_size=RANGE_SIZE):
+    '''
+    Yield installer packages from the OS X updates in the support downloads
+    index as soon as each disk image has been downloaded and extracted.
+
+    Downloads run on a separate thread and hand packages over through a
+    queue of queue_size entries, so symbol dumping starts on the first
+    package while later images are still downloading. At most
+    download_jobs + queue_size images are downloading or waiting to be
+    handed over, and another is only started once one has been handed
+    over, so downloads pause when dumping falls behind.
+
+    An update that can't be downloaded or extracted is logged and skipped.
+    Any other error, such as an unreadable index, is raised here after the
+    packages already handed over.
+    '''
     logging.info('find_update_packages')
-    # Only download 2 packages at a time.
-    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
-        jobs = dict((executor.submit(fetch_and_extract_dmg, url, tmpdir), url) for url in get_update_packages())
-        for future in concurrent.futures.as_completed(jobs):
-            url = jobs[future]
-            if future.exception() is not None:
-                logging.error('exception downloading {}: {}'.format(url, future.exception()))
-            else:
-                for pkg in future.result():
-                    yield pkg
+    packages = Queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    done = object()
+    failure = []
+    session = get_session(download_jobs * range_jobs + INDEX_PAGES)
+
+    def produce():
+        index_executor = concurrent.futures.ThreadPoolExecutor(max_workers=INDEX_PAGES)
+        range_executor = concurrent.futures.ThreadPoolExecutor(max_workers=download_jobs * range_jobs)
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=download_jobs)
+        urls = get_update_packages(session, index_executor, index_url)
+        jobs = {}
+
+        def start_next():
+            url = next(urls, None)
+            if url is not None:
+                jobs[executor.submit(fetch_and_extract_dmg, session, url, tmpdir,
+                                     range_executor, range_size)] = url
+
+        try:
+            for _ in xrange(download_jobs + queue_size):
+                start_next()
+            while jobs and not stop.is_set():
+                finished, _ = concurrent.futures.wait(
+                    jobs, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    if stop.is_set():
+                        break
+                    url = jobs.pop(future)
+                    if future.exception() is not None:
+                        logging.error('exception downloading {}: {}'.format(
+                            url, future.exception()))
+                    else:
+                        # Blocks while dumping is behind, holding back the
+                        # next download.
+                        for pkg in future.result():
+                            packages.put(pkg)
+                    start_next()
+        except Exception:
+            logging.exception('Error finding update packages')
+            failure.append(sys.exc_info())
+        finally:
+            stop.set()
+            urls.close()
+            for future in jobs:
+                future.cancel()
+            for pool in (executor, range_executor, index_executor):
+                pool.shutdown(wait=False)
+            packages.put(done)
+
+    producer = threading.Thread(target=produce, name='update-downloads')
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            pkg = packages.get()
+            if pkg is done:
+                break
+            yield pkg
+        if failure:
+            raise failure[0][1]
+    finally:
+        stop.set()
+        # Let the producer finish if it's blocked handing over a package.
+        while producer.is_alive():
+            try:
+                packages.get(timeout=0.1)
+            except Queue.Empty:
+                pass
 
 
 def main():
@@ -92,6 +323,17 @@ def main():
         description='Download OS X update packages and dump symbols from them')
     parser.add_argument('--dump_syms', default='dump_syms', type=str,
                         help='path to the Breakpad dump_syms executable')
+    parser.add_argument('--index-url', default=INDEX_URL, type=str,
+                        help='URL of the support downloads index, with %%d ' +
+                        'for the page number')
+    parser.add_argument('--download-jobs', type=int, default=2,
+                        help='Number of disk images to download at once')
+    parser.add_argument('--range-jobs', type=int, default=4,
+                        help='Number of parts of each disk image to ' +
+                        'download at once')
+    parser.add_argument('--queue-size', type=int, default=2,
+                        help='Number of extracted packages allowed to wait ' +
+                        'for symbol dumping')
     parser.add_argument('to', type=str, help='destination path for the symbols')
     args = parser.parse_args()
     logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -101,8 +343,10 @@ def main():
     try:
         tmpdir = tempfile.mkdtemp(suffix='.osxupdates')
         def finder():
-            return find_update_packages(tmpdir)
-        process_packages(finder, args.to, None, args.dump_syms)
+            return find_update_packages(tmpdir, args.index_url, args.download_jobs,
+                                        args.range_jobs, args.queue_size)
+        with closing(symbol_sink.open_sink(args.to)) as sink:
+            process_packages(finder, sink, None, args.dump_syms)
     finally:
         shutil.rmtree(tmpdir)
 
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+hfsplus.py
+
+Reads files out of an HFS+ (or HFSX) volume in place. The catalog B-tree is
+read once to list the files on the volume; a file's data fork is then read
+straight from its extents, so only the files that are wanted are copied.
+'''
+import posixpath
+import struct
+
+from streams import ExtentReader
+
+VOLUME_HEADER_OFFSET = 1024
+HFSPLUS_MAGIC = b'H+'
+HFSX_MAGIC = b'HX'
+BLOCK_SIZE_OFFSET = 40
+# logicalSize, clumpSize, totalBlocks, then eight (startBlock, blockCount).
+FORK_DATA = struct.Struct('>QII64s')
+EXTENT = struct.Struct('>II')
+EXTENTS_FILE_FORK_OFFSET = 112 + 80 * 1
+CATALOG_FILE_FORK_OFFSET = 112 + 80 * 2
+
+NODE_DESCRIPTOR = struct.Struct('>IIbBHH')
+NODE_KIND_LEAF = -1
+NODE_KIND_HEADER = 1
+# treeDepth, rootNode, leafRecords, firstLeafNode, lastLeafNode, nodeSize.
+BTREE_HEADER = struct.Struct('>HIIIIH')
+
+EXTENTS_FILE_ID = 3
+CATALOG_FILE_ID = 4
+ROOT_FOLDER_ID = 2
+
+RECORD_FOLDER = 1
+RECORD_FILE = 2
+FILE_RECORD_DATA_FORK_OFFSET = 88
+FORK_DATA_FORK = 0
+
+
+class HfsError(Exception):
+    '''The input is not an HFS+ volume this module can read.'''
+    pass
+
+
+class HfsFile(object):
+    '''
+    A file on an HFS+ volume: its path relative to the root of the volume,
+    its catalog node ID, and the size and extents of its data fork.
+    '''
+    def __init__(self, path, file_id, size, extents, total_blocks):
+        self.path = path
+        self.file_id = file_id
+        self.size = size
+        self.extents = extents
+        self.total_blocks = total_blocks
+
+    @property
+    def name(self):
+        return posixpath.basename(self.path)
+
+    def __repr__(self):
+        return '<HfsFile {0!r} {1} bytes>'.format(self.path, self.size)
+
+
+def _parse_fork(data):
+    size, _clump, total_blocks, extent_data = FORK_DATA.unpack(data[:FORK_DATA.size])
+    return size, total_blocks, _parse_extents(extent_data)
+
+
+def _parse_extents(data):
+    extents = []
+    for i in range(8):
+        start, count = EXTENT.unpack_from(data, i * EXTENT.size)
+        if not count:
+            break
+        extents.append((start, count))
+    return extents
+
+
+class BTree(object):
+    '''
+    An HFS+ B-tree stored in the fork read by f.
+    '''
+    def __init__(self, f):
+        self._f = f
+        header = self._read(0, 512)
+        _flink, _blink, kind, _height, _records, _ = NODE_DESCRIPTOR.unpack_from(header)
+        if kind != NODE_KIND_HEADER:
+            raise HfsError('B-tree has no header node')
+        (_depth, _root, _leaf_records, self.first_leaf, _last_leaf,
+         self.node_size) = BTREE_HEADER.unpack_from(header, NODE_DESCRIPTOR.size)
+        if self.node_size < 512 or self.node_size & (self.node_size - 1):
+            raise HfsError('Implausible B-tree node size {}'.format(self.node_size))
+
+    def _read(self, offset, size):
+        self._f.seek(offset)
+        data = self._f.read(size)
+        if len(data) != size:
+            raise HfsError('B-tree node at {} is truncated'.format(offset))
+        return data
+
+    def leaf_records(self):
+        '''
+        Yield (key, record) byte strings for every record in the leaf nodes,
+        in key order. The key excludes its length field.
+        '''
+        node_number = self.first_leaf
+        visited = set()
+        while node_number:
+            if node_number in visited:
+                raise HfsError('Loop in B-tree leaf nodes')
+            visited.add(node_number)
+            node = self._read(node_number * self.node_size, self.node_size)
+            flink, _blink, kind, _height, count, _ = NODE_DESCRIPTOR.unpack_from(node)
+            if kind != NODE_KIND_LEAF:
+                raise HfsError('Node {} is not a leaf node'.format(node_number))
+            # Record offsets are stored backwards from the end of the node.
+            offsets = struct.unpack_from('>{}H'.format(count + 1), node,
+                                         self.node_size - 2 * (count + 1))[::-1]
+            for start, end in zip(offsets, offsets[1:]):
+                key_length, = struct.unpack_from('>H', node, start)
+                # Keys are padded to an even length.
+                record_start = start + 2 + key_length + (key_length & 1)
+                yield node[start + 2:start + 2 + key_length], node[record_start:end]
+            node_number = flink
+
+
+class HfsVolume(object):
+    '''
+    An HFS+ or HFSX volume read from the seekable file object f, such as a
+    partition of a disk image.
+    '''
+    def __init__(self, f):
+        self._f = f
+        f.seek(VOLUME_HEADER_OFFSET)
+        header = f.read(512)
+        if len(header) != 512:
+            raise HfsError('Truncated volume header')
+        if header[:2] not in (HFSPLUS_MAGIC, HFSX_MAGIC):
+            raise HfsError('Not an HFS+ volume')
+        self.block_size, = struct.unpack_from('>I', header, BLOCK_SIZE_OFFSET)
+        if self.block_size < 512 or self.block_size & (self.block_size - 1):
+            raise HfsError('Implausible block size {}'.format(self.block_size))
+        self._overflow = None
+        self._extents_fork = _parse_fork(header[EXTENTS_FILE_FORK_OFFSET:])
+        catalog_fork = _parse_fork(header[CATALOG_FILE_FORK_OFFSET:])
+        self._catalog = BTree(self._fork_reader(CATALOG_FILE_ID, *catalog_fork))
+
+    def _overflow_extents(self, file_id):
+        '''
+        Return the extents of file_id's data fork beyond its first eight,
+        from the extents overflow file.
+        '''
+        if self._overflow is None:
+            # Only files fragmented into more than eight extents need this,
+            # so the overflow file is read the first time one turns up.
+            self._overflow = {}
+            size, total_blocks, extents = self._extents_fork
+            if extents:
+                tree = BTree(self._fork_reader(EXTENTS_FILE_ID, size, total_blocks, extents))
+                for key, record in tree.leaf_records():
+                    fork_type, overflow_id, start_block = struct.unpack_from('>B1xII', key)
+                    if fork_type == FORK_DATA_FORK:
+                        self._overflow.setdefault(overflow_id, []).append(
+                            (start_block, _parse_extents(record)))
+        extents = []
+        for _start_block, more in sorted(self._overflow.get(file_id, [])):
+            extents.extend(more)
+        return extents
+
+    def _fork_reader(self, file_id, size, total_blocks, extents):
+        if sum(count for _, count in extents) < total_blocks:
+            if file_id == EXTENTS_FILE_ID:
+                raise HfsError('Extents overflow file is itself fragmented')
+            extents = extents + self._overflow_extents(file_id)
+        try:
+            return ExtentReader(self._f, [(start * self.block_size, count * self.block_size)
+                                          for start, count in extents], size)
+        except IOError as e:
+            raise HfsError('Bad extents for catalog node {}: {}'.format(file_id, e))
+
+    def files(self):
+        '''
+        Return an HfsFile for every file on the volume. Hard links and
+        symlinks are returned as the (small) files that represent them.
+        '''
+        folders = {}
+        entries = []
+        for key, record in self._catalog.leaf_records():
+            if len(key) < 6 or len(record) < 2:
+                continue
+            parent_id, name_length = struct.unpack_from('>IH', key)
+            # Catalog names have '/' where the POSIX name has ':'.
+            try:
+                name = key[6:6 + 2 * name_length].decode('utf-16-be').replace(u'/', u':')
+            except UnicodeDecodeError as e:
+                raise HfsError('Bad name in catalog record: {}'.format(e))
+            record_type, = struct.unpack_from('>h', record)
+            if record_type == RECORD_FOLDER:
+                folder_id, = struct.unpack_from('>I', record, 8)
+                folders[folder_id] = (parent_id, name)
+            elif record_type == RECORD_FILE:
+                file_id, = struct.unpack_from('>I', record, 8)
+                fork = _parse_fork(record[FILE_RECORD_DATA_FORK_OFFSET:])
+                entries.append((parent_id, name, file_id, fork))
+
+        paths = {ROOT_FOLDER_ID: ''}
+        def folder_path(folder_id):
+            if folder_id not in paths:
+                # Mark the folder first so a corrupt, looping catalog ends.
+                paths[folder_id] = None
+                if folder_id in folders:
+                    parent_id, name = folders[folder_id]
+                    parent = folder_path(parent_id)
+                    if parent is not None:
+                        paths[folder_id] = posixpath.join(parent, name)
+            return paths[folder_id]
+
+        files = []
+        for parent_id, name, file_id, (size, total_blocks, extents) in entries:
+            parent = folder_path(parent_id)
+            if parent is None:
+                continue
+            files.append(HfsFile(posixpath.join(parent, name), file_id, size, extents, total_blocks))
+        return files
+
+    def open(self, hfs_file):
+        '''
+        Return a seekable file object for the data fork of hfs_file.
+        '''
+        return self._fork_reader(hfs_file.file_id, hfs_file.size,
+                                 hfs_file.total_blocks, hfs_file.extents)
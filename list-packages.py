@@ -5,13 +5,16 @@ import os
 import reposadolib.reposadocommon as reposadocommon
 reposadocommon.get_main_dir = lambda: '/home/worker/venv/bin/'
 
+import shards
+
 products = reposadocommon.getProductInfo()
-args = []
-for product_id, p in products.iteritems():
-  t = p['title']
-  #p['CatalogEntry']['Packages']
-  if t.startswith('OS X') or t.startswith('Mac OS X') or t.startswith('macOS'):
-    args.append('--product-id=' + product_id)
+product_ids = shards.wanted_products(products)
+if 'SHARD_ASSIGNMENT' in os.environ:
+  # Only the products the decision task gave this fetch task.
+  product_ids = shards.shard_products(product_ids,
+                                      shards.loads(os.environ['SHARD_ASSIGNMENT']),
+                                      int(os.environ['SHARD_INDEX']))
+args = ['--product-id=' + product_id for product_id in product_ids]
 if 'JUST_ONE_PACKAGE' in os.environ:
   args = args[:1]
 
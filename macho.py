@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+macho.py
+
+Helpers for recognizing Mach-O binaries and reading the architecture and
+LC_UUID of each slice without running external tools.
+'''
+import binascii
+import os
+import struct
+
+MH_MAGIC = 0xfeedface
+MH_CIGAM = 0xcefaedfe
+MH_MAGIC_64 = 0xfeedfacf
+MH_CIGAM_64 = 0xcffaedfe
+FAT_MAGIC = 0xcafebabe
+FAT_MAGIC_64 = 0xcafebabf
+
+LC_UUID = 0x1b
+
+CPU_ARCH_ABI64 = 0x01000000
+CPU_TYPE_X86 = 7
+CPU_TYPE_X86_64 = CPU_TYPE_X86 | CPU_ARCH_ABI64
+CPU_TYPE_ARM = 12
+CPU_TYPE_ARM64 = CPU_TYPE_ARM | CPU_ARCH_ABI64
+CPU_TYPE_POWERPC = 18
+CPU_TYPE_POWERPC64 = CPU_TYPE_POWERPC | CPU_ARCH_ABI64
+CPU_SUBTYPE_MASK = 0xff000000
+CPU_SUBTYPE_X86_64_H = 8
+CPU_SUBTYPE_ARM64E = 2
+
+# Java class files share the fat magic; real fat binaries have a small
+# number of architectures where class files have their version number.
+MAX_FAT_ARCHS = 30
+
+# The number of bytes is_macho needs to see.
+SNIFF_SIZE = 8
+
+
+class MachOError(Exception):
+    '''The input is not a well-formed Mach-O binary.'''
+    pass
+
+
+class Slice(object):
+    '''
+    One architecture of a Mach-O binary: its CPU type and subtype, where it
+    lives in the file, and its LC_UUID as a 16-byte string (or None).
+    '''
+    def __init__(self, cputype, cpusubtype, offset, size, uuid=None):
+        self.cputype = cputype
+        self.cpusubtype = cpusubtype
+        self.offset = offset
+        self.size = size
+        self.uuid = uuid
+
+    @property
+    def arch(self):
+        return arch_name(self.cputype, self.cpusubtype)
+
+    @property
+    def debug_id(self):
+        '''
+        The Breakpad debug identifier for this slice, or None if it has no
+        LC_UUID.
+        '''
+        if self.uuid is None:
+            return None
+        return binascii.hexlify(self.uuid).decode('ascii').upper() + '0'
+
+    def __repr__(self):
+        return '<Slice {0} {1}>'.format(self.arch, self.debug_id)
+
+
+def arch_name(cputype, cpusubtype):
+    '''
+    Return the name dump_syms and lipo use for an architecture.
+    '''
+    subtype = cpusubtype & ~CPU_SUBTYPE_MASK
+    if cputype == CPU_TYPE_X86:
+        return 'i386'
+    elif cputype == CPU_TYPE_X86_64:
+        return 'x86_64h' if subtype == CPU_SUBTYPE_X86_64_H else 'x86_64'
+    elif cputype == CPU_TYPE_ARM64:
+        return 'arm64e' if subtype == CPU_SUBTYPE_ARM64E else 'arm64'
+    elif cputype == CPU_TYPE_ARM:
+        return 'arm'
+    elif cputype == CPU_TYPE_POWERPC:
+        return 'ppc'
+    elif cputype == CPU_TYPE_POWERPC64:
+        return 'ppc64'
+    return 'cputype{0}'.format(cputype)
+
+
+def is_macho(header):
+    '''
+    Return True if header, the first SNIFF_SIZE bytes of a file, looks like
+    the start of a thin or fat Mach-O binary.
+    '''
+    if len(header) < SNIFF_SIZE:
+        return False
+    magic, nfat_arch = struct.unpack('>II', header[:SNIFF_SIZE])
+    if magic in (MH_MAGIC, MH_CIGAM, MH_MAGIC_64, MH_CIGAM_64):
+        return True
+    return magic in (FAT_MAGIC, FAT_MAGIC_64) and 0 < nfat_arch <= MAX_FAT_ARCHS
+
+
+def _read(f, offset, size):
+    f.seek(offset)
+    data = f.read(size)
+    if len(data) != size:
+        raise MachOError('Truncated Mach-O file')
+    return data
+
+
+def _read_thin(f, offset, size):
+    magic, = struct.unpack('<I', _read(f, offset, 4))
+    if magic in (MH_MAGIC, MH_MAGIC_64):
+        endian = '<'
+    elif magic in (MH_CIGAM, MH_CIGAM_64):
+        endian = '>'
+    else:
+        raise MachOError('Bad Mach-O magic 0x{0:08x}'.format(magic))
+    is_64 = magic in (MH_MAGIC_64, MH_CIGAM_64)
+    (_, cputype, cpusubtype, _, ncmds,
+     sizeofcmds, _) = struct.unpack(endian + '7I', _read(f, offset, 28))
+    cmds = _read(f, offset + (32 if is_64 else 28), sizeofcmds)
+    uuid = None
+    position = 0
+    for _ in range(ncmds):
+        if position + 8 > len(cmds):
+            raise MachOError('Load commands extend past sizeofcmds')
+        cmd, cmdsize = struct.unpack(endian + 'II', cmds[position:position + 8])
+        if cmdsize < 8:
+            raise MachOError('Bad load command size {0}'.format(cmdsize))
+        if cmd == LC_UUID and cmdsize >= 24:
+            uuid = cmds[position + 8:position + 24]
+            break
+        position += cmdsize
+    return Slice(cputype, cpusubtype, offset, size, uuid)
+
+
+def read_slices(f):
+    '''
+    Return a Slice for every architecture in the Mach-O binary read from the
+    seekable file object f. Fat binaries are read in place; no slice data
+    beyond the headers and load commands is read.
+    '''
+    f.seek(0, os.SEEK_END)
+    file_size = f.tell()
+    magic, nfat_arch = struct.unpack('>II', _read(f, 0, 8))
+    if magic in (FAT_MAGIC, FAT_MAGIC_64):
+        if not 0 < nfat_arch <= MAX_FAT_ARCHS:
+            raise MachOError('Implausible number of fat architectures: {0}'.format(nfat_arch))
+        if magic == FAT_MAGIC:
+            entry = struct.Struct('>5I')
+        else:
+            entry = struct.Struct('>iiQQII')
+        table = _read(f, 8, entry.size * nfat_arch)
+        slices = []
+        for i in range(nfat_arch):
+            fields = entry.unpack_from(table, i * entry.size)
+            offset, size = fields[2], fields[3]
+            if offset + size > file_size:
+                raise MachOError('Fat architecture extends past the end of the file')
+            slices.append(_read_thin(f, offset, size))
+        return slices
+    return [_read_thin(f, 0, file_size)]
+
+
+def read_slices_from_path(path):
+    '''
+    Like read_slices, for the file at path.
+    '''
+    with open(path, 'rb') as f:
+        return read_slices(f)
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+Combine the artifacts of several sharded fetch tasks into the artifacts a
+single fetch task would have produced, for the upload task and the next
+night's run.
+
+usage: merge-artifacts.py OUTPUT_DIR SHARD_DIR...
+'''
+import argparse
+import gzip
+import logging
+import os
+import plistlib
+import shutil
+import sqlite3
+import struct
+import tarfile
+import tempfile
+import zipfile
+
+import metrics
+import package_store
+import symbol_sink
+
+SYMBOLS_ZIP = 'target.crashreporter-symbols.zip'
+REPO_SYNC_CACHE = 'repo-sync-cache.tar.gz'
+CATALOG_DIGESTS = 'metadata/CatalogDigests.plist'
+ETAGS = 'metadata/ETags.plist'
+LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+
+
+def read_lines(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        return set(line for line in f.read().splitlines() if line)
+
+
+def merge_lines(paths, output):
+    '''
+    Write the sorted union of the lines of paths, which may be gzipped, to
+    output, gzipping it if its name ends in .gz.
+    '''
+    lines = set()
+    for path in paths:
+        lines |= read_lines(path)
+    logging.info('Writing {} lines to {}'.format(len(lines), output))
+    opener = gzip.open if output.endswith('.gz') else open
+    with opener(output, 'wb') as f:
+        f.write(b''.join(line + b'\n' for line in sorted(lines)))
+
+
+def gunzip(path, output):
+    with gzip.open(path, 'rb') as f, open(output, 'wb') as out:
+        shutil.copyfileobj(f, out)
+
+
+def merge_state(paths, output):
+    '''
+    Merge the gzipped package state databases at paths into a new gzipped
+    database at output.
+    '''
+    temp_dir = tempfile.mkdtemp()
+    try:
+        merged = os.path.join(temp_dir, 'merged.sqlite')
+        shard = os.path.join(temp_dir, 'shard.sqlite')
+        package_store.PackageStore(merged).close()
+        db = sqlite3.connect(merged)
+        for path in paths:
+            gunzip(path, shard)
+            db.execute('ATTACH DATABASE ? AS shard', (shard,))
+            # A shard with nothing to do never opened its copy of the
+            # previous state, which may predate some tables.
+            tables = set(row[0] for row in db.execute(
+                "SELECT name FROM shard.sqlite_master WHERE type = 'table'"))
+            with db:
+                db.execute('INSERT OR REPLACE INTO packages SELECT * FROM shard.packages')
+                # Every shard starts from the same state, so the failures
+                # recorded by earlier runs are in all of them.
+                db.execute('INSERT INTO failures SELECT * FROM shard.failures '
+                           'EXCEPT SELECT * FROM failures')
+                if 'checkpoints' in tables:
+                    db.execute('INSERT INTO checkpoints SELECT * FROM shard.checkpoints '
+                               'EXCEPT SELECT * FROM checkpoints')
+                for table in ('payloads', 'binaries'):
+                    if table in tables:
+                        db.execute('INSERT OR REPLACE INTO {0} SELECT * FROM shard.{0}'.format(table))
+            db.execute('DETACH DATABASE shard')
+        # Every shard starts from the same state, so one that didn't handle a
+        # package still has the checkpoints another shard finished with.
+        with db:
+            db.execute('DELETE FROM checkpoints WHERE path IN (SELECT path FROM packages)')
+        db.execute('PRAGMA journal_mode=DELETE')
+        db.close()
+        with open(merged, 'rb') as f, gzip.open(output, 'wb') as out:
+            shutil.copyfileobj(f, out)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def read_plist(f):
+    if hasattr(plistlib, 'load'):
+        return plistlib.load(f)
+    return plistlib.readPlist(f)
+
+
+def write_plist(data, path):
+    if hasattr(plistlib, 'dump'):
+        with open(path, 'wb') as f:
+            plistlib.dump(data, f)
+    else:
+        plistlib.writePlist(data, path)
+
+
+def merge_repo_sync_cache(paths, output):
+    '''
+    Merge the repo_sync caches in the tar archives at paths into a new
+    archive at output. Every shard syncs the same catalogs and product info,
+    but only downloads its own products, so the first shard's cache is used
+    with each product marked downloaded if any shard downloaded it.
+    '''
+    temp_dir = tempfile.mkdtemp()
+    try:
+        with tarfile.open(paths[0]) as archive:
+            archive.extractall(temp_dir)
+        digests_path = os.path.join(temp_dir, CATALOG_DIGESTS)
+        etags_path = os.path.join(temp_dir, ETAGS)
+        digests = {}
+        if os.path.exists(digests_path):
+            with open(digests_path, 'rb') as f:
+                digests = read_plist(f)
+        etags = {}
+        if os.path.exists(etags_path):
+            with open(etags_path, 'rb') as f:
+                etags = read_plist(f)
+        products = digests.setdefault('Products', {})
+        for path in paths[1:]:
+            with tarfile.open(path) as archive:
+                names = archive.getnames()
+                if CATALOG_DIGESTS in names:
+                    shard_products = read_plist(archive.extractfile(CATALOG_DIGESTS)).get(
+                        'Products', {})
+                    for key, entry in shard_products.items():
+                        if key not in products or (entry.get('Downloaded') and
+                                                    not products[key].get('Downloaded')):
+                            products[key] = entry
+                if ETAGS in names:
+                    shard_etags = read_plist(archive.extractfile(ETAGS))
+                    for url, etag in shard_etags.items():
+                        etags.setdefault(url, etag)
+        if digests.get('Products') or digests.get('Catalogs'):
+            write_plist(digests, digests_path)
+        if etags:
+            write_plist(etags, etags_path)
+        logging.info('Writing repo_sync cache of {} products to {}'.format(len(products), output))
+        with tarfile.open(output, 'w:gz') as archive:
+            for name in sorted(os.listdir(temp_dir)):
+                archive.add(os.path.join(temp_dir, name), name)
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def merge_zips(paths, output):
+    '''
+    Copy the files in the zip archives at paths into a new archive at
+    output, without recompressing them.
+    '''
+    sink = symbol_sink.ZipSink(output)
+    try:
+        for path in paths:
+            logging.info('Copying symbols from {}'.format(path))
+            with open(path, 'rb') as f:
+                archive = zipfile.ZipFile(f)
+                for info in archive.infolist():
+                    if info.compress_type != zipfile.ZIP_DEFLATED:
+                        sink.add(info.filename, archive.read(info))
+                        continue
+                    f.seek(info.header_offset)
+                    header = LOCAL_HEADER.unpack(f.read(LOCAL_HEADER.size))
+                    f.seek(header[9] + header[10], os.SEEK_CUR)
+                    sink.add_deflated(info.filename, info.file_size, info.CRC,
+                                      f.read(info.compress_size))
+    finally:
+        sink.close()
+
+
+def concatenate(paths, output):
+    with open(output, 'wb') as out:
+        for path in paths:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, out)
+
+
+def existing(shard_dirs, name):
+    return [p for p in (os.path.join(d, name) for d in shard_dirs) if os.path.exists(p)]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Merge the artifacts of sharded fetch tasks.')
+    parser.add_argument('output', help='directory to write merged artifacts to')
+    parser.add_argument('shards', nargs='+', help='directories of shard artifacts')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    for name in ('processed-packages.gz', 'symbol-index.gz', 'symbol-manifest.txt'):
+        merge_lines(existing(args.shards, name), os.path.join(args.output, name))
+    state = existing(args.shards, 'package-state.sqlite.gz')
+    if state:
+        merge_state(state, os.path.join(args.output, 'package-state.sqlite.gz'))
+    merge_zips(existing(args.shards, SYMBOLS_ZIP), os.path.join(args.output, SYMBOLS_ZIP))
+    metrics_file = os.path.join(args.output, 'metrics.jsonl')
+    concatenate(existing(args.shards, 'metrics.jsonl'), metrics_file)
+    metrics.write_summary(metrics_file, os.path.join(args.output, 'metrics-summary.json'))
+    # Every shard syncs all of the product info, so any one of them will do.
+    product_info = existing(args.shards, 'product-info.plist.gz')
+    if product_info:
+        shutil.copy(product_info[0], os.path.join(args.output, 'product-info.plist.gz'))
+    repo_sync_cache = existing(args.shards, REPO_SYNC_CACHE)
+    if repo_sync_cache:
+        merge_repo_sync_cache(repo_sync_cache, os.path.join(args.output, REPO_SYNC_CACHE))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,22 @@
+#!/bin/sh
+. /home/worker/venv/bin/activate
+
+set -v -e -x
+
+base="$(realpath $(dirname $0))"
+
+cd /home/worker
+mkdir -p artifacts
+
+# Fetch the artifacts of each shard's fetch task, then combine them into the
+# artifacts a single fetch task would have produced.
+i=0
+for task_id in $SHARD_TASK_IDS; do
+  mkdir -p shard-$i
+  for name in processed-packages.gz symbol-index.gz package-state.sqlite.gz symbol-manifest.txt product-info.plist.gz repo-sync-cache.tar.gz metrics.jsonl target.crashreporter-symbols.zip; do
+    curl -fL -o shard-$i/$name "https://queue.taskcluster.net/v1/task/$task_id/artifacts/public/build/$name" || rm -f shard-$i/$name
+  done
+  i=$((i+1))
+done
+
+python "${base}/merge-artifacts.py" artifacts shard-*
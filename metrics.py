@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+metrics.py
+
+Structured timings for each stage of a run. Every measurement is one JSON
+object on its own line:
+
+    {"stage": "dump_syms", "package": "...", "seconds": 1.5,
+     "bytes_in": 123, "bytes_out": 45, "items": 1, "time": 1500000000.0}
+
+plus any stage-specific fields, such as the binary and architecture for
+dump_syms. The stages are download (written by repo_sync), expand (reading
+an installer package's xar table of contents), decode (decompressing a
+payload), extract (reading its cpio archive and writing out binaries),
+dump_syms (one architecture of one binary), write (adding a symbol file to
+the output) and package (a whole package, from expand to being recorded).
+
+Run as a script, this summarizes a metrics file per stage and per package:
+
+    metrics.py METRICS_FILE SUMMARY_FILE
+'''
+import argparse
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+
+# How many of the slowest packages to list in a summary.
+SLOWEST_PACKAGES = 20
+
+
+class Timer(object):
+    '''
+    Times a block of code for Metrics.timer(). Byte counts and other fields
+    can be filled in on it before the block ends.
+    '''
+    def __init__(self, metrics, stage, package, fields):
+        self.metrics = metrics
+        self.stage = stage
+        self.package = package
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.items = 1
+        self.fields = fields
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.record(self.stage, self.package, time.time() - self.start,
+                            self.bytes_in, self.bytes_out, self.items, **self.fields)
+
+
+class Metrics(object):
+    '''
+    Appends measurements to the file at path, or discards them if path is
+    None. Measurements may be recorded from any thread.
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = open(path, 'ab') if path is not None else None
+
+    def record(self, stage, package=None, seconds=0, bytes_in=0, bytes_out=0,
+               items=1, **fields):
+        if self._f is None:
+            return
+        fields.update(stage=stage, package=package, seconds=round(seconds, 6),
+                      bytes_in=bytes_in, bytes_out=bytes_out, items=items,
+                      time=round(time.time(), 3))
+        line = json.dumps(fields, sort_keys=True) + '\n'
+        with self._lock:
+            self._f.write(line.encode('utf-8'))
+
+    def timer(self, stage, package=None, **fields):
+        '''
+        Return a context manager that records how long its block takes.
+        '''
+        return Timer(self, stage, package, fields)
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+class TimedIter(object):
+    '''
+    Wraps an iterator of byte strings, counting the time spent producing
+    them and their total size.
+    '''
+    def __init__(self, iterable):
+        self._iter = iter(iterable)
+        self.seconds = 0
+        self.bytes = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.time()
+        try:
+            data = next(self._iter)
+        finally:
+            self.seconds += time.time() - start
+        self.bytes += len(data)
+        return data
+
+    next = __next__
+
+
+class PackageProfiler(object):
+    '''
+    Runs pipeline stage functions under cProfile for the packages whose
+    path contains pattern, and collects the results. Work done on other
+    threads, such as parallel pbzx decoding, isn't included.
+    '''
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self._lock = threading.Lock()
+        self._profiles = []
+
+    def wrap(self, function, package_of):
+        '''
+        Return a stage function that profiles function for the items for
+        which package_of(item) matches.
+        '''
+        def stage(item):
+            if self.pattern not in package_of(item):
+                return function(item)
+            return self._profile(function, item)
+        return stage
+
+    def _profile(self, function, item):
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+        try:
+            outputs = iter(function(item))
+        finally:
+            profile.disable()
+        while True:
+            profile.enable()
+            try:
+                output = next(outputs)
+            except StopIteration:
+                return
+            finally:
+                profile.disable()
+            yield output
+
+    def dump(self, path):
+        '''
+        Write the combined profile to path, in the format pstats reads.
+        '''
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            logging.warning('No package matching {} was profiled'.format(self.pattern))
+            return
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(path)
+        logging.info('Wrote profile of {} to {}'.format(self.pattern, path))
+
+
+def _add(totals, record):
+    totals['count'] += 1
+    totals['items'] += record.get('items', 1)
+    totals['seconds'] += record.get('seconds', 0)
+    totals['bytes_in'] += record.get('bytes_in', 0)
+    totals['bytes_out'] += record.get('bytes_out', 0)
+    totals['max_seconds'] = max(totals['max_seconds'], record.get('seconds', 0))
+
+
+def _new_totals():
+    return dict(count=0, items=0, seconds=0, bytes_in=0, bytes_out=0, max_seconds=0)
+
+
+def summarize(path):
+    '''
+    Return a summary of the metrics file at path: totals per stage, per
+    stage within each package, and the time from the first measurement
+    starting to the last one ending.
+    '''
+    stages = {}
+    packages = {}
+    first = last = None
+    with open(path, 'rb') as f:
+        for line in f:
+            try:
+                record = json.loads(line.decode('utf-8'))
+            except ValueError:
+                continue
+            stage = record.get('stage')
+            _add(stages.setdefault(stage, _new_totals()), record)
+            package = record.get('package')
+            if package:
+                _add(packages.setdefault(package, {}).setdefault(stage, _new_totals()), record)
+            end = record.get('time', 0)
+            start = end - record.get('seconds', 0)
+            first = start if first is None else min(first, start)
+            last = end if last is None else max(last, end)
+    for totals in stages.values():
+        if totals['seconds']:
+            totals['mb_per_second_in'] = totals['bytes_in'] / totals['seconds'] / (1024 * 1024)
+    slowest = sorted(packages.items(),
+                     key=lambda p: -p[1].get('package', {}).get('seconds', 0))
+    return {
+        'wall_seconds': last - first if first is not None else 0,
+        'stages': stages,
+        'packages': len(packages),
+        'slowest_packages': [dict(package=package, stages=totals)
+                             for package, totals in slowest[:SLOWEST_PACKAGES]],
+    }
+
+
+def write_summary(path, summary_path):
+    summary = summarize(path) if os.path.exists(path) else summarize(os.devnull)
+    with open(summary_path, 'wb') as f:
+        f.write(json.dumps(summary, indent=2, sort_keys=True).encode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize a metrics file.')
+    parser.add_argument('metrics', help='JSON-lines metrics file')
+    parser.add_argument('summary', help='Path to write the JSON summary to')
+    args = parser.parse_args()
+    write_summary(args.metrics, args.summary)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+package_store.py
+
+Records which installer packages have been processed, along with some
+metadata about each one, in a SQLite database. Every record is committed as
+it is made, so a run that dies part way through keeps everything it
+finished. The plain list of package paths that earlier runs used as their
+tracking file can be imported, and is exported again for the next run.
+
+Within a package that hasn't finished, each binary architecture whose
+symbols have been written out is checkpointed, so that a run restarted
+after a failure can skip it. A package's checkpoints are dropped once the
+package itself is recorded.
+
+Content digests are kept too, so that work isn't repeated when Apple ships
+the same bytes under another name: packages are identified by the checksum
+of their xar table of contents, payloads by the checksum the table of
+contents lists for them, and binaries without a UUID by a hash of their
+contents.
+'''
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+STATUS_DONE = 'done'
+STATUS_ERROR = 'error'
+STATUS_IMPORTED = 'imported'
+# Identical to a package that was already processed under another path.
+STATUS_DUPLICATE = 'duplicate'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS packages (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    digest TEXT,
+    started REAL,
+    finished REAL,
+    symbols INTEGER,
+    status TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS failures (
+    path TEXT NOT NULL,
+    binary TEXT NOT NULL,
+    arch TEXT,
+    error TEXT,
+    time REAL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    path TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    binary TEXT NOT NULL,
+    arch TEXT,
+    symbol_file TEXT,
+    time REAL
+);
+CREATE INDEX IF NOT EXISTS checkpoints_path ON checkpoints (path);
+CREATE TABLE IF NOT EXISTS payloads (
+    digest TEXT PRIMARY KEY,
+    path TEXT,
+    payload TEXT,
+    time REAL
+);
+CREATE TABLE IF NOT EXISTS binaries (
+    digest TEXT NOT NULL,
+    name TEXT NOT NULL,
+    arch TEXT,
+    path TEXT,
+    time REAL,
+    PRIMARY KEY (digest, name, arch)
+);
+'''
+
+
+class PackageStore(object):
+    '''
+    The set of processed packages, stored in the SQLite database at path.
+    An in-memory database is used if path is None.
+
+    Lookups are answered from memory so they can be made from any thread;
+    records must be written from the thread that created the store.
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        self._db = sqlite3.connect(path or ':memory:')
+        if path is not None:
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(SCHEMA)
+        self._db.commit()
+        self._processed = set(row[0] for row in self._db.execute('SELECT path FROM packages'))
+        if path is not None:
+            logging.info('{} processed packages in {}'.format(len(self._processed), path))
+        # Only the checkpoints left by earlier runs are needed for lookups,
+        # so they are read once and never changed.
+        self._checkpoints = {}
+        for pkg, payload, binary, arch in self._db.execute(
+                'SELECT path, payload, binary, arch FROM checkpoints'):
+            self._checkpoints.setdefault((pkg, payload), {}).setdefault(binary, set()).add(arch)
+        if self._checkpoints:
+            logging.info('Checkpoints for {} unfinished payloads in {}'.format(
+                len(self._checkpoints), path))
+        self._lock = threading.Lock()
+        self._package_digests = {}
+        for digest, pkg in self._db.execute(
+                'SELECT digest, path FROM packages WHERE digest IS NOT NULL AND status = ? '
+                'ORDER BY finished', (STATUS_DONE,)):
+            self._package_digests.setdefault(digest, pkg)
+        # Digests of the packages and payloads taken up by this run, which
+        # haven't necessarily been recorded yet.
+        self._claimed_packages = {}
+        self._claimed_payloads = set()
+        self._payload_digests = set(row[0] for row in
+                                    self._db.execute('SELECT digest FROM payloads'))
+        self._binary_digests = set(self._db.execute('SELECT digest, name, arch FROM binaries'))
+
+    def __len__(self):
+        return len(self._processed)
+
+    def __contains__(self, pkg):
+        return pkg in self._processed
+
+    def record(self, pkg, status=STATUS_DONE, size=None, digest=None,
+               started=None, finished=None, symbols=None):
+        '''
+        Record a processed package and commit it.
+        '''
+        if finished is None:
+            finished = time.time()
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO packages '
+                             '(path, size, digest, started, finished, symbols, status) '
+                             'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                             (pkg, size, digest, started, finished, symbols, status))
+            self._db.execute('DELETE FROM checkpoints WHERE path = ?', (pkg,))
+        self._processed.add(pkg)
+        if digest is not None and status == STATUS_DONE:
+            with self._lock:
+                self._package_digests.setdefault(digest, pkg)
+
+    def find_digest(self, digest):
+        '''
+        Return the path of a package with the given digest that was
+        processed successfully, or None.
+        '''
+        return self._package_digests.get(digest)
+
+    def claim_package(self, digest, pkg):
+        '''
+        Return the path of a package with the given digest that was
+        processed successfully, or that this run is already processing.
+        Otherwise, note that pkg is being processed and return None.
+        '''
+        with self._lock:
+            other = self._package_digests.get(digest) or self._claimed_packages.get(digest)
+            if other is None:
+                self._claimed_packages[digest] = pkg
+            return other
+
+    def record_payload(self, digest, pkg, payload):
+        '''
+        Record that the payload with the given digest has been processed.
+        '''
+        with self._db:
+            self._db.execute('INSERT OR REPLACE INTO payloads (digest, path, payload, time) '
+                             'VALUES (?, ?, ?, ?)', (digest, pkg, payload, time.time()))
+        with self._lock:
+            self._payload_digests.add(digest)
+
+    def has_payload(self, digest):
+        return digest in self._payload_digests
+
+    def claim_payload(self, digest):
+        '''
+        Return False if the payload with the given digest was already
+        processed, or this run is already processing it. Otherwise, note
+        that it is being processed and return True.
+        '''
+        with self._lock:
+            if digest in self._payload_digests or digest in self._claimed_payloads:
+                return False
+            self._claimed_payloads.add(digest)
+            return True
+
+    def record_binaries(self, entries):
+        '''
+        Record and commit the digests of binaries whose symbols have been
+        written out, given as (digest, name, arch, pkg) tuples.
+        '''
+        now = time.time()
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO binaries (digest, name, arch, path, time) '
+                                 'VALUES (?, ?, ?, ?, ?)',
+                                 [entry + (now,) for entry in entries])
+        with self._lock:
+            self._binary_digests.update(entry[:3] for entry in entries)
+
+    def has_binary(self, digest, name, arch):
+        return (digest, name, arch) in self._binary_digests
+
+    def checkpoint(self, entries):
+        '''
+        Record and commit checkpoints for binaries whose symbols have been
+        written out, given as (pkg, payload, binary, arch, symbol_file)
+        tuples.
+        '''
+        now = time.time()
+        with self._db:
+            self._db.executemany('INSERT INTO checkpoints '
+                                 '(path, payload, binary, arch, symbol_file, time) '
+                                 'VALUES (?, ?, ?, ?, ?, ?)',
+                                 [entry + (now,) for entry in entries])
+
+    def checkpoints(self, pkg, payload):
+        '''
+        Return a dict of the architectures of each binary in the payload of
+        pkg that an earlier run checkpointed, keyed by the binary's path
+        within the payload.
+        '''
+        return self._checkpoints.get((pkg, payload), {})
+
+    def record_failure(self, pkg, binary, arch, error):
+        '''
+        Record that one architecture of a binary in pkg couldn't be dumped.
+        '''
+        with self._db:
+            self._db.execute('INSERT INTO failures (path, binary, arch, error, time) '
+                             'VALUES (?, ?, ?, ?, ?)',
+                             (pkg, binary, arch, error, time.time()))
+
+    def failures(self, pkg):
+        '''
+        Return (binary, arch, error) for each failure recorded for pkg.
+        '''
+        return self._db.execute('SELECT binary, arch, error FROM failures WHERE path = ?',
+                                (pkg,)).fetchall()
+
+    def get(self, pkg):
+        '''
+        Return the record for pkg as a dict, or None if it hasn't been
+        processed.
+        '''
+        cursor = self._db.execute('SELECT path, size, digest, started, finished, symbols, status '
+                                  'FROM packages WHERE path = ?', (pkg,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip(('path', 'size', 'digest', 'started', 'finished', 'symbols', 'status'), row))
+
+    def history(self):
+        '''
+        Return (path, size, started, finished, symbols) for every package
+        that was processed successfully with its timings recorded.
+        '''
+        return self._db.execute('SELECT path, size, started, finished, symbols FROM packages '
+                                'WHERE status = ? AND size IS NOT NULL AND started IS NOT NULL '
+                                'AND finished IS NOT NULL AND symbols IS NOT NULL',
+                                (STATUS_DONE,)).fetchall()
+
+    def import_list(self, tracking_file):
+        '''
+        Add the packages listed one per line in tracking_file that aren't
+        already in the store.
+        '''
+        if tracking_file is None or not os.path.exists(tracking_file):
+            return
+        logging.info('Reading processed packages from {}'.format(tracking_file))
+        with open(tracking_file, 'rb') as f:
+            paths = [line.decode('utf-8') for line in f.read().splitlines() if line]
+        new = [p for p in paths if p not in self._processed]
+        with self._db:
+            self._db.executemany('INSERT OR IGNORE INTO packages (path, status) VALUES (?, ?)',
+                                 [(p, STATUS_IMPORTED) for p in new])
+        self._processed.update(new)
+
+    def export_list(self, tracking_file):
+        '''
+        Write the paths of all processed packages to tracking_file, one per
+        line, replacing it atomically.
+        '''
+        if tracking_file is None:
+            return
+        logging.info('Writing {} processed packages to {}'.format(len(self._processed), tracking_file))
+        temp_file = tracking_file + '.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(u'\n'.join(sorted(self._processed)).encode('utf-8'))
+        os.rename(temp_file, tracking_file)
+
+    def close(self):
+        self._db.close()
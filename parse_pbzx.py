@@ -8,7 +8,21 @@
 # Cleaned up C version (as the basis for my code) here, thanks to Pepijn Bruienne / @bruienne
 # https://gist.github.com/bruienne/029494bbcfb358098b41
 
-import struct, sys
+import collections, struct, sys
+
+try:
+    import lzma
+except ImportError:
+    from backports import lzma
+
+PBZX_MAGIC = b'pbzx'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+XZ_FOOTER = b'YZ'
+
+
+class PbzxError(Exception):
+    '''The input is not a well-formed pbzx stream.'''
+    pass
 
 def seekread(f, offset=None, length=0, relative=True):
     if (offset != None):
@@ -17,6 +31,86 @@ def seekread(f, offset=None, length=0, relative=True):
     if (length != 0):
         return f.read(length)
 
+def read_exactly(f, length):
+    '''
+    Read exactly length bytes from f, raising PbzxError on a short read.
+    '''
+    data = f.read(length)
+    if len(data) != length:
+        raise PbzxError('Truncated pbzx stream: wanted %d bytes, got %d' % (length, len(data)))
+    return data
+
+def iter_pbzx_chunks(f):
+    '''
+    Yield the chunks of the pbzx stream in the file object f as
+    (compressed, data) tuples. compressed is True for xz chunks and False
+    for chunks of raw cpio data. Only one chunk is held in memory at a time.
+    '''
+    if f.read(4) != PBZX_MAGIC:
+        raise PbzxError('Not a pbzx file')
+    # The initial flags hold the uncompressed chunk size.
+    flags, = struct.unpack('>Q', read_exactly(f, 8))
+    while flags & (1 << 24):
+        flags, length = struct.unpack('>QQ', read_exactly(f, 16))
+        data = read_exactly(f, length)
+        if data.startswith(XZ_MAGIC):
+            if not data.endswith(XZ_FOOTER):
+                raise PbzxError('Footer is not xz file footer')
+            yield True, data
+        else:
+            # Chunks that don't compress are stored as raw cpio data.
+            yield False, data
+
+def decompress_chunk(chunk):
+    '''
+    Return the cpio data for a chunk as yielded by iter_pbzx_chunks.
+    '''
+    compressed, data = chunk
+    if compressed:
+        return lzma.decompress(data)
+    return data
+
+def decode_pbzx(f):
+    '''
+    Yield the decompressed cpio stream contained in the pbzx file object f,
+    one chunk at a time.
+    '''
+    for chunk in iter_pbzx_chunks(f):
+        yield decompress_chunk(chunk)
+
+class ParallelDecoder(object):
+    '''
+    Decodes pbzx streams by decompressing chunks concurrently on an executor.
+
+    Every xz chunk is an independent stream, so chunks can be decompressed in
+    any order; results are handed back in stream order. At most `window`
+    chunks are in flight at once, which bounds memory use to roughly
+    window * chunk size. lzma releases the GIL while decompressing, so a
+    ThreadPoolExecutor scales across cores without pickling chunks.
+    '''
+    def __init__(self, executor, window):
+        if window < 1:
+            raise ValueError('window must be at least 1')
+        self.executor = executor
+        self.window = window
+
+    def decode(self, f):
+        '''
+        Yield the decompressed cpio stream contained in the pbzx file object
+        f, one chunk at a time, in order.
+        '''
+        pending = collections.deque()
+        try:
+            for chunk in iter_pbzx_chunks(f):
+                pending.append(self.executor.submit(decompress_chunk, chunk))
+                if len(pending) >= self.window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
 def parse_pbzx(pbzx_path):
     section = 0
     xar_out_path = '%s.part%02d.cpio.xz' % (pbzx_path, section)
@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+pipeline.py
+
+A small staged pipeline built from threads and bounded queues. Each stage has
+its own number of worker threads; the queue in front of each stage is
+bounded, so a slow stage applies back-pressure to the stages before it
+instead of letting work pile up in memory or on disk.
+
+A pipeline can be stopped from outside through an event it shares with the
+stage functions, so that a long-running stage can give up on its item
+rather than hold up the stop.
+'''
+import logging
+import sys
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# Placed on a queue once for each worker of the stage reading it when there is
+# no more input.
+_DONE = object()
+# How often, in seconds, the caller's thread checks whether the pipeline has
+# been stopped while it waits for output.
+POLL_INTERVAL = 0.1
+
+
+class _Failure(object):
+    def __init__(self, stage, exc_info):
+        self.stage = stage
+        self.exc_info = exc_info
+
+
+class Stage(object):
+    '''
+    A pipeline stage. function is called with each input item and returns an
+    iterable of output items for the next stage. workers is the number of
+    items processed concurrently, and queue_size bounds the number of items
+    waiting for this stage. discard, if given, is called with each input
+    item that is dropped without being processed because the pipeline has
+    stopped, to release whatever the item holds.
+    '''
+    def __init__(self, name, function, workers=1, queue_size=1, discard=None):
+        if workers < 1 or queue_size < 1:
+            raise ValueError('Stage {} needs at least one worker and queue slot'.format(name))
+        self.name = name
+        self.function = function
+        self.workers = workers
+        self.queue_size = queue_size
+        self.discard = discard
+
+
+def run_pipeline(items, stages, stop=None):
+    '''
+    Feed items through stages, yielding the outputs of the last stage in the
+    order they complete. If a stage raises, the pipeline stops and the
+    exception is re-raised to the caller.
+
+    stop is an optional threading.Event, which the pipeline sets when it
+    stops. Setting it from another thread stops the pipeline: items that
+    haven't been processed yet are dropped, and nothing more is yielded.
+    Stage functions can check it to give up on the item they are working on.
+    '''
+    queues = [queue.Queue(maxsize=s.queue_size) for s in stages]
+    queues.append(queue.Queue(maxsize=stages[-1].queue_size))
+    # The consumer of the last queue is the caller, which needs one _DONE.
+    readers = [s.workers for s in stages] + [1]
+    remaining = list(readers)
+    lock = threading.Lock()
+    if stop is None:
+        stop = threading.Event()
+
+    def finish(index):
+        with lock:
+            remaining[index] -= 1
+            last = remaining[index] == 0
+        if last:
+            for _ in range(readers[index + 1]):
+                queues[index + 1].put(_DONE)
+
+    def fail(name):
+        # The failure is queued before stopping, so the caller sees it
+        # whenever it notices the stop.
+        queues[-1].put(_Failure(name, sys.exc_info()))
+        stop.set()
+
+    def feed():
+        try:
+            for item in items:
+                if stop.is_set():
+                    break
+                queues[0].put(item)
+        except Exception:
+            logging.exception('Error reading pipeline input')
+            fail('input')
+        finally:
+            for _ in range(readers[0]):
+                queues[0].put(_DONE)
+
+    def work(index):
+        stage = stages[index]
+        while True:
+            item = queues[index].get()
+            if item is _DONE:
+                break
+            if stop.is_set():
+                # Keep draining so upstream threads don't block forever.
+                if stage.discard is not None:
+                    try:
+                        stage.discard(item)
+                    except Exception:
+                        logging.exception('Error discarding item in pipeline stage {}'.format(
+                            stage.name))
+                continue
+            try:
+                for output in stage.function(item):
+                    queues[index + 1].put(output)
+                    if stop.is_set():
+                        break
+            except Exception:
+                logging.exception('Error in pipeline stage {}'.format(stage.name))
+                fail(stage.name)
+        finish(index)
+
+    threads = [threading.Thread(target=feed, name='pipeline-input')]
+    for index, stage in enumerate(stages):
+        for n in range(stage.workers):
+            threads.append(threading.Thread(target=work, args=(index,),
+                                            name='pipeline-{}-{}'.format(stage.name, n)))
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        while True:
+            try:
+                item = queues[-1].get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if item is _DONE:
+                break
+            if isinstance(item, _Failure):
+                raise item.exc_info[1]
+            if stop.is_set():
+                # Keep reading until the queue is empty, in case a failure
+                # caused the stop, but drop everything else.
+                continue
+            yield item
+    finally:
+        stop.set()
+        # Drain the output queue until every worker has exited.
+        while any(thread.is_alive() for thread in threads):
+            try:
+                queues[-1].get(timeout=0.1)
+            except queue.Empty:
+                pass
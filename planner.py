@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+planner.py
+
+Decides which packages to process, and in what order, when a run has a
+limited amount of time. Each package is given an estimated cost, from its
+size and the throughput of earlier runs, and an expected yield of new
+symbols, from how many new symbols earlier packages of the same family
+produced per byte. Packages are processed in order of expected new symbols
+per second, and a package is only started if it is expected to finish
+before the deadline along with everything already started, and while there
+is more than a margin of time left: long enough for one binary's dump_syms
+to finish, so that a package isn't started only to be cut off part way
+through.
+
+The history comes from the package store, so estimates improve as runs
+accumulate; with no history, packages are processed in the order they were
+found and the throughput falls back to a conservative default.
+'''
+import logging
+import os
+import re
+import threading
+import time
+
+# Bytes of package per second to assume when there's no history.
+DEFAULT_THROUGHPUT = 2 * 1024 * 1024
+# Seconds of work per package on top of its size: opening it, setting up
+# and cleaning up its payloads.
+PACKAGE_OVERHEAD = 5
+# How many bytes of the overall history a family's own history counts as
+# being worth, so that a family seen once doesn't swing its estimate.
+FAMILY_PRIOR_BYTES = 256 * 1024 * 1024
+
+_VERSION_RE = re.compile(r'[\d._-]+')
+
+
+def package_family(path):
+    '''
+    Return a key shared by packages that are versions of the same thing,
+    e.g. macOSUpd10.13.4.pkg and macOSUpd10.13.5.pkg.
+    '''
+    name = os.path.splitext(os.path.basename(path))[0].lower()
+    return _VERSION_RE.sub('', name) or name
+
+
+def merge_intervals(intervals):
+    '''
+    Return the total length covered by a list of (start, end) intervals.
+    '''
+    total = 0
+    end = None
+    for start, finish in sorted(intervals):
+        if end is None or start > end:
+            total += finish - start
+            end = finish
+        elif finish > end:
+            total += finish - end
+            end = finish
+    return total
+
+
+class Planner(object):
+    '''
+    Orders packages by expected new symbols per second of work, using the
+    history of a package_store.PackageStore, and admits them while they are
+    expected to finish before deadline, a time.time() value, and at least
+    margin seconds are left. With no deadline, every package is admitted.
+
+    started() and finished() must be called as packages enter and leave
+    the pipeline, so the planner knows how much work is still in flight.
+    '''
+    def __init__(self, history, deadline=None, clock=time.time, margin=0):
+        self.deadline = deadline
+        self.margin = margin
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.skipped = []
+
+        total_bytes = 0
+        total_symbols = 0
+        families = {}
+        for path, size, _started, _finished, symbols in history:
+            total_bytes += size
+            total_symbols += symbols
+            family = families.setdefault(package_family(path), [0, 0])
+            family[0] += size
+            family[1] += symbols
+        # The pipeline works on several packages at once, so measure
+        # throughput against the time that any package was being worked on,
+        # not the sum of each package's time.
+        busy = merge_intervals([(started, finished)
+                                for _path, _size, started, finished, _symbols in history
+                                if finished >= started])
+        if total_bytes and busy > 0:
+            self.throughput = total_bytes / float(busy)
+        else:
+            self.throughput = DEFAULT_THROUGHPUT
+        self.yield_rate = total_symbols / float(total_bytes) if total_bytes else None
+        self._family_rates = {}
+        if self.yield_rate is not None:
+            prior = self.yield_rate * FAMILY_PRIOR_BYTES
+            for family, (size, symbols) in families.items():
+                self._family_rates[family] = (symbols + prior) / float(size + FAMILY_PRIOR_BYTES)
+        logging.info('Planning with {:.1f} MB/s throughput, {} families of history'.format(
+            self.throughput / (1024.0 * 1024), len(families)))
+
+    def cost(self, size):
+        '''
+        Return the estimated seconds of pipeline time to process a package
+        of size bytes.
+        '''
+        return PACKAGE_OVERHEAD + size / float(self.throughput)
+
+    def expected_yield(self, pkg, size):
+        '''
+        Return the expected number of new symbol files from pkg, or None if
+        there's no history to estimate it from.
+        '''
+        if self.yield_rate is None:
+            return None
+        return self._family_rates.get(package_family(pkg), self.yield_rate) * size
+
+    def order(self, packages):
+        '''
+        Return a list of (pkg, size) for the paths in packages, most new
+        symbols per second first. Ties keep their original order.
+        '''
+        sized = []
+        for pkg in packages:
+            try:
+                sized.append((pkg, os.path.getsize(pkg)))
+            except OSError as e:
+                logging.warning('Could not find the size of {}: {}'.format(pkg, e))
+                sized.append((pkg, 0))
+        if self.yield_rate is None:
+            return sized
+        return sorted(sized, key=lambda p: -self.expected_yield(*p) / self.cost(p[1]))
+
+    def remaining(self):
+        '''
+        Return the seconds left before the deadline, or None if there is no
+        deadline.
+        '''
+        if self.deadline is None:
+            return None
+        return self.deadline - self.clock()
+
+    def expired(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def admit(self, pkg, size):
+        '''
+        Return True if pkg is expected to finish before the deadline along
+        with the packages already in flight, and there are at least margin
+        seconds left.
+        '''
+        remaining = self.remaining()
+        if remaining is None:
+            return True
+        if remaining < self.margin:
+            return False
+        with self._lock:
+            in_flight = sum(self._in_flight.values())
+        return in_flight + self.cost(size) <= remaining
+
+    def started(self, pkg, size):
+        with self._lock:
+            self._in_flight[pkg] = self.cost(size)
+
+    def finished(self, pkg):
+        with self._lock:
+            self._in_flight.pop(pkg, None)
+
+    def plan(self, packages):
+        '''
+        Yield the paths in packages in order, skipping any that aren't
+        expected to finish in time. Skipped packages are listed in
+        self.skipped, and are left for a later run.
+        '''
+        ordered = self.order(packages)
+        logging.info('Planned {} packages, {:.0f} MB'.format(
+            len(ordered), sum(size for _pkg, size in ordered) / (1024.0 * 1024)))
+        for pkg, size in ordered:
+            if self.expired() or not self.admit(pkg, size):
+                logging.info('Not enough time left for {}'.format(pkg))
+                self.skipped.append(pkg)
+                continue
+            self.started(pkg, size)
+            yield pkg
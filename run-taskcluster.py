@@ -8,15 +8,25 @@ system updates and upload them to crash-stats.mozilla.com.
 
 from __future__ import print_function
 
+import argparse
 import datetime
+import gzip
+import io
 import json
 import os
+import plistlib
+import requests
 import taskcluster
 
+import shards
+
 import requests.packages.urllib3
 requests.packages.urllib3.disable_warnings()
 
 
+INDEX_ARTIFACTS = 'https://index.taskcluster.net/v1/task/project.socorro.mac-update-symbols.latest/artifacts/public/build/'
+
+
 def local_file(filename):
     '''
     Return a path to a file next to this script.
@@ -66,17 +76,76 @@ def format_timedelta(d, **kwargs):
     return d.isoformat() + 'Z'
 
 
-def spawn_task(queue, keys, decision_task_id, template_file):
+def spawn_task(queue, keys, decision_task_id, template_file, dependencies=None):
     task_id = taskcluster.utils.slugId()
     with open(local_file(template_file), 'rb') as template:
         payload = fill_template(template, keys)
-        if decision_task_id and not payload.get('dependencies'):
+        if dependencies:
+            payload['dependencies'] = dependencies
+        elif decision_task_id and not payload.get('dependencies'):
             payload['dependencies'] = [decision_task_id]
         queue.createTask(task_id, payload)
     return task_id
 
 
+def read_artifact(location):
+    '''
+    Return the contents of a gzipped artifact from a URL or a local path,
+    or None if it doesn't exist.
+    '''
+    if '://' in location:
+        r = requests.get(location)
+        if r.status_code != 200:
+            return None
+        data = r.content
+    elif os.path.exists(location):
+        data = open(location, 'rb').read()
+    else:
+        return None
+    return gzip.GzipFile(fileobj=io.BytesIO(data)).read()
+
+
+def schedule_tasks(queue, keys, decision_task_id, shard_count=1,
+                   products=None, processed=()):
+    '''
+    Create the fetch and upload tasks. With more than one shard, products
+    (reposado product info) are split between shard_count fetch tasks,
+    balanced by the size of the packages that aren't in processed, and a
+    merge task combines their artifacts for the upload task. Returns the
+    id of the task whose artifacts are uploaded.
+    '''
+    if shard_count > 1 and products:
+        assignment = shards.assign_shards(products, shard_count, processed)
+        shard_task_ids = []
+        for i, shard in enumerate(assignment):
+            print('Shard {}: {} products'.format(i, len(shard)))
+            shard_keys = dict(keys, shard_index=i,
+                              shard_assignment=shards.dumps(assignment))
+            shard_task_ids.append(spawn_task(queue, shard_keys, decision_task_id,
+                                             'fetch-shard-task.json'))
+        merge_keys = dict(keys, shard_task_ids=' '.join(shard_task_ids))
+        fetch_task_id = spawn_task(queue, merge_keys, decision_task_id,
+                                   'merge-task.json', shard_task_ids)
+    else:
+        fetch_task_id = spawn_task(queue, keys, decision_task_id, 'fetch-task.json')
+    keys = dict(keys, fetch_task_id=fetch_task_id)
+    spawn_task(queue, keys, decision_task_id, 'upload-task.json')
+    return fetch_task_id
+
+
 def main():
+    parser = argparse.ArgumentParser(
+        description='Schedule tasks to fetch and upload symbols from Apple system updates.')
+    parser.add_argument('--shards', type=int,
+                        default=int(os.environ.get('FETCH_SHARDS', '1')),
+                        help='Number of fetch tasks to split the products between')
+    parser.add_argument('--product-info', default=INDEX_ARTIFACTS + 'product-info.plist.gz',
+                        help='URL or path of the gzipped reposado product info ' +
+                        'to balance shards with')
+    parser.add_argument('--processed-packages', default=INDEX_ARTIFACTS + 'processed-packages.gz',
+                        help='URL or path of the gzipped list of processed packages')
+    args = parser.parse_args()
+
     decision_task_id = os.environ.get('TASK_ID')
     if decision_task_id:
         task_group_id = decision_task_id
@@ -92,10 +161,17 @@ def main():
         'artifacts_expires': format_timedelta(now, days=180),
         'date_index': now.strftime('%Y%m%d%H%M%S'),
     }
+    products = None
+    processed = ()
+    if args.shards > 1:
+        product_info = read_artifact(args.product_info)
+        if product_info is None:
+            print('No product info, running a single fetch task')
+        else:
+            products = plistlib.readPlistFromString(product_info)
+            processed = (read_artifact(args.processed_packages) or '').splitlines()
     queue = taskcluster.Queue(options)
-    fetch_task_id = spawn_task(queue, keys, decision_task_id, "fetch-task.json")
-    keys['fetch_task_id'] = fetch_task_id
-    spawn_task(queue, keys, decision_task_id, "upload-task.json")
+    schedule_tasks(queue, keys, decision_task_id, args.shards, products, processed)
     print('https://tools.taskcluster.net/task-group-inspector/#/' + task_group_id)
 
 
@@ -8,18 +8,36 @@ export PATH="$PATH:/home/worker/bin:$base"
 
 cd /home/worker
 
+# The fetch task's maxRunTime, less half an hour to package and hand out
+# artifacts. Symbol dumping stops before this.
+deadline=$(( $(date +%s) + 28800 - 1800 ))
+
+touch processed-packages
 if test "$PROCESSED_PACKAGES"; then
   curl -L "$PROCESSED_PACKAGES" | gzip -dc > processed-packages
-  # Prevent reposado from downloading packages that have previously been
-  # dumped.
-  for f in `cat processed-packages`; do
-      mkdir -p `dirname $f`
-      touch $f
-  done
+fi
+# Per-package state, recorded as each package finishes.
+if test "$PACKAGE_STATE"; then
+  curl -fL "$PACKAGE_STATE" | gzip -dc > package-state.sqlite || rm -f package-state.sqlite
+fi
+
+# Symbols dumped by previous runs, so unchanged binaries aren't dumped or
+# uploaded again. The symbol archive only holds the symbols listed in
+# symbol-manifest.txt; symbol-index.gz is the full, compacted list.
+touch symbol-index
+if test "$SYMBOL_INDEX"; then
+  curl -fL "$SYMBOL_INDEX" | gzip -dc > symbol-index || echo "No previous symbol index"
 fi
 
 mkdir -p /opt/data-reposado/html /opt/data-reposado/metadata
 
+# repo_sync's catalogs, product info and digests from the previous run, so
+# that --incremental only fetches what changed since then. tar keeps the
+# catalogs' modification times, which repo_sync compares.
+if test "$REPO_SYNC_CACHE"; then
+  curl -fL "$REPO_SYNC_CACHE" | tar -xzf - -C /opt/data-reposado || echo "No previous repo_sync cache"
+fi
+
 # Make sure we're using the latest reposado.
 git clone https://github.com/wdas/reposado
 (cd reposado; python setup.py install)
@@ -27,20 +45,41 @@ git clone https://github.com/wdas/reposado
 # Use a patched copy of repo_sync
 cp "${base}/repo_sync" /home/worker/venv/bin/repo_sync
 
-# First, just fetch all the update info.
-repo_sync --no-download
+# First, just fetch the update info that changed since the last run.
+repo_sync --no-download --incremental
 
-# Next, fetch just the update packages we're interested in.
-repo_sync $(python "${base}/list-packages.py")
+# Next, fetch just the update packages we're interested in, skipping any
+# that have previously been dumped. With SHARD_ASSIGNMENT set, this task only
+# handles its own share of the products.
+mkdir -p artifacts
+product_ids=$(python "${base}/list-packages.py")
+if test -n "$SHARD_ASSIGNMENT" && test -z "$product_ids"; then
+  echo "No products in this shard"
+else
+  repo_sync --incremental --skip-list=/home/worker/processed-packages --metrics=/home/worker/artifacts/metrics.jsonl $product_ids
 
-du -sh /opt/data-reposado
+  du -sh /opt/data-reposado
 
-# Now scrape symbols out of anything that was downloaded.
-mkdir -p symbols artifacts
-python "${base}/PackageSymbolDumper.py" --tracking-file=/home/worker/processed-packages --dump_syms=/home/worker/bin/dump_syms_mac /opt/data-reposado/html/content/downloads /home/worker/symbols
+  # Now scrape symbols out of anything that was downloaded. Set
+  # PROFILE_PACKAGE to part of a package's path to profile it. If it dies
+  # part way through, it is run once more; the second run skips the
+  # binaries checkpointed in the state database and adds to the same
+  # archive.
+  dump_symbols() {
+    python "${base}/PackageSymbolDumper.py" --tracking-file=/home/worker/processed-packages --state-db=/home/worker/package-state.sqlite --symbol-index=/home/worker/symbol-index --manifest=/home/worker/artifacts/symbol-manifest.txt --dump_syms=/home/worker/bin/dump_syms_mac --reposado=/home/worker/venv/bin/ --zip-threads=$(nproc) --time-budget=$(( deadline - $(date +%s) )) --metrics=/home/worker/artifacts/metrics.jsonl ${PROFILE_PACKAGE:+--profile-package="$PROFILE_PACKAGE" --profile=/home/worker/artifacts/package.prof} $product_ids /opt/data-reposado/html/content/downloads /home/worker/artifacts/target.crashreporter-symbols.zip
+  }
+  dump_symbols || dump_symbols
+fi
 
 # Hand out artifacts
 gzip -c processed-packages > artifacts/processed-packages.gz
-
-cd symbols
-zip -r9 /home/worker/artifacts/target.crashreporter-symbols.zip * || echo "No symbols dumped"
+gzip -c symbol-index > artifacts/symbol-index.gz
+if test -e package-state.sqlite; then
+  gzip -c package-state.sqlite > artifacts/package-state.sqlite.gz
+fi
+# The decision task balances shards using this.
+gzip -c /opt/data-reposado/metadata/ProductInfo.plist > artifacts/product-info.plist.gz
+# For the next run's incremental repo_sync. The dated catalog archive isn't
+# needed.
+tar -czf artifacts/repo-sync-cache.tar.gz -C /opt/data-reposado --exclude=archive metadata html/content/catalogs
+python "${base}/metrics.py" artifacts/metrics.jsonl artifacts/metrics-summary.json
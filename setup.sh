@@ -4,12 +4,6 @@ set -v -e -x
 ncpu=-j`grep -c ^processor /proc/cpuinfo`
 
 WORK=`mktemp -d`
-cd $WORK
-git clone https://github.com/mackyle/xar xar
-cd xar/xar
-./autogen.sh --prefix=/home/worker
-make $ncpu && make install
-
 cd $WORK
 git clone -b from_zarvox https://github.com/andreas56/libdmg-hfsplus.git
 cd libdmg-hfsplus
@@ -36,6 +30,7 @@ strip /home/worker/bin/dump_syms_mac
 cd $WORK
 virtualenv /home/worker/venv
 . /home/worker/venv/bin/activate
+pip install requests futures backports.lzma scandir
 git clone https://github.com/wdas/reposado
 cd reposado
 python setup.py install
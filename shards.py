@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+shards.py
+
+Splits the products we fetch between several fetch tasks. The decision task
+assigns products to shards so that each shard has about the same number of
+bytes of unprocessed packages to download and dump; each fetch task then
+picks its own products out of that assignment. Products that appeared after
+the assignment was made are spread over the shards by a hash of their id.
+'''
+import heapq
+import json
+import posixpath
+import urlparse
+import zlib
+
+TITLE_PREFIXES = ('OS X', 'Mac OS X', 'macOS')
+
+# Packages are recorded in the tracking file by their local path in the
+# reposado mirror, which ends with the path of their URL from here on.
+DOWNLOADS_PATH = '/content/downloads/'
+
+
+def wanted_products(products):
+    '''
+    Return the ids of the products in reposado product info that we dump
+    symbols for.
+    '''
+    return [product_id for product_id, p in products.items()
+            if p.get('title', '').startswith(TITLE_PREFIXES)]
+
+
+def package_key(path):
+    '''
+    Return the part of a package URL or local mirror path that both have in
+    common, or None if it isn't in the downloads tree.
+    '''
+    path = urlparse.urlsplit(path).path
+    index = path.find(DOWNLOADS_PATH)
+    if index == -1:
+        return None
+    return posixpath.normpath(path[index:])
+
+
+def product_weight(product, processed=()):
+    '''
+    Return the total size of the packages of product that aren't in
+    processed, a set of package_key()s.
+    '''
+    weight = 0
+    for package in product.get('CatalogEntry', {}).get('Packages', []):
+        if package_key(package.get('URL', '')) not in processed:
+            weight += package.get('Size', 0)
+    return weight
+
+
+def partition(weights, count):
+    '''
+    Split the keys of weights, a dict mapping product ids to weights, into
+    count lists with roughly equal total weight: each product in turn,
+    heaviest first, goes to the lightest shard so far.
+    '''
+    shards = [[] for _ in range(count)]
+    heap = [(0, i) for i in range(count)]
+    for product_id in sorted(weights, key=lambda p: (-weights[p], p)):
+        total, i = heapq.heappop(heap)
+        shards[i].append(product_id)
+        heapq.heappush(heap, (total + weights[product_id], i))
+    return shards
+
+
+def assign_shards(products, count, processed=()):
+    '''
+    Return a list of count lists of the wanted product ids in products,
+    balanced by the size of their unprocessed packages.
+    '''
+    processed = set(filter(None, (package_key(p) for p in processed)))
+    weights = dict((product_id, product_weight(products[product_id], processed))
+                   for product_id in wanted_products(products))
+    return partition(weights, count)
+
+
+def shard_products(product_ids, assignment, index):
+    '''
+    Return the ids in product_ids that belong to shard index of
+    assignment, a list of lists of product ids.
+    '''
+    assigned = dict((product_id, i) for i, shard in enumerate(assignment)
+                    for product_id in shard)
+    count = len(assignment)
+    return [product_id for product_id in product_ids
+            if assigned.get(product_id,
+                            zlib.crc32(product_id.encode('utf-8')) % count) == index]
+
+
+def dumps(assignment):
+    '''
+    Serialize an assignment compactly enough to pass in an environment
+    variable.
+    '''
+    return json.dumps(assignment, separators=(',', ':'))
+
+
+def loads(data):
+    return json.loads(data)
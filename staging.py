@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+staging.py
+
+Hands out temporary directories for extracted payloads while keeping track
+of how much space they use. Each directory is reserved with an estimate of
+the space it will need; small ones go in a RAM-backed directory such as
+/dev/shm when there is room there, and the rest on disk. When a disk
+reservation would take the total over the disk budget, it waits for other
+directories to be released instead of filling the disk. A reservation is
+always granted when nothing else is held, so a payload larger than the
+whole budget still gets processed, on its own.
+'''
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+# Use at most this fraction of the free space on a filesystem by default.
+FREE_SPACE_FRACTION = 0.9
+# Payloads estimated to need no more than this go in the memory area.
+DEFAULT_SMALL_LIMIT = 256 * 1024 * 1024
+MEMORY_DIRS = ('/dev/shm',)
+
+
+def free_space(path):
+    '''
+    Return the bytes available to us on the filesystem holding path, or
+    None if it can't be determined.
+    '''
+    try:
+        st = os.statvfs(path)
+    except (OSError, AttributeError):
+        return None
+    return st.f_bavail * st.f_frsize
+
+
+def default_memory_dir():
+    '''
+    Return a writable RAM-backed directory, or None if there isn't one.
+    '''
+    for path in MEMORY_DIRS:
+        if os.path.isdir(path) and os.access(path, os.W_OK):
+            return path
+    return None
+
+
+def directory_size(path):
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.lstat(os.path.join(root, filename)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def shutil_error_handler(caller, path, excinfo):
+    logging.error('Could not remove "{path}": {info}'.format(path=path, info=excinfo))
+
+
+class Area(object):
+    '''
+    A directory to stage in, with the bytes reserved in it out of budget.
+    '''
+    def __init__(self, name, path, budget):
+        self.name = name
+        self.path = path
+        self.budget = budget
+        self.reserved = 0
+        self.count = 0
+
+    def fits(self, size):
+        return self.budget is None or self.reserved + size <= self.budget
+
+
+class Reservation(object):
+    '''
+    A temporary directory from StagingArea.reserve(). release() removes the
+    directory and returns its space to the budget.
+    '''
+    def __init__(self, staging, area, path, size):
+        self._staging = staging
+        self.area = area
+        self.path = path
+        self.size = size
+
+    def settle(self, size=None):
+        '''
+        Replace the estimate with the size actually used, measuring the
+        directory if size isn't given.
+        '''
+        if size is None:
+            size = directory_size(self.path)
+        self._staging._resize(self, size)
+
+    def release(self):
+        if self.path is None:
+            return
+        shutil.rmtree(self.path, onerror=shutil_error_handler)
+        self.path = None
+        self._staging._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+
+class StagingArea(object):
+    '''
+    Reserves temporary directories under disk_dir (the system temporary
+    directory if None), keeping the total estimated size under disk_budget
+    bytes; by default, most of the space that is free when it's created.
+    Reservations of up to small_limit bytes go under memory_dir instead
+    while they fit in memory_budget. There is no memory area if memory_dir
+    or memory_budget is None.
+    '''
+    def __init__(self, disk_dir=None, disk_budget=None, memory_dir=None,
+                 memory_budget=None, small_limit=DEFAULT_SMALL_LIMIT):
+        disk_dir = disk_dir or tempfile.gettempdir()
+        if disk_budget is None:
+            free = free_space(disk_dir)
+            if free is not None:
+                disk_budget = int(free * FREE_SPACE_FRACTION)
+        self.disk = Area('disk', disk_dir, disk_budget)
+        self.memory = None
+        if memory_dir is not None and memory_budget:
+            free = free_space(memory_dir)
+            if free is not None:
+                memory_budget = min(memory_budget, int(free * FREE_SPACE_FRACTION))
+            self.memory = Area('memory', memory_dir, memory_budget)
+        self.small_limit = small_limit
+        self._cond = threading.Condition()
+        self.waits = 0
+        logging.info('Staging in {} ({}), {}'.format(
+            disk_dir, 'unlimited' if disk_budget is None else '{} MB'.format(disk_budget >> 20),
+            'no memory area' if self.memory is None else 'and {} ({} MB)'.format(
+                self.memory.path, self.memory.budget >> 20)))
+
+    def _choose(self, size):
+        if (self.memory is not None and size <= self.small_limit and
+            self.memory.fits(size)):
+            return self.memory
+        if self.disk.fits(size) or self.disk.count == 0:
+            return self.disk
+        return None
+
+    def reserve(self, size, prefix='payload-'):
+        '''
+        Return a Reservation for a new temporary directory expected to need
+        size bytes, waiting until there is room for it.
+        '''
+        with self._cond:
+            area = self._choose(size)
+            if area is None:
+                self.waits += 1
+                logging.info('Waiting for {} MB of staging space ({} MB in use)'.format(
+                    size >> 20, self.disk.reserved >> 20))
+                while area is None:
+                    self._cond.wait()
+                    area = self._choose(size)
+            area.reserved += size
+            area.count += 1
+        try:
+            path = tempfile.mkdtemp(prefix=prefix, dir=area.path)
+        except (OSError, IOError):
+            with self._cond:
+                area.reserved -= size
+                area.count -= 1
+                self._cond.notify_all()
+            raise
+        return Reservation(self, area, path, size)
+
+    def _resize(self, reservation, size):
+        with self._cond:
+            reservation.area.reserved += size - reservation.size
+            reservation.size = size
+            self._cond.notify_all()
+
+    def _release(self, reservation):
+        with self._cond:
+            reservation.area.reserved -= reservation.size
+            reservation.area.count -= 1
+            reservation.size = 0
+            self._cond.notify_all()
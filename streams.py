@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+streams.py
+
+Small file-like adapters used to read installer packages in place.
+'''
+import os
+import threading
+
+
+class IterReader(object):
+    '''
+    A minimal file-like object reading from an iterable of byte strings, such
+    as the output of a streaming decompressor.
+    '''
+    def __init__(self, iterable):
+        self._iter = iter(iterable)
+        self._chunk = b''
+        self._offset = 0
+
+    def read(self, size=-1):
+        pieces = []
+        while size < 0 or size > 0:
+            if self._offset == len(self._chunk):
+                try:
+                    self._chunk = next(self._iter)
+                except StopIteration:
+                    break
+                self._offset = 0
+                continue
+            end = len(self._chunk) if size < 0 else min(len(self._chunk), self._offset + size)
+            pieces.append(self._chunk[self._offset:end])
+            if size > 0:
+                size -= end - self._offset
+            self._offset = end
+        return b''.join(pieces)
+
+
+class SectionReader(object):
+    '''
+    A seekable, read-only view of `length` bytes of the file object f
+    starting at `offset`. Sections can be nested; all sections over the same
+    underlying file share a lock, so they can be read from different threads.
+    '''
+    def __init__(self, f, offset, length):
+        self._f = f
+        self._start = offset
+        self._length = length
+        self._pos = 0
+        self.lock = getattr(f, 'lock', None) or threading.RLock()
+
+    def __len__(self):
+        return self._length
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._length
+        if offset < 0:
+            raise IOError('Invalid seek offset: {}'.format(offset))
+        self._pos = offset
+        return self._pos
+
+    def read(self, size=-1):
+        remaining = max(self._length - self._pos, 0)
+        if size < 0 or size > remaining:
+            size = remaining
+        if not size:
+            return b''
+        with self.lock:
+            self._f.seek(self._start + self._pos)
+            data = self._f.read(size)
+        self._pos += len(data)
+        return data
+
+
+class ExtentReader(object):
+    '''
+    A seekable, read-only view of a file stored in pieces of the file object
+    f, such as a fork of a file in a filesystem image. extents is a list of
+    (offset, length) byte ranges of f in logical order, and size is the
+    logical size of the file, which may end before the last extent does.
+    '''
+    def __init__(self, f, extents, size):
+        self._f = f
+        self._extents = []
+        start = 0
+        for offset, length in extents:
+            self._extents.append((start, offset, length))
+            start += length
+        if size > start:
+            raise IOError('Extents cover {} bytes of a {} byte file'.format(start, size))
+        self._length = size
+        self._pos = 0
+        self.lock = getattr(f, 'lock', None) or threading.RLock()
+
+    def __len__(self):
+        return self._length
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._length
+        if offset < 0:
+            raise IOError('Invalid seek offset: {}'.format(offset))
+        self._pos = offset
+        return self._pos
+
+    def read(self, size=-1):
+        remaining = max(self._length - self._pos, 0)
+        if size < 0 or size > remaining:
+            size = remaining
+        pieces = []
+        with self.lock:
+            for start, offset, length in self._extents:
+                if not size:
+                    break
+                if self._pos >= start + length:
+                    continue
+                skip = self._pos - start
+                count = min(length - skip, size)
+                self._f.seek(offset + skip)
+                data = self._f.read(count)
+                if len(data) != count:
+                    raise IOError('Extent at {} is truncated'.format(offset))
+                pieces.append(data)
+                self._pos += count
+                size -= count
+        return b''.join(pieces)
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+symbol_index.py
+
+A persistent record of the (debug_file, debug_id) pairs we already have
+symbols for, so binaries that ship unchanged in several updates are only
+dumped once. The index is a text file with one tab-separated pair per line;
+new pairs are appended when it is flushed, which should only be done once
+their symbol files are safely written, so it survives across runs the same
+way the processed-packages tracking file does.
+
+The pairs added by a run can also be written out as a manifest of what that
+run's symbol archive contains, and the index file is compacted (sorted, one
+line per pair) when it is closed.
+'''
+import logging
+import os
+import threading
+
+
+def parse_symbol_filename(filename):
+    '''
+    Return (debug_file, debug_id) for a Breakpad symbol file path of the
+    form debug_file/debug_id/debug_file.sym, or None if it doesn't match.
+    '''
+    parts = filename.replace(os.sep, '/').split('/')
+    if len(parts) != 3 or parts[2] != parts[0] + '.sym':
+        return None
+    return parts[0], parts[1]
+
+
+class SymbolIndex(object):
+    '''
+    The set of (debug_file, debug_id) pairs that have already been dumped,
+    optionally backed by the file at path.
+    '''
+    def __init__(self, path=None):
+        self.path = path
+        self._known = set()
+        self._new = []
+        self._unwritten = []
+        self._lock = threading.Lock()
+        self._file = None
+        if path is not None and os.path.exists(path):
+            logging.info('Reading symbol index from {}'.format(path))
+            with open(path, 'rb') as f:
+                for line in f:
+                    fields = line.decode('utf-8').rstrip('\n').split('\t')
+                    if len(fields) == 2:
+                        self._known.add(tuple(fields))
+            logging.info('Symbol index has {} entries'.format(len(self._known)))
+
+    def __len__(self):
+        return len(self._known)
+
+    def __contains__(self, key):
+        return key in self._known
+
+    def add(self, debug_file, debug_id):
+        '''
+        Record a dumped pair, to be appended to the index file by the next
+        flush(). Returns False if it was already known.
+        '''
+        key = (debug_file, debug_id)
+        with self._lock:
+            if key in self._known:
+                return False
+            self._known.add(key)
+            self._new.append(key)
+            self._unwritten.append(key)
+        return True
+
+    def flush(self):
+        '''
+        Append the pairs recorded since the last flush to the index file.
+        '''
+        with self._lock:
+            unwritten, self._unwritten = self._unwritten, []
+            if self.path is None or not unwritten:
+                return
+            if self._file is None:
+                self._file = open(self.path, 'ab')
+            self._file.write(u''.join(u'{}\t{}\n'.format(*key)
+                                      for key in unwritten).encode('utf-8'))
+            self._file.flush()
+
+    def adopt(self, keys):
+        '''
+        Count pairs as added by this run even if they were already known,
+        such as those whose symbol files an interrupted run left in the
+        archive this run is adding to.
+        '''
+        for key in keys:
+            self.add(*key)
+        with self._lock:
+            new = set(self._new)
+            for key in keys:
+                if key not in new:
+                    new.add(key)
+                    self._new.append(key)
+
+    def write_manifest(self, path, new_only=False):
+        '''
+        Write the pairs in the index, or only those added since it was
+        loaded, to path in the index file format, sorted, replacing path
+        atomically.
+        '''
+        with self._lock:
+            keys = sorted(self._new if new_only else self._known)
+        self._write(path, keys)
+
+    def _write(self, path, keys):
+        logging.info('Writing {} symbols to {}'.format(len(keys), path))
+        temp_file = path + '.tmp'
+        with open(temp_file, 'wb') as f:
+            for debug_file, debug_id in keys:
+                f.write(u'{}\t{}\n'.format(debug_file, debug_id).encode('utf-8'))
+        os.rename(temp_file, path)
+
+    def close(self):
+        '''
+        Close the index file, compacting it. Pairs that were never flushed
+        are left out, as their symbol files may not have been written.
+        '''
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            keys = sorted(self._known.difference(self._unwritten))
+        if self.path is not None and os.path.exists(self.path):
+            self._write(self.path, keys)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+symbol_sink.py
+
+Destinations for dumped symbol files. DirectorySink writes each file into a
+directory tree. ZipSink writes them straight into a zip archive as they
+arrive, so the archive is complete as soon as the last symbol file is
+added; it can compress files on a thread pool while earlier ones are being
+written.
+
+Sinks are written to from a single thread.
+'''
+import collections
+import concurrent.futures
+import errno
+import logging
+import os
+import struct
+import time
+import zlib
+
+ZIP_DEFLATED = 8
+ZIP_VERSION = 20
+ZIP64_VERSION = 45
+ZIP_MADE_ON_UNIX = 3 << 8
+# Set for names that are UTF-8 rather than code page 437.
+ZIP_UTF8_FLAG = 0x800
+ZIP64_LIMIT = 0xffffffff
+ZIP64_COUNT_LIMIT = 0xffff
+
+LOCAL_HEADER = struct.Struct('<4sHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<4sHHHHHHIIIHHHHHII')
+END_OF_CENTRAL_DIRECTORY = struct.Struct('<4sHHHHIIH')
+ZIP64_END_OF_CENTRAL_DIRECTORY = struct.Struct('<4sQHHIIQQQQ')
+ZIP64_LOCATOR = struct.Struct('<4sIQI')
+ZIP64_EXTRA_ID = 0x0001
+
+DEFAULT_LEVEL = 9
+
+
+class DirectorySink(object):
+    '''
+    Writes symbol files under the directory path.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.recovered = ()
+
+    def add(self, filename, contents):
+        full_path = os.path.join(self.path, filename)
+        try:
+            os.makedirs(os.path.dirname(full_path))
+        except os.error as e:
+            if e.errno != errno.EEXIST:
+                raise
+        with open(full_path, 'wb') as f:
+            f.write(contents)
+        self.count += 1
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _dos_time(timestamp):
+    t = time.localtime(timestamp)
+    return ((t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+            ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday)
+
+
+def compress(contents, level):
+    '''
+    Return (crc32, raw deflate data) for contents.
+    '''
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return (zlib.crc32(contents) & 0xffffffff,
+            compressor.compress(contents) + compressor.flush())
+
+
+class ZipEntry(object):
+    def __init__(self, name, crc, compressed_size, size, offset, dos_time, dos_date):
+        self.name = name
+        self.crc = crc
+        self.compressed_size = compressed_size
+        self.size = size
+        self.offset = offset
+        self.dos_time = dos_time
+        self.dos_date = dos_date
+
+
+class ZipSink(object):
+    '''
+    Writes symbol files into a new zip archive at path, deflated at the
+    given zlib level. If threads is more than one, files are compressed on
+    that many threads (zlib releases the GIL while it works), and written in
+    the order they were added. An archive with no files in it is removed
+    when the sink is closed.
+
+    If append is True and path exists, the files already in it are kept
+    and new ones are added after them; recovered lists their names.
+    '''
+    def __init__(self, path, level=DEFAULT_LEVEL, threads=None, append=False):
+        self.path = path
+        self.level = level
+        self._executor = None
+        if threads and threads > 1:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self._window = 2 * (threads or 1)
+        self._pending = collections.deque()
+        self._entries = []
+        self._names = set()
+        self._offset = 0
+        self.recovered = []
+        if append and os.path.exists(path):
+            self._f = open(path, 'r+b')
+            self._recover()
+        else:
+            self._f = open(path, 'wb')
+
+    @property
+    def count(self):
+        return len(self._entries)
+
+    def add(self, filename, contents):
+        name = filename.replace(os.sep, '/')
+        if name in self._names:
+            logging.debug('Already have {}'.format(name))
+            return
+        self._names.add(name)
+        if self._executor is None:
+            self._write(name, len(contents), *compress(contents, self.level))
+            return
+        self._pending.append((name, len(contents),
+                              self._executor.submit(compress, contents, self.level)))
+        while len(self._pending) > self._window or (self._pending and self._pending[0][2].done()):
+            self._write_next()
+
+    def add_deflated(self, filename, size, crc, data):
+        '''
+        Add a file that is already raw-deflated, such as one copied out of
+        another zip archive.
+        '''
+        name = filename.replace(os.sep, '/')
+        if name in self._names:
+            logging.debug('Already have {}'.format(name))
+            return
+        self._names.add(name)
+        while self._pending:
+            self._write_next()
+        self._write(name, size, crc, data)
+
+    def _recover(self):
+        '''
+        Read the local headers of the files in an existing archive, stopping
+        at its central directory or at a file that was cut short, and cut
+        the archive off there so that new files can be written after it.
+        '''
+        self._f.seek(0, os.SEEK_END)
+        file_size = self._f.tell()
+        offset = 0
+        while offset + LOCAL_HEADER.size <= file_size:
+            self._f.seek(offset)
+            (signature, _version, flags, method, dos_time, dos_date, crc,
+             compressed_size, size, name_length, extra_length) = \
+                LOCAL_HEADER.unpack(self._f.read(LOCAL_HEADER.size))
+            # Only files as this class writes them can be kept, since the
+            # central directory is written from what is read here.
+            if (signature != b'PK\x03\x04' or method != ZIP_DEFLATED or
+                flags & ~ZIP_UTF8_FLAG or extra_length):
+                break
+            end = offset + LOCAL_HEADER.size + name_length + compressed_size
+            if end > file_size:
+                break
+            encoded_name = self._f.read(name_length)
+            self._entries.append(ZipEntry(encoded_name, crc, compressed_size, size,
+                                          offset, dos_time, dos_date))
+            self._names.add(encoded_name.decode('utf-8'))
+            self.recovered.append(encoded_name.decode('utf-8'))
+            offset = end
+        self._f.seek(offset)
+        self._f.truncate()
+        self._offset = offset
+        logging.info('Appending to {}, which has {} files'.format(self.path, len(self._entries)))
+
+    def flush(self):
+        '''
+        Write out every file added so far and make sure it has reached the
+        disk.
+        '''
+        while self._pending:
+            self._write_next()
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def _write_next(self):
+        name, size, future = self._pending.popleft()
+        self._write(name, size, *future.result())
+
+    def _write(self, name, size, crc, data):
+        if size >= ZIP64_LIMIT or len(data) >= ZIP64_LIMIT:
+            raise ValueError('{} is too large to store'.format(name))
+        encoded_name = name.encode('utf-8')
+        dos_time, dos_date = _dos_time(time.time())
+        self._f.write(LOCAL_HEADER.pack(b'PK\x03\x04', ZIP_VERSION, ZIP_UTF8_FLAG,
+                                        ZIP_DEFLATED, dos_time, dos_date, crc,
+                                        len(data), size, len(encoded_name), 0))
+        self._f.write(encoded_name)
+        self._f.write(data)
+        self._entries.append(ZipEntry(encoded_name, crc, len(data), size,
+                                      self._offset, dos_time, dos_date))
+        self._offset += LOCAL_HEADER.size + len(encoded_name) + len(data)
+
+    def _write_central_directory(self):
+        start = self._offset
+        for entry in self._entries:
+            extra = b''
+            offset = entry.offset
+            version = ZIP_VERSION
+            if offset >= ZIP64_LIMIT:
+                extra = struct.pack('<HHQ', ZIP64_EXTRA_ID, 8, offset)
+                offset = ZIP64_LIMIT
+                version = ZIP64_VERSION
+            # Made on Unix, so the external attributes are a file mode.
+            self._f.write(CENTRAL_HEADER.pack(b'PK\x01\x02', ZIP_MADE_ON_UNIX | version, version,
+                                              ZIP_UTF8_FLAG, ZIP_DEFLATED,
+                                              entry.dos_time, entry.dos_date, entry.crc,
+                                              entry.compressed_size, entry.size,
+                                              len(entry.name), len(extra), 0, 0, 0,
+                                              0o100644 << 16, offset))
+            self._f.write(entry.name)
+            self._f.write(extra)
+        end = self._f.tell()
+        size = end - start
+        count = len(self._entries)
+        if count >= ZIP64_COUNT_LIMIT or start >= ZIP64_LIMIT or size >= ZIP64_LIMIT:
+            self._f.write(ZIP64_END_OF_CENTRAL_DIRECTORY.pack(
+                b'PK\x06\x06', ZIP64_END_OF_CENTRAL_DIRECTORY.size - 12,
+                ZIP64_VERSION, ZIP64_VERSION, 0, 0, count, count, size, start))
+            self._f.write(ZIP64_LOCATOR.pack(b'PK\x06\x07', 0, end, 1))
+            count = min(count, ZIP64_COUNT_LIMIT)
+            size = min(size, ZIP64_LIMIT)
+            start = min(start, ZIP64_LIMIT)
+        self._f.write(END_OF_CENTRAL_DIRECTORY.pack(b'PK\x05\x06', 0, 0, count, count,
+                                                    size, start, 0))
+
+    def close(self):
+        if self._f is None:
+            return
+        try:
+            while self._pending:
+                self._write_next()
+            self._write_central_directory()
+        finally:
+            self._f.close()
+            self._f = None
+            if self._executor is not None:
+                self._executor.shutdown()
+        if not self._entries:
+            logging.info('No symbols written, removing {}'.format(self.path))
+            os.unlink(self.path)
+
+
+def open_sink(path, level=DEFAULT_LEVEL, threads=None, append=False):
+    '''
+    Return a ZipSink for path if it names a .zip file, or a DirectorySink
+    otherwise.
+    '''
+    if os.path.splitext(path)[1] == '.zip':
+        return ZipSink(path, level, threads, append)
+    return DirectorySink(path)
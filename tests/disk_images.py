@@ -0,0 +1,160 @@
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+Builds small UDIF disk images holding an HFS+ volume, laid out the way
+udif and hfsplus read them, for tests that need an update to download.
+'''
+import plistlib
+import posixpath
+import struct
+import zlib
+
+BLOCK_SIZE = 4096
+NODE_SIZE = 4096
+SECTOR_SIZE = 512
+# Sectors per chunk of the disk image.
+CHUNK_SECTORS = 64
+ROOT_FOLDER_ID = 2
+FIRST_FILE_ID = 16
+# Blocks before the first B-tree node; the volume header is in block 0.
+CATALOG_BLOCK = 2
+
+
+def _fork(size, extents):
+    data = b''.join(struct.pack('>II', start, count) for start, count in extents)
+    return (struct.pack('>QII', size, 0, sum(count for _, count in extents)) +
+            data.ljust(64, b'\0'))
+
+
+def _node(kind, records, height):
+    body = struct.pack('>IIbBHH', 0, 0, kind, height, len(records), 0)
+    offsets = []
+    for record in records:
+        offsets.append(len(body))
+        body += record
+    offsets.append(len(body))
+    tail = b''.join(struct.pack('>H', offset) for offset in reversed(offsets))
+    if len(body) + len(tail) > NODE_SIZE:
+        raise ValueError('Too many files for one catalog leaf node')
+    return body.ljust(NODE_SIZE - len(tail), b'\0') + tail
+
+
+def _catalog_key(parent_id, name):
+    encoded = name.encode('utf-16-be')
+    key = struct.pack('>IH', parent_id, len(encoded) // 2) + encoded
+    return struct.pack('>H', len(key)) + key
+
+
+def _folder_record(parent_id, name, folder_id):
+    return _catalog_key(parent_id, name) + struct.pack('>hHII', 1, 0, 0, folder_id).ljust(88, b'\0')
+
+
+def _file_record(parent_id, name, file_id, size, extents):
+    return (_catalog_key(parent_id, name) + struct.pack('>hHII', 2, 0, 0, file_id).ljust(88, b'\0') +
+            _fork(size, extents) + _fork(0, []))
+
+
+def make_hfs_volume(files):
+    '''
+    Return an HFS+ volume holding files, a list of (path, data), with each
+    file's data in one extent. Folders are created as needed.
+    '''
+    folders = {'': ROOT_FOLDER_ID}
+    records = [(1, u'Volume', _folder_record(1, u'Volume', ROOT_FOLDER_ID))]
+    next_id = [FIRST_FILE_ID]
+
+    def folder_id(path):
+        if path not in folders:
+            parent = folder_id(posixpath.dirname(path))
+            name = posixpath.basename(path)
+            folders[path] = next_id[0]
+            next_id[0] += 1
+            records.append((parent, name, _folder_record(parent, name, folders[path])))
+        return folders[path]
+
+    block = CATALOG_BLOCK + 2 * NODE_SIZE // BLOCK_SIZE
+    contents = []
+    for path, data in files:
+        path = path if isinstance(path, type(u'')) else path.decode('utf-8')
+        parent = folder_id(posixpath.dirname(path))
+        name = posixpath.basename(path)
+        count = -(-len(data) // BLOCK_SIZE)
+        records.append((parent, name, _file_record(parent, name, next_id[0], len(data),
+                                                   [(block, count)] if count else [])))
+        next_id[0] += 1
+        contents.append((block, data))
+        block += count
+
+    volume = bytearray(block * BLOCK_SIZE)
+    # The catalog is a header node followed by a single leaf node.
+    header = struct.pack('>HIIIIHHII', 1, 1, len(records), 1, 1, NODE_SIZE, 516, 2, 0)
+    catalog = (_node(1, [header.ljust(106, b'\0'), b'\0' * 128,
+                         b'\0' * (NODE_SIZE - 14 - 106 - 128 - 8)], 0) +
+               _node(-1, [record for _, _, record in sorted(records)], 1))
+    volume[CATALOG_BLOCK * BLOCK_SIZE:CATALOG_BLOCK * BLOCK_SIZE + len(catalog)] = catalog
+    for start, data in contents:
+        volume[start * BLOCK_SIZE:start * BLOCK_SIZE + len(data)] = data
+    volume_header = struct.pack('>2sHI', b'H+', 4, 0).ljust(40, b'\0')
+    volume_header += struct.pack('>II', BLOCK_SIZE, block).ljust(112 - 40, b'\0')
+    volume_header += _fork(0, []) * 2
+    volume_header += _fork(len(catalog), [(CATALOG_BLOCK, len(catalog) // BLOCK_SIZE)])
+    volume[1024:1024 + SECTOR_SIZE] = volume_header.ljust(SECTOR_SIZE, b'\0')
+    return bytes(volume)
+
+
+def _plist_bytes(value):
+    if hasattr(plistlib, 'dumps'):
+        return plistlib.dumps(value)
+    return plistlib.writePlistToString(value)
+
+
+def _plist_data(data):
+    if hasattr(plistlib, 'Data') and not hasattr(plistlib, 'dumps'):
+        return plistlib.Data(data)
+    return data
+
+
+def write_dmg(path, partitions):
+    '''
+    Write a UDIF disk image to path holding partitions, a list of (name,
+    data) whose data is a whole number of sectors. Chunks alternate between
+    zlib and raw, and empty ones are stored as zeros.
+    '''
+    data_fork = b''
+    blkx = []
+    for name, data in partitions:
+        start = len(data_fork)
+        sectors = len(data) // SECTOR_SIZE
+        chunks = []
+        for sector in range(0, sectors, CHUNK_SECTORS):
+            piece = data[sector * SECTOR_SIZE:(sector + CHUNK_SECTORS) * SECTOR_SIZE]
+            count = len(piece) // SECTOR_SIZE
+            offset = len(data_fork) - start
+            if not piece.strip(b'\0'):
+                chunks.append(struct.pack('>IIQQQQ', 0, 0, sector, count, offset, 0))
+                continue
+            if (sector // CHUNK_SECTORS) % 2:
+                kind, stored = 0x00000001, piece
+            else:
+                kind, stored = 0x80000005, zlib.compress(piece)
+            chunks.append(struct.pack('>IIQQQQ', kind, 0, sector, count, offset, len(stored)))
+            data_fork += stored
+        chunks.append(struct.pack('>IIQQQQ', 0xffffffff, 0, sectors, 0,
+                                  len(data_fork) - start, 0))
+        mish = struct.pack('>4sIQQQII24sII128sI', b'mish', 1, 0, sectors, start, 0, 0, b'',
+                           0, 0, b'', len(chunks))
+        blkx.append({'Name': name, 'ID': str(len(blkx)),
+                     'Data': _plist_data(mish + b''.join(chunks))})
+    xml = _plist_bytes({'resource-fork': {'blkx': blkx}})
+    koly = struct.pack('>4sIIIQQQQQII16sII128sQQ', b'koly', 4, 512, 1, 0, 0, len(data_fork),
+                       0, 0, 1, 1, b'', 0, 0, b'', len(data_fork), len(xml))
+    with open(path, 'wb') as f:
+        f.write(data_fork + xml + koly.ljust(512, b'\0'))
+
+
+def write_update_dmg(path, files):
+    '''
+    Write a disk image to path shaped like an OS X update: a protective MBR
+    partition, then an HFS+ partition holding files.
+    '''
+    write_dmg(path, [('Protective Master Boot Record (MBR : 0)', b'\0' * SECTOR_SIZE),
+                     ('disk image (Apple_HFS : 1)', make_hfs_volume(files))])
@@ -0,0 +1,173 @@
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+Shared setup for the tests: puts the repository and the benchmark fixtures
+on sys.path, loads the scripts whose names aren't importable, and serves
+files over HTTP the way Apple's servers do.
+'''
+import email.utils
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS_DIR = os.path.join(REPO_DIR, 'benchmarks')
+for path in (BENCHMARKS_DIR, REPO_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+FAKE_DUMP_SYMS = os.path.join(BENCHMARKS_DIR, 'fake_dump_syms.py')
+
+_RANGE_RE = re.compile(r'^bytes=(\d+)-(\d*)$')
+
+
+def load_script(filename):
+    '''
+    Import the script filename from the top of the repository as a module.
+    '''
+    path = os.path.join(REPO_DIR, filename)
+    name = os.path.splitext(filename)[0].replace('-', '_')
+    try:
+        import importlib.machinery
+        import importlib.util
+    except ImportError:
+        import imp
+        # Don't leave a compiled copy of the script next to it.
+        sys.dont_write_bytecode, saved = True, sys.dont_write_bytecode
+        try:
+            return imp.load_source(name, path)
+        finally:
+            sys.dont_write_bytecode = saved
+    loader = importlib.machinery.SourceFileLoader(name, path)
+    spec = importlib.util.spec_from_file_location(name, path, loader=loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body):
+        owner = self.server.owner
+        path = self.path.split('?')[0]
+        owner.record(self.command, self.path, self.headers)
+        try:
+            full_path = os.path.join(owner.root, path.lstrip('/'))
+            if path in owner.failing or not os.path.isfile(full_path):
+                self.send_response(404 if path not in owner.failing else 500)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            if send_body:
+                time.sleep(owner.delay)
+            with open(full_path, 'rb') as f:
+                data = f.read()
+            etag = '"{}"'.format(hashlib.sha1(data).hexdigest())
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            match = _RANGE_RE.match(self.headers.get('Range', ''))
+            if match and int(match.group(1)) < len(data):
+                start = int(match.group(1))
+                end = int(match.group(2)) if match.group(2) else len(data) - 1
+                body = data[start:end + 1]
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                    start, start + len(body) - 1, len(data)))
+            else:
+                body = data
+                self.send_response(200)
+            self.send_header('ETag', etag)
+            self.send_header('Last-Modified', email.utils.formatdate(
+                os.path.getmtime(full_path), usegmt=True))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if not send_body:
+                return
+            if path in owner.truncated:
+                # Hang up half way through.
+                self.wfile.write(body[:len(body) // 2])
+                self.close_connection = True
+                return
+            self.wfile.write(body)
+        finally:
+            owner.finished()
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FileServer(object):
+    '''
+    Serves the files under root over HTTP from a thread on a free local
+    port, with ETag and Last-Modified validators and byte ranges.
+
+    Every request is recorded in requests as a (method, path, headers)
+    tuple. Requests for paths in failing get a 500 response, and responses
+    for paths in truncated are cut off half way through. Each body is sent
+    after a delay of delay seconds, and max_active is the most requests
+    that were handled at once.
+    '''
+    def __init__(self, root, delay=0):
+        self.root = root
+        self.delay = delay
+        self.failing = set()
+        self.truncated = set()
+        self.requests = []
+        self.max_active = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._server = _Server(('127.0.0.1', 0), _Handler)
+        self._server.owner = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name='file-server')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def url(self, path):
+        return 'http://127.0.0.1:{}/{}'.format(self._server.server_address[1], path.lstrip('/'))
+
+    def record(self, method, path, headers):
+        with self._lock:
+            self.requests.append((method, path, dict((k.lower(), v) for k, v in headers.items())))
+            self._active += 1
+            self.max_active = max(self.max_active, self._active)
+
+    def finished(self):
+        with self._lock:
+            self._active -= 1
+
+    def requested(self, method='GET'):
+        '''
+        Return the paths requested with method, in order.
+        '''
+        with self._lock:
+            return [path for m, path, _headers in self.requests if m == method]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
@@ -0,0 +1,69 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import copy
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from helpers import BENCHMARKS_DIR
+
+import run
+
+RUN = os.path.join(BENCHMARKS_DIR, 'run.py')
+
+
+class RunTest(unittest.TestCase):
+    '''
+    Runs the benchmarks on a tiny fixture, to check that they still work
+    rather than to measure anything.
+    '''
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.output = os.path.join(self.temp_dir, 'results.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def run_benchmarks(self, *args):
+        with open(os.devnull, 'wb') as devnull:
+            return subprocess.call([sys.executable, RUN,
+                                    '--fixtures', os.path.join(self.temp_dir, 'fixtures'),
+                                    '--size', '256K', '--compression', 'gzip', '--repeat', '1',
+                                    '--output', self.output] + list(args),
+                                   stdout=devnull, stderr=devnull)
+
+    def test_smoke(self):
+        self.assertEqual(self.run_benchmarks(), 0)
+        with open(self.output, 'rb') as f:
+            results = json.loads(f.read().decode('utf-8'))
+        self.assertEqual([r['stage'] for r in results['results']], list(run.STAGES))
+        for result in results['results']:
+            self.assertEqual(result['package'], 'bench-gzip-256K-1.pkg')
+            self.assertGreater(result['seconds'], 0)
+            self.assertGreater(result['bytes_in'], 0)
+
+        # Comparing with itself, nothing has regressed...
+        baseline = os.path.join(self.temp_dir, 'baseline.json')
+        shutil.copy(self.output, baseline)
+        saved_stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            self.assertEqual(run.compare(results, results), 0)
+            # ...but everything has against a baseline twice as fast.
+            faster = copy.deepcopy(results)
+            for result in faster['results']:
+                result['mb_per_second'] *= 2
+            self.assertEqual(run.compare(faster, results), len(run.STAGES))
+        finally:
+            sys.stdout.close()
+            sys.stdout = saved_stdout
+        # The fixture is reused on the next run. Timings this short vary
+        # too much to be compared at the usual threshold.
+        self.assertEqual(self.run_benchmarks('--stage', 'expand', '--compare', baseline,
+                                             '--threshold', '1'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
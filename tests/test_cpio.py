@@ -0,0 +1,155 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+import helpers  # noqa: F401
+
+import cpio
+import fixtures
+import macho
+from PackageSymbolDumper import extract_binaries
+
+REG = 0o100755
+DIR = 0o040755
+SYMLINK = 0o120755
+
+
+def odc_archive(entries):
+    '''
+    Return an odc cpio archive of entries, a list of (name, mode, data).
+    '''
+    f = io.BytesIO()
+    writer = fixtures.CpioWriter(f)
+    for name, mode, data in entries:
+        writer.add(name, mode, data)
+    writer.close()
+    return f.getvalue()
+
+
+def newc_entry(name, mode, data=b'', ino=1, nlink=1, magic='070701'):
+    encoded = name.encode('utf-8') + b'\0'
+    header = (magic + '{:08x}' * 13).format(ino, mode, 0, 0, nlink, 0, len(data), 0, 0, 0, 0,
+                                            len(encoded), 0).encode('ascii')
+    return (header + encoded + b'\0' * (-(len(header) + len(encoded)) % 4) +
+            data + b'\0' * (-len(data) % 4))
+
+
+def newc_archive(entries, magic='070701'):
+    '''
+    Return a newc cpio archive of entries, a list of (name, mode, data) or
+    (name, mode, data, ino, nlink).
+    '''
+    return b''.join([newc_entry(*entry, magic=magic) for entry in entries] +
+                    [newc_entry(cpio.TRAILER, 0, magic=magic)])
+
+
+def read_all(archive):
+    return [(e.name, e.mode, e.read()) for e in cpio.CpioReader(io.BytesIO(archive))]
+
+
+class CpioReaderTest(unittest.TestCase):
+    # Names and sizes covering every amount of padding.
+    ENTRIES = [('a' * n, REG, b'x' * (n + 3)) for n in range(1, 6)] + [('dir', DIR, b'')]
+
+    def test_odc(self):
+        self.assertEqual(read_all(odc_archive(self.ENTRIES)), self.ENTRIES)
+
+    def test_newc(self):
+        for magic in (cpio.NEWC_MAGIC, cpio.CRC_MAGIC):
+            archive = newc_archive(self.ENTRIES, magic.decode('ascii'))
+            self.assertEqual(read_all(archive), self.ENTRIES)
+
+    def test_unread_data_is_skipped(self):
+        for archive in (odc_archive(self.ENTRIES), newc_archive(self.ENTRIES)):
+            entries = cpio.CpioReader(io.BytesIO(archive))
+            names = []
+            for n, entry in enumerate(entries):
+                names.append(entry.name)
+                if n == 2:
+                    # A partial read leaves the rest to be skipped.
+                    self.assertEqual(entry.read(2), b'xx')
+            self.assertEqual(names, [name for name, _, _ in self.ENTRIES])
+
+    def test_entry_types(self):
+        archive = odc_archive([('d', DIR, b''), ('f', REG, b'f'), ('l', SYMLINK, b'f')])
+        kinds = [(e.isdir(), e.isreg(), e.issym()) for e in cpio.CpioReader(io.BytesIO(archive))]
+        self.assertEqual(kinds, [(True, False, False), (False, True, False),
+                                 (False, False, True)])
+
+    def test_truncated(self):
+        for archive in (odc_archive(self.ENTRIES), newc_archive(self.ENTRIES)):
+            # Cut in a header, in a name, in data and before the trailer.
+            for length in (3, 50, 80, 120, len(archive) - 20):
+                self.assertRaises(cpio.CpioError, read_all, archive[:length])
+
+    def test_malformed_header(self):
+        archive = odc_archive(self.ENTRIES)
+        # A mode that isn't octal.
+        self.assertRaises(cpio.CpioError, read_all, archive[:18] + b'9' + archive[19:])
+        archive = newc_archive(self.ENTRIES)
+        self.assertRaises(cpio.CpioError, read_all, archive[:14] + b'zz' + archive[16:])
+        self.assertRaises(cpio.CpioError, read_all, b'070717' + archive[6:])
+        self.assertRaises(cpio.CpioError, read_all, b'\x1f\x8b' + archive)
+
+
+class NormalizeNameTest(unittest.TestCase):
+    def test_relative_names(self):
+        self.assertEqual(cpio.normalize_name('./usr/lib/libA.dylib'), 'usr/lib/libA.dylib')
+        self.assertEqual(cpio.normalize_name('usr//lib/./libA.dylib'), 'usr/lib/libA.dylib')
+        self.assertEqual(cpio.normalize_name('usr/lib/x/../libA.dylib'), 'usr/lib/libA.dylib')
+
+    def test_escaping_names(self):
+        for name in ('.', './', '..', '../usr/lib/libA.dylib', 'usr/../../libA.dylib',
+                     '/usr/lib/libA.dylib', '//etc/passwd'):
+            self.assertIsNone(cpio.normalize_name(name), name)
+
+
+class ExtractBinariesTest(unittest.TestCase):
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
+
+    def binary(self, name):
+        return fixtures.thin_macho(macho.CPU_TYPE_X86_64, 3,
+                                   fixtures.make_uuid(1, name, 'x86_64'), b'\0' * 64)
+
+    def extracted(self):
+        return sorted(os.path.relpath(os.path.join(root, name), self.output)
+                      for root, _dirs, files in os.walk(self.output) for name in files)
+
+    def test_only_binaries_are_extracted(self):
+        fat = fixtures.fat_macho([(macho.CPU_TYPE_X86_64, 3, self.binary('fat')),
+                                  (macho.CPU_TYPE_ARM64, 2, self.binary('fat'))])
+        archive = newc_archive([
+            ('./usr/lib', DIR, b''),
+            ('./usr/lib/libA.dylib', REG, self.binary('libA')),
+            ('./usr/lib/libFat.dylib', REG, fat),
+            ('./usr/lib/readme.txt', REG, b'Not a binary'),
+            ('./usr/lib/tiny', REG, b'\xcf'),
+            ('./usr/bin/tool', REG, self.binary('tool')),
+            ('./System/Library/Frameworks/A.framework/A', REG, self.binary('A')),
+            ('./System/Library/Frameworks/A.framework/Current', SYMLINK, b'A'),
+            ('./usr/lib/libLink.dylib', SYMLINK, b'libA.dylib'),
+            ('../usr/lib/libEvil.dylib', REG, self.binary('evil')),
+            ('/usr/lib/libAbsolute.dylib', REG, self.binary('absolute')),
+            # newc stores the data of hard links with the last of them; the
+            # others are empty and skipped.
+            ('./usr/lib/libH.dylib', REG, b'', 7, 2),
+            ('./usr/lib/libH2.dylib', REG, self.binary('libH'), 7, 2),
+        ])
+        count = extract_binaries(cpio.CpioReader(io.BytesIO(archive)), self.output)
+        self.assertEqual(self.extracted(), ['System/Library/Frameworks/A.framework/A',
+                                            'usr/lib/libA.dylib', 'usr/lib/libFat.dylib',
+                                            'usr/lib/libH2.dylib'])
+        self.assertEqual(count, 4)
+        with open(os.path.join(self.output, 'usr/lib/libFat.dylib'), 'rb') as f:
+            self.assertEqual(f.read(), fat)
+
+
+if __name__ == '__main__':
+    unittest.main()
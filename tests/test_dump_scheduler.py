@@ -0,0 +1,135 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import unittest
+
+import helpers  # noqa: F401
+
+from dump_scheduler import DumpScheduler, DumpTask
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log = os.path.join(self.temp_dir, 'log')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write_dump_syms(self, body):
+        '''
+        Write a dump_syms shell script running body, with the name of the
+        binary in $name, and return its path.
+        '''
+        path = os.path.join(self.temp_dir, 'dump_syms')
+        with open(path, 'w') as f:
+            f.write('#!/bin/sh\nname=$(basename "$3")\nlog={}\n{}\n'.format(self.log, body))
+        os.chmod(path, stat.S_IRWXU)
+        return path
+
+    def task(self, name, size, memory=None):
+        task = DumpTask(os.path.join(self.temp_dir, name), name, 'x86_64', size)
+        if memory is not None:
+            task.memory = memory
+        return task
+
+    def events(self):
+        with open(self.log) as f:
+            return [line.split() for line in f]
+
+
+class OrderTest(SchedulerTestCase):
+    def setUp(self):
+        SchedulerTestCase.setUp(self)
+        self.dump_syms = self.write_dump_syms(
+            'echo start $name >> $log\nsleep 0.2\necho end $name >> $log\n'
+            'echo MODULE mac x86_64 0123456789ABCDEF0 $name')
+
+    def dump(self, tasks, **kwargs):
+        scheduler = DumpScheduler(self.dump_syms, **kwargs)
+        try:
+            results = list(scheduler.dump(tasks))
+        finally:
+            scheduler.close()
+        self.assertEqual([r.error for r in results], [None] * len(tasks))
+        return results
+
+    def test_largest_first(self):
+        tasks = [self.task('lib{}'.format(size), size) for size in (1, 5, 3, 4, 2)]
+        results = self.dump(tasks, processes=1, memory_budget=None)
+        started = [name for event, name in self.events() if event == 'start']
+        self.assertEqual(started, ['lib5', 'lib4', 'lib3', 'lib2', 'lib1'])
+        self.assertEqual([r.task.name for r in results], started)
+        self.assertEqual(results[0].filename, 'lib5/0123456789ABCDEF0/lib5.sym')
+
+    def test_memory_budget(self):
+        tasks = [self.task('lib{}'.format(n), 10 + n, memory=40) for n in range(4)]
+        # Bigger than the whole budget; it runs, but on its own.
+        tasks.append(self.task('huge', 5, memory=500))
+        self.dump(tasks, processes=4, memory_budget=100)
+        running = set()
+        most = 0
+        for event, name in self.events():
+            if event == 'start':
+                running.add(name)
+                if 'huge' in running:
+                    self.assertEqual(running, set(['huge']))
+                most = max(most, len(running))
+            else:
+                running.remove(name)
+        self.assertEqual(most, 2)
+
+
+class TimeoutTest(SchedulerTestCase):
+    def test_timeout_kills_dump_syms(self):
+        # exec, so that killing the process closes its output.
+        dump_syms = self.write_dump_syms(
+            'if [ $name = slow ]; then echo $$ >> $log; exec sleep 60; fi\n'
+            'echo MODULE mac x86_64 0123456789ABCDEF0 $name')
+        scheduler = DumpScheduler(dump_syms, processes=1, memory_budget=None, timeout=0.5)
+        try:
+            start = time.time()
+            results = list(scheduler.dump([self.task('slow', 2), self.task('fast', 1)]))
+        finally:
+            scheduler.close()
+        self.assertLess(time.time() - start, 10)
+        # The slow binary is a failure, and the next one is still dumped.
+        self.assertEqual([(r.task.name, r.error) for r in results],
+                         [('slow', 'Timed out after 0.5 seconds'), ('fast', None)])
+        pid = int(self.events()[0][0])
+        self.assertRaises(OSError, os.kill, pid, 0)
+
+
+class CancelTest(SchedulerTestCase):
+    def setUp(self):
+        SchedulerTestCase.setUp(self)
+        # A dump_syms that never finishes by itself. exec, so that killing
+        # the process closes its output.
+        self.dump_syms = self.write_dump_syms('exec sleep 60')
+
+    def test_cancel_kills_running_processes(self):
+        scheduler = DumpScheduler(self.dump_syms, processes=1, memory_budget=None, timeout=None)
+        try:
+            tasks = [DumpTask(os.path.join(self.temp_dir, name), name, 'x86_64', size)
+                     for name, size in (('big', 2000), ('small', 1000))]
+            start = time.time()
+            timer = threading.Timer(0.5, scheduler.cancel)
+            timer.start()
+            results = list(scheduler.dump(tasks))
+            timer.join()
+            self.assertLess(time.time() - start, 10)
+            self.assertEqual(sorted((r.task.name, r.error) for r in results),
+                             [('big', 'Cancelled'), ('small', 'Cancelled')])
+            # Anything queued after cancelling isn't started.
+            late = DumpTask(os.path.join(self.temp_dir, 'late'), 'late', 'x86_64', 1)
+            self.assertEqual([r.error for r in scheduler.dump([late])], ['Cancelled'])
+        finally:
+            scheduler.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import helpers  # noqa: F401
+
+import fixtures
+import macho
+from package_store import PackageStore
+from PackageSymbolDumper import DEFAULT_ARCHS, content_digest, find_dump_tasks, parse_archs
+from symbol_index import SymbolIndex
+
+SLICES = {
+    'x86_64': (macho.CPU_TYPE_X86_64, 3),
+    'x86_64h': (macho.CPU_TYPE_X86_64, macho.CPU_SUBTYPE_X86_64_H),
+    'arm64e': (macho.CPU_TYPE_ARM64, macho.CPU_SUBTYPE_ARM64E),
+    'i386': (macho.CPU_TYPE_X86, 3),
+}
+
+
+def thin(name, arch):
+    cputype, cpusubtype = SLICES[arch]
+    return fixtures.thin_macho(cputype, cpusubtype, fixtures.make_uuid(1, name, arch), b'\0' * 64)
+
+
+def debug_id(name, arch):
+    return macho.Slice(0, 0, 0, 0, fixtures.make_uuid(1, name, arch)).debug_id
+
+
+class ParseArchsTest(unittest.TestCase):
+    def test_parse_archs(self):
+        self.assertEqual(parse_archs(','.join(DEFAULT_ARCHS)), list(DEFAULT_ARCHS))
+        self.assertEqual(parse_archs('x86_64, arm64e,'), ['x86_64', 'arm64e'])
+        self.assertIsNone(parse_archs('all'))
+
+
+class FindDumpTasksTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.add('usr/lib/libFat.dylib', fixtures.fat_macho(
+            [SLICES[arch] + (thin('libFat.dylib', arch),) for arch in ('x86_64', 'arm64e', 'i386')]))
+        self.add('usr/lib/libThin.dylib', thin('libThin.dylib', 'x86_64'))
+        self.add('System/Library/Frameworks/H.framework/H', thin('H', 'x86_64h'))
+        # Outside the directories symbols are dumped from.
+        self.add('usr/bin/tool', thin('tool', 'x86_64'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def add(self, name, data):
+        path = os.path.join(self.temp_dir, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def tasks(self, **kwargs):
+        return sorted((t.name, t.arch) for t in find_dump_tasks(self.temp_dir, **kwargs))
+
+    def test_default_archs(self):
+        self.assertEqual(self.tasks(archs=DEFAULT_ARCHS), [
+            ('System/Library/Frameworks/H.framework/H', 'x86_64h'),
+            ('usr/lib/libFat.dylib', 'arm64e'),
+            ('usr/lib/libFat.dylib', 'x86_64'),
+            ('usr/lib/libThin.dylib', 'x86_64'),
+        ])
+        sizes = dict(((t.name, t.arch), t.size) for t in find_dump_tasks(self.temp_dir))
+        self.assertEqual(sizes['usr/lib/libFat.dylib', 'arm64e'],
+                         len(thin('libFat.dylib', 'arm64e')))
+
+    def test_archs(self):
+        self.assertIn(('usr/lib/libFat.dylib', 'i386'), self.tasks(archs=parse_archs('all')))
+        self.assertEqual(len(self.tasks(archs=None)), 5)
+        self.assertEqual(self.tasks(archs=['arm64e']), [('usr/lib/libFat.dylib', 'arm64e')])
+
+    def test_symbol_index(self):
+        index = SymbolIndex()
+        index.add('libThin.dylib', debug_id('libThin.dylib', 'x86_64'))
+        index.add('libFat.dylib', debug_id('libFat.dylib', 'arm64e'))
+        # The same id under another name is a different binary.
+        index.add('H.dylib', debug_id('H', 'x86_64h'))
+        self.assertEqual(self.tasks(archs=DEFAULT_ARCHS, symbol_index=index), [
+            ('System/Library/Frameworks/H.framework/H', 'x86_64h'),
+            ('usr/lib/libFat.dylib', 'x86_64'),
+        ])
+
+    def test_checkpointed(self):
+        checkpointed = {'usr/lib/libFat.dylib': ['x86_64', 'arm64e']}
+        self.assertEqual(self.tasks(archs=DEFAULT_ARCHS, checkpointed=checkpointed), [
+            ('System/Library/Frameworks/H.framework/H', 'x86_64h'),
+            ('usr/lib/libThin.dylib', 'x86_64'),
+        ])
+
+    def test_store(self):
+        no_uuid = struct.pack('<8I', macho.MH_MAGIC_64, macho.CPU_TYPE_X86_64, 3, 6, 0, 0, 0, 0)
+        self.add('usr/lib/libNoUUID.dylib', no_uuid + b'\1' * 64)
+        self.add('usr/lib/libOther.dylib', no_uuid + b'\2' * 64)
+        tasks = dict((t.name, t) for t in find_dump_tasks(self.temp_dir, DEFAULT_ARCHS))
+        digest = content_digest(os.path.join(self.temp_dir, 'usr/lib/libNoUUID.dylib'))
+        self.assertEqual(tasks['usr/lib/libNoUUID.dylib'].digest, digest)
+        self.assertIsNone(tasks['usr/lib/libThin.dylib'].digest)
+
+        store = PackageStore()
+        try:
+            store.record_binaries([(digest, 'libNoUUID.dylib', 'x86_64', 'a.pkg')])
+            names = [name for name, _ in self.tasks(archs=DEFAULT_ARCHS, store=store)]
+            self.assertNotIn('usr/lib/libNoUUID.dylib', names)
+            self.assertIn('usr/lib/libOther.dylib', names)
+            # Slices with a UUID are left to the symbol index.
+            self.assertIn('usr/lib/libThin.dylib', names)
+        finally:
+            store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
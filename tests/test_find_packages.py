@@ -0,0 +1,176 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import datetime
+import logging
+import os
+import plistlib
+import shutil
+import tempfile
+import unittest
+
+import helpers  # noqa: F401
+
+import PackageSymbolDumper
+from PackageSymbolDumper import (find_all_packages, find_packages, find_product_packages,
+                                 find_reposado_packages)
+
+try:
+    import reposadolib.reposadocommon  # noqa: F401
+    have_reposado = True
+except ImportError:
+    have_reposado = False
+
+URL_BASE = 'http://swcdn.apple.com/content/downloads/'
+
+
+def product(post_date, *names):
+    '''
+    Return reposado product info for a product posted on post_date with
+    packages names.
+    '''
+    entry = {'Packages': [{'URL': URL_BASE + name, 'Size': 100} for name in names]}
+    if post_date is not None:
+        entry['PostDate'] = post_date
+    return {'CatalogEntry': entry}
+
+
+class FindPackagesTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, *names):
+        return os.path.join(self.temp_dir, *names)
+
+    def touch(self, *names):
+        path = self.path(*names)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(b'xar!')
+        return path
+
+    def local_path(self, url):
+        return self.path('html', *url[len(URL_BASE):].split('/'))
+
+
+class FindPackagesTest(FindPackagesTestCase):
+    def test_walk(self):
+        expected = [self.touch('mirror', 'a', 'A.pkg'),
+                    self.touch('mirror', 'a', 'b', 'c', 'C.pkg')]
+        self.touch('mirror', 'a', 'A.pkg.download')
+        self.touch('mirror', 'a', 'A.dist')
+        # Bundle packages and hidden directories aren't searched.
+        self.touch('mirror', 'Bundle.pkg', 'Contents', 'Packages', 'Inner.pkg')
+        self.touch('mirror', '.cache', 'Cached.pkg')
+        self.assertEqual(sorted(find_packages(self.path('mirror'))), sorted(expected))
+
+    def test_all_paths(self):
+        a = self.touch('a', 'A.pkg')
+        b = self.touch('b', 'B.pkg')
+        self.assertEqual(sorted(find_all_packages([self.path('a'), self.path('b'),
+                                                   self.path('missing')])), [a, b])
+
+
+class FindProductPackagesTest(FindPackagesTestCase):
+    def find(self, products, product_ids=None):
+        return list(find_product_packages(products, self.local_path, product_ids))
+
+    def test_post_date_order(self):
+        products = {
+            '041-0002': product(datetime.datetime(2016, 3, 1), '2/Update2.pkg'),
+            '041-0001': product(datetime.datetime(2016, 1, 1), '1/Update1.pkg'),
+            '041-0003': product(datetime.datetime(2016, 2, 1), '3/Update3.pkg',
+                                '3/Extra3.pkg'),
+            # Products without a date come first.
+            '041-0004': product(None, '4/Update4.pkg'),
+        }
+        for n in range(1, 5):
+            self.touch('html', str(n), 'Update{}.pkg'.format(n))
+        self.touch('html', '3', 'Extra3.pkg')
+        self.assertEqual(self.find(products), [
+            self.path('html', '4', 'Update4.pkg'),
+            self.path('html', '1', 'Update1.pkg'),
+            self.path('html', '3', 'Update3.pkg'),
+            self.path('html', '3', 'Extra3.pkg'),
+            self.path('html', '2', 'Update2.pkg'),
+        ])
+        self.assertEqual(self.find(products, product_ids=set(['041-0002', '041-0004'])), [
+            self.path('html', '4', 'Update4.pkg'),
+            self.path('html', '2', 'Update2.pkg'),
+        ])
+
+    def test_local_paths(self):
+        products = {
+            '041-0001': product(datetime.datetime(2016, 1, 1), 'a/Shared.pkg', 'a/Missing.pkg',
+                                'a/Update.dmg'),
+            '041-0002': product(datetime.datetime(2016, 2, 1), 'a/Shared.pkg'),
+            '041-0003': {},
+        }
+        shared = self.touch('html', 'a', 'Shared.pkg')
+        self.touch('html', 'a', 'Update.dmg')
+        # Packages that weren't downloaded are left out, and one shared by
+        # several products is only yielded once.
+        self.assertEqual(self.find(products), [shared])
+
+
+class FindReposadoPackagesTest(FindPackagesTestCase):
+    def setUp(self):
+        FindPackagesTestCase.setUp(self)
+        self.saved = PackageSymbolDumper.load_reposado
+
+    def tearDown(self):
+        PackageSymbolDumper.load_reposado = self.saved
+        FindPackagesTestCase.tearDown(self)
+
+    def fake_reposado(self, products):
+        test = self
+
+        class FakeReposado(object):
+            def getProductInfo(self):
+                return products
+
+            def getLocalPathNameFromURL(self, url):
+                return test.local_path(url)
+
+        PackageSymbolDumper.load_reposado = lambda main_dir: FakeReposado()
+
+    def test_product_info(self):
+        self.fake_reposado({'041-0001': product(datetime.datetime(2016, 1, 1), '1/Update1.pkg')})
+        pkg = self.touch('html', '1', 'Update1.pkg')
+        self.touch('html', 'Unlisted.pkg')
+        self.assertEqual(list(find_reposado_packages(self.temp_dir, None,
+                                                     [self.path('html')])), [pkg])
+
+    def test_falls_back_to_walk(self):
+        packages = [self.touch('html', '1', 'Update1.pkg'), self.touch('html', 'Unlisted.pkg')]
+        for load_reposado in (lambda main_dir: None, None):
+            if load_reposado is None:
+                # reposado is there, but hasn't synced anything.
+                self.fake_reposado({})
+            else:
+                PackageSymbolDumper.load_reposado = load_reposado
+            self.assertEqual(sorted(find_reposado_packages(self.temp_dir, None,
+                                                           [self.path('html')])),
+                             sorted(packages))
+
+    @unittest.skipIf(not have_reposado, 'reposado is not installed')
+    def test_reposado(self):
+        PackageSymbolDumper.load_reposado = self.saved
+        metadata_dir = self.path('metadata')
+        os.mkdir(metadata_dir)
+        plistlib.writePlist({'UpdatesRootDir': self.path('html'),
+                             'UpdatesMetadataDir': metadata_dir},
+                            self.path('preferences.plist'))
+        plistlib.writePlist({'041-0001': product(datetime.datetime(2016, 1, 1),
+                                                 '1/Update1.pkg')},
+                            os.path.join(metadata_dir, 'ProductInfo.plist'))
+        pkg = self.touch('html', 'content', 'downloads', '1', 'Update1.pkg')
+        self.assertEqual(list(find_reposado_packages(self.temp_dir)), [pkg])
+
+
+if __name__ == '__main__':
+    unittest.main()
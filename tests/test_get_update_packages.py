@@ -0,0 +1,187 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import errno
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import time
+import unittest
+import zlib
+
+from helpers import FAKE_DUMP_SYMS, FileServer
+
+import disk_images
+import fixtures
+import hfsplus
+import symbol_sink
+import udif
+from PackageSymbolDumper import process_packages
+
+try:
+    import get_update_packages
+except ImportError:
+    # It needs Python 2 and requests.
+    get_update_packages = None
+
+needs_module = unittest.skipIf(get_update_packages is None,
+                               'get_update_packages could not be imported')
+
+
+@needs_module
+class ExtractDmgTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.dest = os.path.join(self.temp_dir, 'dest')
+        os.mkdir(self.dest)
+        self.saved = (get_update_packages.extract_dmg_packages,
+                      get_update_packages.extract_dmg_with_tools)
+        self.tool_calls = []
+
+        def extract_dmg_with_tools(dmg_path, dest):
+            self.tool_calls.append((dmg_path, dest, os.listdir(dest)))
+            return ['tools.pkg']
+        get_update_packages.extract_dmg_with_tools = extract_dmg_with_tools
+
+    def tearDown(self):
+        (get_update_packages.extract_dmg_packages,
+         get_update_packages.extract_dmg_with_tools) = self.saved
+        shutil.rmtree(self.temp_dir)
+
+    def test_falls_back_to_tools_on_reader_errors(self):
+        for error in (udif.UdifError('Not a UDIF disk image'), hfsplus.HfsError('Not an HFS+ volume'),
+                      struct.error('unpack requires a buffer of 4 bytes'),
+                      zlib.error('invalid block type'), EOFError()):
+            def extract_dmg_packages(dmg_path, dest):
+                with open(os.path.join(dest, 'partial.pkg'), 'wb') as f:
+                    f.write(b'partial')
+                raise error
+            get_update_packages.extract_dmg_packages = extract_dmg_packages
+            del self.tool_calls[:]
+            self.assertEqual(get_update_packages.extract_dmg('update.dmg', self.dest),
+                             ['tools.pkg'])
+            # Whatever the reader had copied is cleared out first.
+            self.assertEqual(self.tool_calls, [('update.dmg', self.dest, [])])
+
+    def test_other_errors_are_raised(self):
+        # Such as the disk filling up, or a bug.
+        for error in (IOError(errno.ENOSPC, 'No space left on device'), KeyError('blkx'),
+                      IndexError('list index out of range'), ValueError('bad'),
+                      RuntimeError('bug')):
+            def extract_dmg_packages(dmg_path, dest):
+                raise error
+            get_update_packages.extract_dmg_packages = extract_dmg_packages
+            self.assertRaises(type(error), get_update_packages.extract_dmg, 'update.dmg',
+                              self.dest)
+        self.assertEqual(self.tool_calls, [])
+
+
+@needs_module
+class FindUpdatePackagesTest(unittest.TestCase):
+    # Small enough that each disk image is downloaded in several ranges.
+    RANGE_SIZE = 16 * 1024
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.server_root = self.path('server')
+        for name in ('server', 'downloads', 'staging'):
+            os.mkdir(self.path(name))
+        self.server = FileServer(self.server_root)
+        self.index_url = self.server.url('index-%d.json')
+        self.packages = []
+        downloads = []
+        for n in range(2):
+            pkg = self.path('Update{}.pkg'.format(n))
+            fixtures.make_package(pkg, 256 * 1024, 'gzip', n)
+            self.packages.append(pkg)
+            with open(pkg, 'rb') as f:
+                files = [('Packages/Update{}.pkg'.format(n), f.read()),
+                         ('Packages/Readme.rtf', b'{\\rtf1}')]
+            disk_images.write_update_dmg(self.path('server', 'update{}.dmg'.format(n)), files)
+            downloads.append({'title': 'OS X El Capitan Update 10.11.{}'.format(n),
+                              'fileurl': self.server.url('update{}.dmg'.format(n))})
+        downloads.append({'title': 'OS X El Capitan 10.11.1 Combo Update',
+                          'fileurl': self.server.url('combo.dmg')})
+        self.write_index(0, json.dumps({'downloads': downloads}))
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        self.server.close()
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, *names):
+        return os.path.join(self.temp_dir, *names)
+
+    def write_index(self, page, text):
+        with open(self.path('server', 'index-{}.json'.format(page)), 'wb') as f:
+            f.write(text.encode('utf-8'))
+
+    def find(self):
+        return get_update_packages.find_update_packages(self.path('downloads'), self.index_url,
+                                                        range_size=self.RANGE_SIZE)
+
+    def process(self, finder, name):
+        process_packages(finder, symbol_sink.DirectorySink(self.path(name)), None,
+                         FAKE_DUMP_SYMS, state_db=self.path(name + '.sqlite'),
+                         staging_dir=self.path('staging'), memory_staging=0)
+        return sorted(os.path.relpath(os.path.join(root, filename), self.path(name))
+                      for root, _dirs, files in os.walk(self.path(name))
+                      for filename in files)
+
+    def test_symbols_from_updates(self):
+        expected = self.process(lambda: self.packages, 'expected')
+        self.assertNotEqual(expected, [])
+        self.assertEqual(self.process(self.find, 'symbols'), expected)
+        # Only the updates are downloaded, each in ranges.
+        self.assertEqual(sorted(self.server.requested('HEAD')), ['/update0.dmg', '/update1.dmg'])
+        for n in range(2):
+            size = os.path.getsize(self.path('server', 'update{}.dmg'.format(n)))
+            ranges = [headers['range'] for method, path, headers in self.server.requests
+                      if method == 'GET' and path == '/update{}.dmg'.format(n)]
+            self.assertEqual(len(ranges), -(-size // self.RANGE_SIZE))
+
+    def test_failed_update_is_skipped(self):
+        self.server.failing.add('/update0.dmg')
+        found = [os.path.basename(pkg) for pkg in self.find()]
+        self.assertEqual(found, ['Update1.pkg'])
+
+    def test_interrupted_download_is_not_kept(self):
+        self.server.truncated.add('/update0.dmg')
+        for range_size in (self.RANGE_SIZE, get_update_packages.RANGE_SIZE):
+            found = get_update_packages.find_update_packages(
+                self.path('downloads'), self.index_url, range_size=range_size)
+            self.assertEqual([os.path.basename(pkg) for pkg in found], ['Update1.pkg'])
+            # It would be skipped as already downloaded on the next run.
+            self.assertFalse(os.path.exists(self.path('downloads', 'update0.dmg')))
+            os.unlink(self.path('downloads', 'update1.dmg'))
+
+    def test_slow_consumer_holds_downloads_back(self):
+        downloads = []
+        for n in range(8):
+            name = 'small{}.dmg'.format(n)
+            disk_images.write_update_dmg(self.path('server', name),
+                                         [('Small{}.pkg'.format(n), b'pkg' * 100)])
+            downloads.append({'title': 'OS X Update 10.11.{}'.format(n),
+                              'fileurl': self.server.url(name)})
+        self.write_index(0, json.dumps({'downloads': downloads}))
+        found = get_update_packages.find_update_packages(self.path('downloads'), self.index_url,
+                                                         download_jobs=1, queue_size=1)
+        first = next(found)
+        # The consumer is busy with the first package: one more is queued,
+        # one waits to be handed over and one more is downloading.
+        time.sleep(1)
+        self.assertEqual(len(self.server.requested('HEAD')), 4)
+        rest = list(found)
+        self.assertEqual(sorted(os.path.basename(pkg) for pkg in [first] + rest),
+                         ['Small{}.pkg'.format(n) for n in range(8)])
+
+    def test_index_error_surfaces(self):
+        self.write_index(0, '<html>Service Unavailable</html>')
+        self.assertRaises(ValueError, list, self.find())
+        self.assertRaises(ValueError, self.process, self.find, 'symbols')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import io
+import struct
+import unittest
+
+import helpers  # noqa: F401
+
+import fixtures
+import macho
+
+UUID = bytes(bytearray(range(0x00, 0x100, 0x11)))
+X86_64 = (macho.CPU_TYPE_X86_64, 3)
+ARM64E = (macho.CPU_TYPE_ARM64, macho.CPU_SUBTYPE_ARM64E)
+
+
+def thin(cputype, cpusubtype, uuid=UUID, body=b'\0' * 100):
+    return fixtures.thin_macho(cputype, cpusubtype, uuid, body)
+
+
+def thin_big_endian_32(cputype, cpusubtype, uuid=UUID):
+    '''
+    Return a 32-bit big-endian Mach-O binary, as built for PowerPC, with
+    a load command before its LC_UUID.
+    '''
+    cmds = struct.pack('>II', 0x2, 16) + b'\0' * 8 + struct.pack('>II16s', macho.LC_UUID, 24, uuid)
+    return struct.pack('>7I', macho.MH_MAGIC, cputype, cpusubtype, 6, 2, len(cmds), 0) + cmds
+
+
+def fat64(slices):
+    '''
+    Return a fat binary with 64-bit offsets holding slices, a list of
+    (cputype, cpusubtype, data).
+    '''
+    header = struct.pack('>II', macho.FAT_MAGIC_64, len(slices))
+    offset = 4096
+    body = b''
+    for cputype, cpusubtype, data in slices:
+        header += struct.pack('>iiQQII', cputype, cpusubtype, offset + len(body), len(data), 12, 0)
+        body += data + b'\0' * (-len(data) % 4096)
+    return header + b'\0' * (offset - len(header)) + body
+
+
+def read_slices(data):
+    return [(s.arch, s.offset, s.size, s.debug_id) for s in macho.read_slices(io.BytesIO(data))]
+
+
+class ReadSlicesTest(unittest.TestCase):
+    DEBUG_ID = '00112233445566778899AABBCCDDEEFF0'
+
+    def test_thin(self):
+        data = thin(*X86_64)
+        self.assertEqual(read_slices(data), [('x86_64', 0, len(data), self.DEBUG_ID)])
+
+    def test_big_endian(self):
+        data = thin_big_endian_32(macho.CPU_TYPE_POWERPC, 0)
+        self.assertEqual(read_slices(data), [('ppc', 0, len(data), self.DEBUG_ID)])
+
+    def test_no_uuid(self):
+        data = struct.pack('<8I', macho.MH_MAGIC_64, macho.CPU_TYPE_X86_64, 3, 6, 0, 0, 0, 0)
+        self.assertEqual(read_slices(data), [('x86_64', 0, len(data), None)])
+
+    def test_fat(self):
+        x86_64 = thin(*X86_64)
+        arm64e = thin(*ARM64E, uuid=b'\xff' * 16)
+        data = fixtures.fat_macho([X86_64 + (x86_64,), ARM64E + (arm64e,)])
+        self.assertEqual(read_slices(data), [
+            ('x86_64', 4096, len(x86_64), self.DEBUG_ID),
+            ('arm64e', 8192, len(arm64e), 'F' * 32 + '0'),
+        ])
+
+    def test_fat64(self):
+        x86_64h = thin(macho.CPU_TYPE_X86_64, macho.CPU_SUBTYPE_X86_64_H)
+        i386 = thin(macho.CPU_TYPE_X86, 3, uuid=b'\x01' * 16)
+        data = fat64([(macho.CPU_TYPE_X86_64, macho.CPU_SUBTYPE_X86_64_H, x86_64h),
+                      (macho.CPU_TYPE_X86, 3, i386)])
+        self.assertEqual(read_slices(data), [
+            ('x86_64h', 4096, len(x86_64h), self.DEBUG_ID),
+            ('i386', 8192, len(i386), '01' * 16 + '0'),
+        ])
+
+    def test_malformed(self):
+        fat = fixtures.fat_macho([X86_64 + (thin(*X86_64),)])
+        for data in (b'\xcf\xfa\xed', b'\0' * 64, fat[:4096 + 40], thin(*X86_64)[:40],
+                     struct.pack('>II', macho.FAT_MAGIC, 1000) + b'\0' * 64):
+            self.assertRaises(macho.MachOError, macho.read_slices, io.BytesIO(data))
+
+    def test_is_macho(self):
+        for data in (thin(*X86_64), thin_big_endian_32(macho.CPU_TYPE_POWERPC, 0),
+                     fixtures.fat_macho([X86_64 + (thin(*X86_64),)])):
+            self.assertTrue(macho.is_macho(data[:macho.SNIFF_SIZE]))
+        # Java class files share the fat magic, followed by their version.
+        for data in (b'\xca\xfe\xba\xbe\x00\x00\x00\x32', b'#!/bin/sh\n', b'\xcf\xfa', b''):
+            self.assertFalse(macho.is_macho(data[:macho.SNIFF_SIZE]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import gzip
+import os
+import shutil
+import sqlite3
+import tarfile
+import tempfile
+import unittest
+
+from helpers import load_script
+
+import package_store
+
+merge_artifacts = load_script('merge-artifacts.py')
+
+
+class MergeStateTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, name):
+        return os.path.join(self.temp_dir, name)
+
+    def publish(self, path):
+        '''
+        Gzip the database at path the way run.sh publishes it.
+        '''
+        with open(path, 'rb') as f, gzip.open(path + '.gz', 'wb') as out:
+            shutil.copyfileobj(f, out)
+        return path + '.gz'
+
+    def test_shards_sharing_prior_state(self):
+        prior = package_store.PackageStore(self.path('prior.sqlite'))
+        prior.record('old.pkg', size=10, digest='old')
+        prior.record_failure('old.pkg', 'usr/lib/libold.dylib', 'x86_64', 'crashed')
+        prior.record_payload('old-payload', 'old.pkg', 'Payload')
+        prior.checkpoint([('partial.pkg', 'Payload', 'usr/lib/liba.dylib', 'x86_64', 'a.sym')])
+        prior.close()
+        shards = []
+        for n in range(2):
+            shard = self.path('shard{}.sqlite'.format(n))
+            shutil.copy(self.path('prior.sqlite'), shard)
+            store = package_store.PackageStore(shard)
+            pkg = 'new{}.pkg'.format(n)
+            store.record(pkg, size=20, digest=pkg)
+            store.record_failure(pkg, 'usr/lib/libnew.dylib', 'arm64e', 'timed out')
+            if n == 0:
+                store.record('partial.pkg', size=30)
+            store.close()
+            shards.append(self.publish(shard))
+
+        merge_artifacts.merge_state(shards, self.path('merged.sqlite.gz'))
+        merge_artifacts.gunzip(self.path('merged.sqlite.gz'), self.path('merged.sqlite'))
+        db = sqlite3.connect(self.path('merged.sqlite'))
+        self.assertEqual(sorted(row[0] for row in db.execute('SELECT path FROM packages')),
+                         ['new0.pkg', 'new1.pkg', 'old.pkg', 'partial.pkg'])
+        self.assertEqual(sorted(db.execute('SELECT path, binary, arch, error FROM failures')),
+                         [('new0.pkg', 'usr/lib/libnew.dylib', 'arm64e', 'timed out'),
+                          ('new1.pkg', 'usr/lib/libnew.dylib', 'arm64e', 'timed out'),
+                          ('old.pkg', 'usr/lib/libold.dylib', 'x86_64', 'crashed')])
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM payloads').fetchone()[0], 1)
+        # The shard that finished the package drops its checkpoints, and the
+        # other shard's copy of them is dropped when merging.
+        self.assertEqual(db.execute('SELECT COUNT(*) FROM checkpoints').fetchone()[0], 0)
+        db.close()
+
+
+
+class MergeRepoSyncCacheTest(unittest.TestCase):
+    CATALOG = 'html/content/catalogs/others/index.sucatalog.apple'
+    CATALOG_MTIME = 1500000000
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, *names):
+        return os.path.join(self.temp_dir, *names)
+
+    def make_cache(self, name, products, etags):
+        '''
+        Write a repo_sync cache the way run.sh archives /opt/data-reposado.
+        '''
+        root = self.path(name)
+        os.makedirs(os.path.join(root, 'metadata'))
+        os.makedirs(os.path.dirname(os.path.join(root, self.CATALOG)))
+        catalogs = {'https://example.com/index.sucatalog': {
+            'Size': 7, 'MTime': self.CATALOG_MTIME, 'Products': sorted(products)}}
+        merge_artifacts.write_plist({'Products': products, 'Catalogs': catalogs},
+                                    os.path.join(root, merge_artifacts.CATALOG_DIGESTS))
+        merge_artifacts.write_plist(etags, os.path.join(root, merge_artifacts.ETAGS))
+        with open(os.path.join(root, self.CATALOG), 'wb') as f:
+            f.write(b'catalog')
+        os.utime(os.path.join(root, self.CATALOG), (self.CATALOG_MTIME, self.CATALOG_MTIME))
+        archive_path = root + '.tar.gz'
+        with tarfile.open(archive_path, 'w:gz') as archive:
+            archive.add(os.path.join(root, 'metadata'), 'metadata')
+            archive.add(os.path.join(root, 'html'), 'html')
+        return archive_path
+
+    def test_products_downloaded_by_any_shard(self):
+        # Each shard downloaded one of the products, and only synced the
+        # product info of the other.
+        shards = [
+            self.make_cache('shard0', {
+                '041-1': {'Digest': 'a', 'Downloaded': True},
+                '041-2': {'Digest': 'b', 'Downloaded': False},
+            }, {'https://example.com/index.sucatalog': '"catalog"'}),
+            self.make_cache('shard1', {
+                '041-1': {'Digest': 'a', 'Downloaded': False},
+                '041-2': {'Digest': 'b', 'Downloaded': True},
+                '041-3': {'Digest': 'c', 'Downloaded': False},
+            }, {'https://example.com/041-2.dist': '"dist"'}),
+        ]
+        output = self.path('merged.tar.gz')
+        merge_artifacts.merge_repo_sync_cache(shards, output)
+        with tarfile.open(output) as archive:
+            archive.extractall(self.path('merged'))
+        with open(self.path('merged', merge_artifacts.CATALOG_DIGESTS), 'rb') as f:
+            digests = merge_artifacts.read_plist(f)
+        self.assertEqual(digests['Products'], {
+            '041-1': {'Digest': 'a', 'Downloaded': True},
+            '041-2': {'Digest': 'b', 'Downloaded': True},
+            '041-3': {'Digest': 'c', 'Downloaded': False},
+        })
+        self.assertEqual(list(digests['Catalogs']), ['https://example.com/index.sucatalog'])
+        with open(self.path('merged', merge_artifacts.ETAGS), 'rb') as f:
+            self.assertEqual(sorted(merge_artifacts.read_plist(f)),
+                             ['https://example.com/041-2.dist',
+                              'https://example.com/index.sucatalog'])
+        # repo_sync compares the catalog's modification time with the cache.
+        self.assertEqual(int(os.path.getmtime(self.path('merged', self.CATALOG))),
+                         self.CATALOG_MTIME)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import helpers  # noqa: F401
+
+import metrics
+
+MB = 1024 * 1024
+
+
+def record(stage, package, seconds, end, bytes_in=0, bytes_out=0, items=1, **fields):
+    fields.update(stage=stage, package=package, seconds=seconds, time=end,
+                  bytes_in=bytes_in, bytes_out=bytes_out, items=items)
+    return fields
+
+
+class SummarizeTest(unittest.TestCase):
+    RECORDS = [
+        record('download', 'a.pkg', 2.0, 1002.0, 4 * MB, 4 * MB),
+        record('expand', 'a.pkg', 0.5, 1003.0, 4 * MB),
+        record('dump_syms', 'a.pkg', 1.0, 1004.0, MB, 100, binary='libA', arch='x86_64'),
+        record('dump_syms', 'a.pkg', 3.0, 1006.0, 2 * MB, 300, binary='libB', arch='x86_64'),
+        record('package', 'a.pkg', 4.0, 1006.0, 4 * MB, 0, 2),
+        record('expand', 'b.pkg', 0.25, 1004.0, MB),
+        record('package', 'b.pkg', 8.0, 1012.0, MB, 0, 0),
+        record('expand', 'c.pkg', 0.5, 1005.0, MB),
+        record('package', 'c.pkg', 1.0, 1005.5, MB, 0, 1),
+    ]
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'metrics.jsonl')
+        with open(self.path, 'wb') as f:
+            for r in self.RECORDS:
+                f.write(json.dumps(r).encode('utf-8') + b'\n')
+            # A line cut short by a run that was killed.
+            f.write(b'{"stage": "dump_syms", "pack')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_stage_totals(self):
+        summary = metrics.summarize(self.path)
+        dump_syms = summary['stages']['dump_syms']
+        self.assertEqual((dump_syms['count'], dump_syms['items'], dump_syms['seconds'],
+                          dump_syms['max_seconds']), (2, 2, 4.0, 3.0))
+        self.assertEqual((dump_syms['bytes_in'], dump_syms['bytes_out']), (3 * MB, 400))
+        self.assertAlmostEqual(dump_syms['mb_per_second_in'], 0.75)
+        self.assertEqual(summary['stages']['expand']['count'], 3)
+        self.assertEqual(summary['stages']['package']['items'], 3)
+        self.assertEqual(sorted(summary['stages']),
+                         ['download', 'dump_syms', 'expand', 'package'])
+
+    def test_slowest_packages(self):
+        summary = metrics.summarize(self.path)
+        self.assertEqual(summary['packages'], 3)
+        slowest = summary['slowest_packages']
+        self.assertEqual([p['package'] for p in slowest], ['b.pkg', 'a.pkg', 'c.pkg'])
+        self.assertEqual(slowest[1]['stages']['dump_syms']['seconds'], 4.0)
+        self.assertEqual(sorted(slowest[1]['stages']),
+                         ['download', 'dump_syms', 'expand', 'package'])
+
+        saved, metrics.SLOWEST_PACKAGES = metrics.SLOWEST_PACKAGES, 2
+        try:
+            slowest = metrics.summarize(self.path)['slowest_packages']
+        finally:
+            metrics.SLOWEST_PACKAGES = saved
+        self.assertEqual([p['package'] for p in slowest], ['b.pkg', 'a.pkg'])
+
+    def test_wall_time(self):
+        # From the download starting at 1000 to b.pkg finishing at 1012.
+        self.assertEqual(metrics.summarize(self.path)['wall_seconds'], 12.0)
+        self.assertEqual(metrics.summarize(os.devnull)['wall_seconds'], 0)
+
+    def test_recorded_metrics(self):
+        path = os.path.join(self.temp_dir, 'recorded.jsonl')
+        run_metrics = metrics.Metrics(path)
+        with run_metrics.timer('write', 'a.pkg') as timer:
+            timer.bytes_in = 10
+        run_metrics.record('dump_syms', 'a.pkg', 1.5, 20, 5, binary='libA', arch='arm64e')
+        run_metrics.close()
+        stages = metrics.summarize(path)['stages']
+        self.assertEqual(stages['write']['bytes_in'], 10)
+        self.assertEqual((stages['dump_syms']['seconds'], stages['dump_syms']['bytes_out']),
+                         (1.5, 5))
+
+    def test_write_summary(self):
+        summary_path = os.path.join(self.temp_dir, 'summary.json')
+        metrics.write_summary(self.path, summary_path)
+        with open(summary_path, 'rb') as f:
+            self.assertEqual(json.loads(f.read().decode('utf-8'))['packages'], 3)
+        # A run that recorded nothing still gets a summary.
+        metrics.write_summary(os.path.join(self.temp_dir, 'missing.jsonl'), summary_path)
+        with open(summary_path, 'rb') as f:
+            self.assertEqual(json.loads(f.read().decode('utf-8'))['stages'], {})
+
+
+if __name__ == '__main__':
+    unittest.main()
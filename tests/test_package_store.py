@@ -0,0 +1,214 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import os
+import shutil
+import tempfile
+import unittest
+
+import helpers  # noqa: F401
+
+import package_store
+from dump_scheduler import DumpTask
+from package_store import PackageStore
+from PackageSymbolDumper import Checkpoints, PackageJob, PayloadJob
+from symbol_index import SymbolIndex
+
+
+class PackageStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = self.path('state.sqlite')
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, *names):
+        return os.path.join(self.temp_dir, *names)
+
+    def open(self, path=None):
+        '''
+        Open the store, as a new run would.
+        '''
+        store = PackageStore(path or self.db)
+        self.stores.append(store)
+        return store
+
+
+class PackageStoreTest(PackageStoreTestCase):
+    def test_record(self):
+        store = self.open()
+        store.record('a.pkg', size=100, digest='d', started=10, finished=12, symbols=3)
+        store.record('b.pkg', status=package_store.STATUS_ERROR)
+        store.record_failure('b.pkg', 'usr/lib/libB.dylib', 'x86_64', 'Timed out')
+        store = self.open()
+        self.assertIn('a.pkg', store)
+        self.assertNotIn('c.pkg', store)
+        self.assertEqual(len(store), 2)
+        self.assertEqual(store.get('a.pkg'), {
+            'path': 'a.pkg', 'size': 100, 'digest': 'd', 'started': 10, 'finished': 12,
+            'symbols': 3, 'status': package_store.STATUS_DONE})
+        self.assertIsNone(store.get('c.pkg'))
+        self.assertEqual(store.failures('b.pkg'), [('usr/lib/libB.dylib', 'x86_64', 'Timed out')])
+        # Only successful packages with timings count towards planning.
+        self.assertEqual(store.history(), [('a.pkg', 100, 10, 12, 3)])
+
+    def test_import_and_export(self):
+        tracking_file = self.path('processed')
+        with open(tracking_file, 'wb') as f:
+            f.write(u'/mirror/b.pkg\n/mirror/\u00e9.pkg\n\n/mirror/a.pkg\n'.encode('utf-8'))
+        store = self.open()
+        store.record('/mirror/a.pkg', size=5)
+        store.import_list(tracking_file)
+        store.import_list(self.path('missing'))
+        store.import_list(None)
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store.get('/mirror/b.pkg')['status'], package_store.STATUS_IMPORTED)
+        # What was already known keeps its record.
+        self.assertEqual(store.get('/mirror/a.pkg')['size'], 5)
+
+        store.record('/mirror/c.pkg')
+        store.export_list(tracking_file)
+        store.export_list(None)
+        with open(tracking_file, 'rb') as f:
+            self.assertEqual(f.read().decode('utf-8').split('\n'),
+                             ['/mirror/a.pkg', '/mirror/b.pkg', '/mirror/c.pkg',
+                              u'/mirror/\u00e9.pkg'])
+        self.assertEqual([f for f in os.listdir(self.temp_dir) if f.endswith('.tmp')], [])
+
+        # A fresh store picks the list up again.
+        store = PackageStore(None)
+        self.stores.append(store)
+        store.import_list(tracking_file)
+        self.assertEqual(len(store), 4)
+
+
+class DigestTest(PackageStoreTestCase):
+    def test_package_digests(self):
+        store = self.open()
+        store.record('a.pkg', digest='a')
+        store.record('b.pkg', status=package_store.STATUS_ERROR, digest='b')
+        store.record('c.pkg', status=package_store.STATUS_DUPLICATE, digest='a')
+        store.record('d.pkg', digest='a')
+        # Only packages that were processed successfully count.
+        self.assertEqual(store.find_digest('a'), 'a.pkg')
+        self.assertIsNone(store.find_digest('b'))
+        store = self.open()
+        self.assertEqual(store.find_digest('a'), 'a.pkg')
+        self.assertIsNone(store.find_digest('b'))
+        self.assertIsNone(store.find_digest('c'))
+
+    def test_payload_and_binary_digests(self):
+        store = self.open()
+        store.record_payload('p', 'a.pkg', 'a.pkg/Payload')
+        store.record_binaries([('x', 'libA.dylib', 'x86_64', 'a.pkg'),
+                               ('y', 'libB.dylib', None, 'a.pkg')])
+        for store in (store, self.open()):
+            self.assertTrue(store.has_payload('p'))
+            self.assertFalse(store.has_payload('x'))
+            self.assertTrue(store.has_binary('x', 'libA.dylib', 'x86_64'))
+            self.assertTrue(store.has_binary('y', 'libB.dylib', None))
+            # The same contents under another name or architecture are
+            # dumped again.
+            self.assertFalse(store.has_binary('x', 'libB.dylib', 'x86_64'))
+            self.assertFalse(store.has_binary('x', 'libA.dylib', 'arm64e'))
+
+    def test_claims(self):
+        store = self.open()
+        store.record('a.pkg', digest='a')
+        store.record_payload('p', 'a.pkg', 'a.pkg/Payload')
+        self.assertEqual(store.claim_package('a', 'b.pkg'), 'a.pkg')
+        self.assertIsNone(store.claim_package('c', 'c.pkg'))
+        # Identical packages in the same run are skipped before the first
+        # of them is recorded.
+        self.assertEqual(store.claim_package('c', 'd.pkg'), 'c.pkg')
+        self.assertFalse(store.claim_payload('p'))
+        self.assertTrue(store.claim_payload('q'))
+        self.assertFalse(store.claim_payload('q'))
+        # Claims aren't kept.
+        store = self.open()
+        self.assertIsNone(store.claim_package('c', 'd.pkg'))
+        self.assertTrue(store.claim_payload('q'))
+
+
+class RecordingStore(PackageStore):
+    '''
+    A PackageStore that notes when checkpoints are committed to it in
+    events.
+    '''
+    def __init__(self, path, events):
+        PackageStore.__init__(self, path)
+        self.events = events
+
+    def checkpoint(self, entries):
+        self.events.append(('checkpoint', len(entries)))
+        PackageStore.checkpoint(self, entries)
+
+
+class RecordingSink(object):
+    def __init__(self, events):
+        self.events = events
+
+    def flush(self):
+        self.events.append(('flush',))
+
+
+class CheckpointTest(PackageStoreTestCase):
+    PAYLOAD = 'a.pkg/Payload'
+
+    def test_checkpoints(self):
+        store = self.open()
+        store.checkpoint([('a.pkg', self.PAYLOAD, 'usr/lib/libA.dylib', 'x86_64', 'A.sym'),
+                          ('a.pkg', self.PAYLOAD, 'usr/lib/libA.dylib', 'arm64e', 'A.sym'),
+                          ('a.pkg', self.PAYLOAD, 'usr/lib/libB.dylib', None, 'B.sym'),
+                          ('b.pkg', 'b.pkg/Payload', 'usr/lib/libC.dylib', 'x86_64', 'C.sym')])
+        # Checkpoints are what an earlier run left behind.
+        self.assertEqual(store.checkpoints('a.pkg', self.PAYLOAD), {})
+
+        store = self.open()
+        self.assertEqual(store.checkpoints('a.pkg', self.PAYLOAD), {
+            'usr/lib/libA.dylib': set(['x86_64', 'arm64e']),
+            'usr/lib/libB.dylib': set([None]),
+        })
+        self.assertEqual(store.checkpoints('a.pkg', 'a.pkg/Other'), {})
+        # Finishing a package drops its checkpoints.
+        store.record('a.pkg')
+        store = self.open()
+        self.assertEqual(store.checkpoints('a.pkg', self.PAYLOAD), {})
+        self.assertEqual(list(store.checkpoints('b.pkg', 'b.pkg/Payload')),
+                         ['usr/lib/libC.dylib'])
+
+    def test_saved_after_flush(self):
+        events = []
+        store = RecordingStore(self.db, events)
+        self.stores.append(store)
+        checkpoints = Checkpoints(store, RecordingSink(events), SymbolIndex(), interval=3600)
+        job = PayloadJob(PackageJob('a.pkg'), self.PAYLOAD)
+        checkpoints.add(job, DumpTask('/tmp/A', 'usr/lib/libA.dylib', 'x86_64', 100), 'A.sym')
+        checkpoints.add(job, DumpTask('/tmp/B', 'usr/lib/libB.dylib', None, 100, 'digest'),
+                        'B.sym')
+        self.assertEqual(events, [])
+        checkpoints.save()
+        self.assertEqual(events, [('flush',), ('checkpoint', 2)])
+        # Nothing new, nothing to flush.
+        checkpoints.save()
+        self.assertEqual(len(events), 2)
+        self.assertTrue(store.has_binary('digest', 'libB.dylib', None))
+        self.assertEqual(self.open().checkpoints('a.pkg', self.PAYLOAD), {
+            'usr/lib/libA.dylib': set(['x86_64']),
+            'usr/lib/libB.dylib': set([None]),
+        })
+
+    def test_saved_every_interval(self):
+        events = []
+        store = RecordingStore(self.db, events)
+        self.stores.append(store)
+        checkpoints = Checkpoints(store, RecordingSink(events), SymbolIndex(), interval=0)
+        job = PayloadJob(PackageJob('a.pkg'), self.PAYLOAD)
+        checkpoints.add(job, DumpTask('/tmp/A', 'usr/lib/libA.dylib', 'x86_64', 100), 'A.sym')
+        self.assertEqual(events, [('flush',), ('checkpoint', 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import concurrent.futures
+import io
+import struct
+import threading
+import unittest
+
+import helpers  # noqa: F401
+
+import fixtures
+import parse_pbzx
+
+CHUNK_SIZE = 4096
+
+
+def make_pbzx(data, raw_every=3):
+    '''
+    Return data as a pbzx stream of CHUNK_SIZE chunks, every raw_every-th
+    of them stored raw.
+    '''
+    out = io.BytesIO()
+    fixtures.compress_payload(io.BytesIO(data), out, 'pbzx', CHUNK_SIZE, raw_every)
+    return out.getvalue()
+
+
+class RecordingExecutor(object):
+    '''
+    Passes work on to executor, keeping the futures.
+    '''
+    def __init__(self, executor):
+        self.executor = executor
+        self.futures = []
+
+    def submit(self, *args):
+        future = self.executor.submit(*args)
+        self.futures.append(future)
+        return future
+
+
+class DecodePbzxTest(unittest.TestCase):
+    DATA = fixtures.Content(1).text(20 * CHUNK_SIZE + 100)
+
+    def decode(self, stream):
+        return b''.join(parse_pbzx.decode_pbzx(io.BytesIO(stream)))
+
+    def test_mixed_chunks(self):
+        stream = make_pbzx(self.DATA)
+        kinds = [compressed for compressed, _ in
+                 parse_pbzx.iter_pbzx_chunks(io.BytesIO(stream))]
+        self.assertEqual(len(kinds), 21)
+        self.assertIn(True, kinds)
+        self.assertIn(False, kinds)
+        self.assertEqual(self.decode(stream), self.DATA)
+
+    def test_bad_magic(self):
+        stream = make_pbzx(self.DATA)
+        self.assertRaises(parse_pbzx.PbzxError, self.decode, b'pbzy' + stream[4:])
+        self.assertRaises(parse_pbzx.PbzxError, self.decode, b'')
+
+    def test_bad_footer(self):
+        stream = bytearray(make_pbzx(self.DATA, raw_every=100))
+        # The first chunk is xz; replace the end of its footer.
+        _flags, length = struct.unpack_from('>QQ', stream, 12)
+        stream[28 + length - 2:28 + length] = b'ZY'
+        self.assertRaises(parse_pbzx.PbzxError, self.decode, bytes(stream))
+
+    def test_truncated(self):
+        stream = make_pbzx(self.DATA)
+        # In the initial flags, a chunk header and chunk data.
+        for length in (8, 20, 40, len(stream) - 1):
+            self.assertRaises(parse_pbzx.PbzxError, self.decode, stream[:length])
+
+
+class ParallelDecoderTest(unittest.TestCase):
+    DATA = fixtures.Content(2).text(40 * CHUNK_SIZE)
+
+    def test_window_does_not_change_output(self):
+        stream = make_pbzx(self.DATA)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            for window in (1, 2, 8, 100):
+                decoder = parse_pbzx.ParallelDecoder(executor, window)
+                chunks = list(decoder.decode(io.BytesIO(stream)))
+                self.assertEqual(len(chunks), 40)
+                self.assertEqual(b''.join(chunks), self.DATA)
+
+    def test_bad_window(self):
+        self.assertRaises(ValueError, parse_pbzx.ParallelDecoder, None, 0)
+
+    def test_close_part_way(self):
+        stream = make_pbzx(self.DATA)
+        threads = threading.active_count()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+            executor = RecordingExecutor(pool)
+            decoded = parse_pbzx.ParallelDecoder(executor, 8).decode(io.BytesIO(stream))
+            self.assertEqual(next(decoded), self.DATA[:CHUNK_SIZE])
+            decoded.close()
+            # Nothing more is read once the decoder is closed.
+            self.assertEqual(len(executor.futures), 8)
+        self.assertEqual(threading.active_count(), threads)
+        for future in executor.futures:
+            self.assertTrue(future.done())
+
+    def test_error_part_way(self):
+        stream = make_pbzx(self.DATA)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as pool:
+            executor = RecordingExecutor(pool)
+            decoder = parse_pbzx.ParallelDecoder(executor, 4)
+            decoded = decoder.decode(io.BytesIO(stream[:len(stream) // 2]))
+            self.assertRaises(parse_pbzx.PbzxError, list, decoded)
+        self.assertTrue(all(future.done() for future in executor.futures))
+
+
+if __name__ == '__main__':
+    unittest.main()
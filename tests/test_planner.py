@@ -0,0 +1,42 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import unittest
+
+import helpers  # noqa: F401
+
+import planner
+from planner import Planner
+
+
+class AdmitTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+
+    def make_planner(self, budget, margin=0):
+        return Planner([], self.now + budget, clock=lambda: self.now, margin=margin)
+
+    def test_admits_packages_that_fit(self):
+        p = self.make_planner(100)
+        size = 10 * planner.DEFAULT_THROUGHPUT
+        self.assertTrue(p.admit('a.pkg', size))
+        p.started('a.pkg', size)
+        self.assertFalse(p.admit('b.pkg', 90 * planner.DEFAULT_THROUGHPUT))
+        p.finished('a.pkg')
+        self.assertTrue(p.admit('b.pkg', 90 * planner.DEFAULT_THROUGHPUT))
+
+    def test_no_packages_admitted_within_margin(self):
+        p = self.make_planner(100, margin=60)
+        self.assertTrue(p.admit('a.pkg', 0))
+        self.now += 50
+        self.assertFalse(p.admit('a.pkg', 0))
+
+    def test_plan_skips_packages_once_time_is_short(self):
+        p = self.make_planner(100, margin=60)
+        plan = p.plan(['a.pkg', 'b.pkg'])
+        self.assertEqual(next(plan), 'a.pkg')
+        self.now += 50
+        self.assertEqual(list(plan), [])
+        self.assertEqual(p.skipped, ['b.pkg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,197 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from helpers import FAKE_DUMP_SYMS
+
+import fixtures
+import package_store
+import planner
+import symbol_sink
+from PackageSymbolDumper import process_packages
+
+
+class ProcessPackagesTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.staging_dir = self.path('staging')
+        os.mkdir(self.staging_dir)
+        self.state_db = self.path('state.sqlite')
+        self.environ = dict(os.environ)
+        logging.disable(logging.CRITICAL)
+
+    def tearDown(self):
+        logging.disable(logging.NOTSET)
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, *names):
+        return os.path.join(self.temp_dir, *names)
+
+    def process(self, packages, **kwargs):
+        kwargs.setdefault('staging_dir', self.staging_dir)
+        kwargs.setdefault('memory_staging', 0)
+        kwargs.setdefault('state_db', self.state_db)
+        sink = symbol_sink.DirectorySink(kwargs.pop('symbols', self.path('symbols')))
+        process_packages(lambda: packages, sink, None, FAKE_DUMP_SYMS, **kwargs)
+
+    def run_out_of_time(self, packages, **kwargs):
+        '''
+        Process packages with a time budget that runs out while the first
+        of their binaries are still being dumped. Returns how long it took.
+        '''
+        # Each binary takes far longer to dump than the budget.
+        os.environ['FAKE_DUMP_SYMS_SECONDS_PER_MB'] = '60'
+        overhead, planner.PACKAGE_OVERHEAD = planner.PACKAGE_OVERHEAD, 0
+        try:
+            start = time.time()
+            self.process(packages, dump_timeout=None, **kwargs)
+            return time.time() - start
+        finally:
+            planner.PACKAGE_OVERHEAD = overhead
+
+    def test_time_budget_stops_running_dumps(self):
+        pkg = self.path('slow.pkg')
+        fixtures.make_package(pkg, 1024 * 1024, 'gzip')
+        self.assertLess(self.run_out_of_time([pkg], time_budget=2), 5)
+        store = package_store.PackageStore(self.state_db)
+        try:
+            # The package is left for the next run, and the dumps that were
+            # cut short aren't failures.
+            self.assertNotIn(pkg, store)
+            self.assertEqual(store.failures(pkg), [])
+        finally:
+            store.close()
+
+    def test_stopping_releases_staging(self):
+        packages = []
+        for seed in range(4):
+            pkg = self.path('slow{}.pkg'.format(seed))
+            fixtures.make_package(pkg, 1024 * 1024, 'gzip', seed)
+            packages.append(pkg)
+        # Payloads extracted ahead of the dump stage are waiting for it
+        # when the time runs out.
+        self.run_out_of_time(packages, time_budget=2, extract_jobs=2, dump_jobs=1,
+                             queue_size=2)
+        self.assertEqual(os.listdir(self.staging_dir), [])
+
+    def symbol_files(self):
+        return sorted(os.path.relpath(os.path.join(root, name), self.path('symbols'))
+                      for root, _dirs, files in os.walk(self.path('symbols'))
+                      for name in files)
+
+    def test_encoded_nested_package(self):
+        # Older updates nest component packages in a product package; xar
+        # stores them gzip-encoded unless told otherwise.
+        inner = self.path('Inner.pkg')
+        fixtures.make_package(inner, 256 * 1024, 'gzip')
+        distribution = self.path('Distribution')
+        with open(distribution, 'wb') as f:
+            f.write(b'<installer-gui-script minSpecVersion="1"/>')
+        outer = self.path('Outer.pkg')
+        fixtures.write_xar(outer, [('Distribution', distribution, True),
+                                   ('Inner.pkg', inner, True)])
+
+        self.process([inner], state_db=self.path('inner.sqlite'))
+        expected = self.symbol_files()
+        self.assertNotEqual(expected, [])
+        shutil.rmtree(self.path('symbols'))
+        self.process([outer])
+        self.assertEqual(self.symbol_files(), expected)
+        store = package_store.PackageStore(self.state_db)
+        try:
+            self.assertEqual(store.get(outer)['status'], package_store.STATUS_DONE)
+        finally:
+            store.close()
+
+    def dumped(self, metrics_file):
+        '''
+        Return the (binary, arch) pairs dump_syms ran on, from metrics_file.
+        '''
+        with open(metrics_file, 'rb') as f:
+            records = [json.loads(line.decode('utf-8')) for line in f]
+        return sorted((r['binary'], r['arch']) for r in records if r['stage'] == 'dump_syms')
+
+    def test_resume_skips_checkpointed_binaries(self):
+        pkg = self.path('a.pkg')
+        fixtures.make_package(pkg, 256 * 1024, 'gzip')
+        self.process([pkg], state_db=self.path('first.sqlite'),
+                     metrics_file=self.path('first.jsonl'))
+        dumped = self.dumped(self.path('first.jsonl'))
+        self.assertGreater(len(dumped), 2)
+
+        # An earlier run was interrupted after checkpointing half of them.
+        checkpointed = dumped[::2]
+        store = package_store.PackageStore(self.state_db)
+        try:
+            store.checkpoint([(pkg, pkg + '/Payload', binary, arch, 'unused.sym')
+                              for binary, arch in checkpointed])
+        finally:
+            store.close()
+        self.process([pkg], metrics_file=self.path('second.jsonl'),
+                     symbols=self.path('resumed'))
+        self.assertEqual(self.dumped(self.path('second.jsonl')),
+                         sorted(set(dumped) - set(checkpointed)))
+        store = package_store.PackageStore(self.state_db)
+        try:
+            self.assertEqual(store.get(pkg)['status'], package_store.STATUS_DONE)
+            self.assertEqual(store.checkpoints(pkg, pkg + '/Payload'), {})
+        finally:
+            store.close()
+
+    def get(self, pkg):
+        store = package_store.PackageStore(self.state_db)
+        try:
+            return store.get(pkg)
+        finally:
+            store.close()
+
+    def test_duplicate_package(self):
+        pkg = self.path('a.pkg')
+        fixtures.make_package(pkg, 256 * 1024, 'gzip')
+        copy = self.path('copy.pkg')
+        shutil.copy(pkg, copy)
+        self.process([pkg, copy], metrics_file=self.path('metrics.jsonl'))
+        self.assertEqual(self.get(pkg)['status'], package_store.STATUS_DONE)
+        self.assertEqual(self.get(copy)['status'], package_store.STATUS_DUPLICATE)
+        self.assertEqual(self.get(copy)['symbols'], 0)
+        self.assertEqual(self.get(copy)['digest'], self.get(pkg)['digest'])
+        with open(self.path('metrics.jsonl'), 'rb') as f:
+            records = [json.loads(line.decode('utf-8')) for line in f]
+        self.assertNotIn(copy, [r['package'] for r in records if r['stage'] == 'dump_syms'])
+
+    def test_duplicate_payload(self):
+        # Two packages with the same payload, but different metadata.
+        with open(self.path('cpio'), 'wb') as f:
+            fixtures.write_cpio(f, 1, 256 * 1024)
+        with open(self.path('cpio'), 'rb') as source, open(self.path('Payload'), 'wb') as dest:
+            fixtures.compress_payload(source, dest, 'gzip')
+        packages = []
+        for name in ('a', 'b'):
+            info = self.path('PackageInfo')
+            with open(info, 'wb') as f:
+                f.write('<pkg-info identifier="com.example.{}"/>'.format(name).encode('utf-8'))
+            pkg = self.path(name + '.pkg')
+            fixtures.write_xar(pkg, [('PackageInfo', info, True),
+                                     ('Payload', self.path('Payload'), False)])
+            packages.append(pkg)
+        self.process(packages, metrics_file=self.path('metrics.jsonl'))
+        first, second = [self.get(pkg) for pkg in packages]
+        self.assertNotEqual(first['digest'], second['digest'])
+        self.assertEqual(second['status'], package_store.STATUS_DONE)
+        self.assertGreater(first['symbols'], 0)
+        self.assertEqual(second['symbols'], 0)
+        with open(self.path('metrics.jsonl'), 'rb') as f:
+            records = [json.loads(line.decode('utf-8')) for line in f]
+        self.assertEqual([r for r in records if r['package'] == packages[1] and
+                          r['stage'] in ('decode', 'dump_syms')], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,245 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import datetime
+import os
+import plistlib
+import shutil
+import tempfile
+import unittest
+
+from helpers import FileServer, load_script
+
+try:
+    repo_sync = load_script('repo_sync')
+except (ImportError, SyntaxError):
+    # It needs Python 2, reposado and requests.
+    repo_sync = None
+
+DIST = '''<?xml version="1.0" encoding="utf-8"?>
+<installer-gui-script minSpecVersion="1">
+    <choices-outline ui="SoftwareUpdate"><line choice="su"/></choices-outline>
+    <choice id="su" title="OS X Update {0}" versStr="10.11.{0}">
+        <pkg-ref id="com.apple.pkg.Update{0}">Update{0}.pkg</pkg-ref>
+    </choice>
+</installer-gui-script>
+'''
+
+
+@unittest.skipIf(repo_sync is None, 'repo_sync could not be imported')
+class RepoSyncTestCase(unittest.TestCase):
+    '''
+    Runs repo_sync against a local server, with reposado configured to
+    mirror it into a temporary directory.
+    '''
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.server_root = self.path('server')
+        self.updates_dir = self.path('html')
+        self.metadata_dir = self.path('metadata')
+        for path in (self.server_root, self.updates_dir, self.metadata_dir):
+            os.mkdir(path)
+        self.server = FileServer(self.server_root)
+        plistlib.writePlist({
+            'AppleCatalogURLs': [self.server.url('index.sucatalog')],
+            'UpdatesRootDir': self.updates_dir,
+            'UpdatesMetadataDir': self.metadata_dir,
+            'LocalCatalogURLBase': 'http://localhost/',
+        }, self.path('preferences.plist'))
+        reposadocommon = repo_sync.reposadocommon
+        self.saved = (reposadocommon.get_main_dir, repo_sync.MAX_CONCURRENT_DOWNLOADS,
+                      repo_sync.SESSION)
+        reposadocommon.get_main_dir = lambda: self.temp_dir
+        repo_sync._ETAG.clear()
+
+    def tearDown(self):
+        (repo_sync.reposadocommon.get_main_dir, repo_sync.MAX_CONCURRENT_DOWNLOADS,
+         repo_sync.SESSION) = self.saved
+        repo_sync._ETAG.clear()
+        self.server.close()
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, *names):
+        return os.path.join(self.temp_dir, *names)
+
+    def serve(self, name, data):
+        path = os.path.join(self.server_root, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+        return self.server.url(name)
+
+    def headers(self, name, method='GET'):
+        '''
+        Return the headers of each request for name.
+        '''
+        return [headers for m, path, headers in self.server.requests
+                if m == method and path == '/' + name]
+
+
+class CurlTest(RepoSyncTestCase):
+    DATA = b''.join(bytes(bytearray([i % 256])) for i in range(100000))
+
+    def test_download(self):
+        url = self.serve('a/file.bin', self.DATA)
+        destination = self.path('file.bin')
+        header = repo_sync.curl(url, destination)
+        self.assertEqual(header['http_result_code'], '200')
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), self.DATA)
+        self.assertFalse(os.path.exists(destination + '.download'))
+
+    def test_not_modified(self):
+        url = self.serve('a/file.bin', self.DATA)
+        destination = self.path('file.bin')
+        repo_sync.getURL(url, destination)
+        repo_sync.getURL(url, destination)
+        first, second = self.headers('a/file.bin')
+        self.assertNotIn('if-none-match', first)
+        self.assertTrue(second['if-none-match'])
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), self.DATA)
+
+        # ETags are kept for the next run.
+        repo_sync.writeEtagDict()
+        repo_sync._ETAG.clear()
+        header = repo_sync.curl(url, destination, etag=repo_sync.get_saved_etag(url))
+        self.assertEqual(header['http_result_code'], '304')
+
+    def test_changed_file_is_downloaded_again(self):
+        url = self.serve('a/file.bin', self.DATA)
+        destination = self.path('file.bin')
+        repo_sync.getURL(url, destination)
+        self.serve('a/file.bin', self.DATA[::-1])
+        repo_sync.getURL(url, destination)
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), self.DATA[::-1])
+
+    def test_resume(self):
+        url = self.serve('a/file.bin', self.DATA)
+        destination = self.path('file.bin')
+        with open(destination + '.download', 'wb') as f:
+            f.write(self.DATA[:30000])
+        header = repo_sync.curl(url, destination, resume=True)
+        self.assertEqual(header['http_result_code'], '206')
+        self.assertEqual(self.headers('a/file.bin')[0]['range'], 'bytes=30000-')
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), self.DATA)
+        self.assertFalse(os.path.exists(destination + '.download'))
+
+    def test_interrupted_transfer(self):
+        url = self.serve('a/file.bin', self.DATA)
+        destination = self.path('file.bin')
+        self.server.truncated.add('/a/file.bin')
+        self.assertRaises(repo_sync.CurlError, repo_sync.curl, url, destination)
+        self.assertFalse(os.path.exists(destination))
+        self.assertFalse(os.path.exists(destination + '.download'))
+
+        # When resuming, what did arrive is kept for the next attempt.
+        self.assertRaises(repo_sync.CurlError, repo_sync.curl, url, destination, resume=True)
+        self.assertFalse(os.path.exists(destination))
+        partial = os.path.getsize(destination + '.download')
+        self.assertTrue(0 < partial < len(self.DATA))
+        self.server.truncated.clear()
+        repo_sync.curl(url, destination, resume=True)
+        self.assertEqual(self.headers('a/file.bin')[-1]['range'], 'bytes={}-'.format(partial))
+        with open(destination, 'rb') as f:
+            self.assertEqual(f.read(), self.DATA)
+
+    def test_http_error(self):
+        url = self.serve('a/file.bin', self.DATA)
+        self.server.failing.add('/a/file.bin')
+        self.assertRaises(repo_sync.HTTPError, repo_sync.curl, url, self.path('file.bin'))
+        self.assertFalse(os.path.exists(self.path('file.bin')))
+
+
+class CurlOptionsTest(RepoSyncTestCase):
+    def test_parse(self):
+        settings = repo_sync.parseCurlOptions([
+            '# a comment',
+            'proxy = "http://proxy.example.com:3128"',
+            '--cacert /etc/ssl/ca.pem',
+            'cert: "/etc/ssl/client.pem"',
+            'key = /etc/ssl/client.key',
+            'header = "X-Example: yes"',
+        ])
+        self.assertEqual(settings, {
+            'proxies': {'http': 'http://proxy.example.com:3128',
+                        'https': 'http://proxy.example.com:3128'},
+            'verify': '/etc/ssl/ca.pem',
+            'cert': ('/etc/ssl/client.pem', '/etc/ssl/client.key'),
+            'headers': {'X-Example': 'yes'},
+        })
+        self.assertEqual(repo_sync.parseCurlOptions(None), {})
+        self.assertEqual(repo_sync.parseCurlOptions(['-E client.pem']), {'cert': 'client.pem'})
+
+    def test_unsupported(self):
+        for lines in (['limit-rate = 100K'], ['key = client.key'], ['header = broken']):
+            self.assertRaises(ValueError, repo_sync.parseCurlOptions, lines)
+
+    def test_session(self):
+        prefs = plistlib.readPlist(self.path('preferences.plist'))
+        prefs['AdditionalCurlOptions'] = ['proxy = "http://proxy.example.com:3128"',
+                                          'cacert = "/etc/ssl/ca.pem"']
+        plistlib.writePlist(prefs, self.path('preferences.plist'))
+        repo_sync.SESSION = None
+        session = repo_sync.getSession()
+        self.assertEqual(session.proxies['https'], 'http://proxy.example.com:3128')
+        self.assertEqual(session.verify, '/etc/ssl/ca.pem')
+        adapter = session.get_adapter('https://swscan.apple.com/')
+        self.assertIsInstance(adapter, repo_sync.CipherAdapter)
+        self.assertIn('ssl_context', adapter.poolmanager.connection_pool_kw)
+
+
+class SyncTest(RepoSyncTestCase):
+    PRODUCTS = 6
+
+    def setUp(self):
+        RepoSyncTestCase.setUp(self)
+        products = {}
+        for n in range(self.PRODUCTS):
+            products['041-{:04d}'.format(n)] = {
+                'PostDate': datetime.datetime(2016, 1, 1 + n),
+                'ServerMetadataURL': self.serve('p{0}/Update{0}.smd'.format(n), b''),
+                'Packages': [{'URL': self.serve('p{0}/Update{0}.pkg'.format(n), b'pkg' * 1000),
+                              'Size': 3000}],
+                'Distributions': {'English': self.serve('p{0}/041-{0:04d}.English.dist'.format(n),
+                                                        DIST.format(n).encode('utf-8'))},
+            }
+        plistlib.writePlist({'Products': products},
+                            os.path.join(self.server_root, 'index.sucatalog'))
+
+    def package_requests(self):
+        return [path for path in self.server.requested() if path.endswith('.pkg')]
+
+    def test_products_are_transferred_concurrently(self):
+        repo_sync.MAX_CONCURRENT_DOWNLOADS = 4
+        repo_sync.SESSION = None
+        self.server.delay = 0.2
+        repo_sync.sync(download_packages=True)
+        for n in range(self.PRODUCTS):
+            path = os.path.join(self.updates_dir, 'p{0}'.format(n), 'Update{0}.pkg'.format(n))
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'pkg' * 1000)
+        self.assertEqual(len(self.package_requests()), self.PRODUCTS)
+        self.assertGreater(self.server.max_active, 1)
+        products = repo_sync.reposadocommon.getProductInfo()
+        self.assertEqual(sorted(p['title'] for p in products.values()),
+                         ['OS X Update {}'.format(n) for n in range(self.PRODUCTS)])
+
+    def test_incremental_sync_skips_unchanged_products(self):
+        repo_sync.sync(download_packages=True, incremental=True)
+        del self.server.requests[:]
+        repo_sync.sync(download_packages=True, incremental=True)
+        # Only the catalog is checked again, and it hasn't changed.
+        self.assertEqual(self.server.requested(), ['/index.sucatalog'])
+        self.assertTrue(self.headers('index.sucatalog')[0]['if-none-match'])
+
+    def test_skip_list(self):
+        skip = os.path.join(self.updates_dir, 'p0', 'Update0.pkg')
+        repo_sync.sync(download_packages=True, skip_paths=set([skip]))
+        self.assertNotIn('/p0/Update0.pkg', self.package_requests())
+        self.assertEqual(len(self.package_requests()), self.PRODUCTS - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import unittest
+
+from helpers import load_script
+
+try:
+    run_taskcluster = load_script('run-taskcluster.py')
+    import shards
+except (ImportError, SyntaxError):
+    # It needs Python 2, requests and taskcluster.
+    run_taskcluster = None
+
+KEYS = {
+    'task_group_id': 'group',
+    'task_created': '2016-01-01T00:00:00Z',
+    'task_deadline': '2016-01-01T08:00:00Z',
+    'artifacts_expires': '2016-06-29T00:00:00Z',
+    'date_index': '20160101000000',
+}
+DOWNLOADS = 'http://swcdn.apple.com/content/downloads/'
+
+
+def product(title, *sizes):
+    return {'title': title, 'CatalogEntry': {'Packages': [
+        {'URL': DOWNLOADS + '{}/{}.pkg'.format(title.replace(' ', ''), i), 'Size': size}
+        for i, size in enumerate(sizes)]}}
+
+
+class FakeQueue(object):
+    '''
+    Records the tasks created instead of creating them.
+    '''
+    def __init__(self):
+        self.tasks = []
+
+    def createTask(self, task_id, payload):
+        self.tasks.append((task_id, payload))
+
+
+@unittest.skipIf(run_taskcluster is None, 'run-taskcluster.py could not be imported')
+class ScheduleTasksTest(unittest.TestCase):
+    PRODUCTS = {
+        'A': product('OS X Update A', 100),
+        'B': product('OS X Update B', 60),
+        'C': product('OS X Update C', 30, 20),
+        'D': product('macOS Update D', 10),
+        'E': product('iTunes E', 500),
+    }
+
+    def schedule(self, *args):
+        queue = FakeQueue()
+        fetch_task_id = run_taskcluster.schedule_tasks(queue, KEYS, 'decision', *args)
+        return fetch_task_id, queue.tasks
+
+    def check_upload(self, task, fetch_task_id):
+        self.assertEqual(task['dependencies'], [fetch_task_id])
+        self.assertEqual(task['payload']['env']['ARTIFACT_TASKID'], fetch_task_id)
+
+    def test_single_fetch_task(self):
+        for args in ((), (1, self.PRODUCTS), (3, None)):
+            fetch_task_id, tasks = self.schedule(*args)
+            self.assertEqual(len(tasks), 2)
+            (task_id, fetch), (_, upload) = tasks
+            self.assertEqual(task_id, fetch_task_id)
+            self.assertEqual(fetch['dependencies'], ['decision'])
+            self.assertEqual(fetch['taskGroupId'], 'group')
+            self.assertNotIn('SHARD_INDEX', fetch['payload']['env'])
+            self.check_upload(upload, fetch_task_id)
+
+    def test_shards(self):
+        processed = ['/opt/data-reposado/html/content/downloads/OSXUpdateA/0.pkg']
+        fetch_task_id, tasks = self.schedule(2, self.PRODUCTS, processed)
+        self.assertEqual(len(tasks), 4)
+        shard_tasks, (merge_id, merge), (_, upload) = tasks[:2], tasks[2], tasks[3]
+
+        # A has been processed, so only the other products count.
+        assignment = [['B', 'A'], ['C', 'D']]
+        for i, (task_id, task) in enumerate(shard_tasks):
+            env = task['payload']['env']
+            self.assertEqual(task['dependencies'], ['decision'])
+            self.assertEqual(env['SHARD_INDEX'], str(i))
+            self.assertEqual(shards.loads(env['SHARD_ASSIGNMENT']), assignment)
+            wanted = sorted(shards.wanted_products(self.PRODUCTS))
+            self.assertEqual(shards.shard_products(wanted, assignment, i), sorted(assignment[i]))
+            self.assertEqual(task['metadata']['name'],
+                             'breakpad-mac-update-symbols shard {}'.format(i))
+
+        # The merge task waits for every shard, and the upload for it.
+        shard_task_ids = [task_id for task_id, _ in shard_tasks]
+        self.assertEqual(len(set(shard_task_ids + [merge_id])), 3)
+        self.assertEqual(fetch_task_id, merge_id)
+        self.assertEqual(merge['dependencies'], shard_task_ids)
+        self.assertEqual(merge['payload']['env']['SHARD_TASK_IDS'], ' '.join(shard_task_ids))
+        self.check_upload(upload, merge_id)
+
+
+if __name__ == '__main__':
+    unittest.main()
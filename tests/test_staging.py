@@ -0,0 +1,115 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import helpers  # noqa: F401
+
+import staging
+
+
+class StagingAreaTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.disk_dir = os.path.join(self.temp_dir, 'disk')
+        self.memory_dir = os.path.join(self.temp_dir, 'memory')
+        os.mkdir(self.disk_dir)
+        os.mkdir(self.memory_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def reserve_later(self, area, size):
+        '''
+        Reserve size bytes of area on another thread. Returns the thread
+        and a list the reservation is put in once it is granted.
+        '''
+        granted = []
+        thread = threading.Thread(target=lambda: granted.append(area.reserve(size)))
+        thread.daemon = True
+        thread.start()
+        # Give it time to block.
+        time.sleep(0.2)
+        return thread, granted
+
+    def test_reservation_waits_for_release(self):
+        area = staging.StagingArea(self.disk_dir, 100)
+        first = area.reserve(60)
+        self.assertEqual(os.path.dirname(first.path), self.disk_dir)
+        thread, granted = self.reserve_later(area, 60)
+        self.assertEqual(granted, [])
+        self.assertEqual(area.waits, 1)
+        path = first.path
+        first.release()
+        thread.join(5)
+        self.assertEqual(len(granted), 1)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(area.disk.reserved, 60)
+        granted[0].release()
+        self.assertEqual((area.disk.reserved, area.disk.count), (0, 0))
+        self.assertEqual(os.listdir(self.disk_dir), [])
+
+    def test_oversized_reservation_runs_alone(self):
+        area = staging.StagingArea(self.disk_dir, 100)
+        # Nothing else is held, so it goes ahead despite the budget.
+        with area.reserve(1000) as big:
+            self.assertEqual(area.waits, 0)
+            thread, granted = self.reserve_later(area, 10)
+            self.assertEqual(granted, [])
+            big.release()
+            thread.join(5)
+        self.assertEqual(len(granted), 1)
+        granted[0].release()
+
+        with area.reserve(10):
+            thread, granted = self.reserve_later(area, 1000)
+            # It waits for everything else to be released first.
+            self.assertEqual(granted, [])
+        thread.join(5)
+        self.assertEqual(len(granted), 1)
+        granted[0].release()
+
+    def test_settle_frees_the_rest(self):
+        area = staging.StagingArea(self.disk_dir, 100)
+        first = area.reserve(90)
+        with open(os.path.join(first.path, 'binary'), 'wb') as f:
+            f.write(b'\0' * 10)
+        thread, granted = self.reserve_later(area, 50)
+        self.assertEqual(granted, [])
+        first.settle()
+        thread.join(5)
+        self.assertEqual(len(granted), 1)
+        self.assertEqual((first.size, area.disk.reserved), (10, 60))
+        granted[0].settle(20)
+        self.assertEqual(area.disk.reserved, 30)
+        first.release()
+        granted[0].release()
+        self.assertEqual(area.disk.reserved, 0)
+
+    def test_memory_or_disk(self):
+        area = staging.StagingArea(self.disk_dir, 1000, self.memory_dir, 100, small_limit=50)
+        reservations = [area.reserve(size) for size in (40, 60, 40, 30)]
+        # Small payloads go in memory while they fit there; the rest on disk.
+        self.assertEqual([os.path.dirname(r.path) for r in reservations],
+                         [self.memory_dir, self.disk_dir, self.memory_dir, self.disk_dir])
+        self.assertEqual((area.memory.reserved, area.disk.reserved), (80, 90))
+        reservations[0].release()
+        with area.reserve(30) as reservation:
+            self.assertEqual(os.path.dirname(reservation.path), self.memory_dir)
+        for reservation in reservations:
+            reservation.release()
+        self.assertEqual((area.memory.reserved, area.disk.reserved), (0, 0))
+
+    def test_no_memory_area(self):
+        for memory_dir, memory_budget in ((None, 100), (self.memory_dir, 0)):
+            area = staging.StagingArea(self.disk_dir, 1000, memory_dir, memory_budget)
+            self.assertIsNone(area.memory)
+            with area.reserve(10) as reservation:
+                self.assertEqual(os.path.dirname(reservation.path), self.disk_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import os
+import shutil
+import tempfile
+import unittest
+
+import helpers  # noqa: F401
+
+from symbol_index import SymbolIndex, parse_symbol_filename
+
+
+def read_lines(path):
+    with open(path, 'rb') as f:
+        return f.read().decode('utf-8').splitlines()
+
+
+class SymbolIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'symbol-index')
+        self.manifest = os.path.join(self.temp_dir, 'manifest')
+        with open(self.path, 'wb') as f:
+            f.write(b'libB.dylib\tBBBB\nlibA.dylib\tAAAA\nlibB.dylib\tBBBB\nbroken line\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_load(self):
+        index = SymbolIndex(self.path)
+        self.assertEqual(len(index), 2)
+        self.assertIn(('libA.dylib', 'AAAA'), index)
+        self.assertNotIn(('libA.dylib', 'BBBB'), index)
+        self.assertEqual(len(SymbolIndex(os.path.join(self.temp_dir, 'missing'))), 0)
+
+    def test_manifest_lists_pairs_added_by_this_run(self):
+        index = SymbolIndex(self.path)
+        self.assertTrue(index.add('libD.dylib', 'DDDD'))
+        self.assertFalse(index.add('libA.dylib', 'AAAA'))
+        self.assertFalse(index.add('libD.dylib', 'DDDD'))
+        # An interrupted run had already added these to the archive.
+        index.adopt([('libB.dylib', 'BBBB'), ('libC.dylib', 'CCCC'), ('libB.dylib', 'BBBB'),
+                     ('libD.dylib', 'DDDD')])
+        index.write_manifest(self.manifest, new_only=True)
+        self.assertEqual(read_lines(self.manifest), [
+            'libB.dylib\tBBBB', 'libC.dylib\tCCCC', 'libD.dylib\tDDDD'])
+        index.write_manifest(self.manifest)
+        self.assertEqual(len(read_lines(self.manifest)), 4)
+        self.assertFalse(os.path.exists(self.manifest + '.tmp'))
+        index.close()
+
+    def test_close_compacts(self):
+        index = SymbolIndex(self.path)
+        index.add('libC.dylib', 'CCCC')
+        index.add('libAA.dylib', 'AAAA')
+        index.flush()
+        self.assertEqual(read_lines(self.path)[-2:], ['libC.dylib\tCCCC', 'libAA.dylib\tAAAA'])
+        # Never flushed, so its symbol file may not have been written.
+        index.add('libD.dylib', 'DDDD')
+        index.close()
+        self.assertEqual(read_lines(self.path), [
+            'libA.dylib\tAAAA', 'libAA.dylib\tAAAA', 'libB.dylib\tBBBB', 'libC.dylib\tCCCC'])
+        self.assertEqual(len(SymbolIndex(self.path)), 4)
+
+    def test_in_memory(self):
+        index = SymbolIndex()
+        index.add('libA.dylib', 'AAAA')
+        index.flush()
+        index.close()
+        self.assertIn(('libA.dylib', 'AAAA'), index)
+
+    def test_parse_symbol_filename(self):
+        self.assertEqual(parse_symbol_filename('libA.dylib/AAAA/libA.dylib.sym'),
+                         ('libA.dylib', 'AAAA'))
+        self.assertIsNone(parse_symbol_filename('libA.dylib/AAAA/libB.dylib.sym'))
+        self.assertIsNone(parse_symbol_filename('x/libA.dylib/AAAA/libA.dylib.sym'))
+
+
+if __name__ == '__main__':
+    unittest.main()
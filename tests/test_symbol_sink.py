@@ -0,0 +1,102 @@
+# See the LICENSE file at the top-level directory of this distribution.
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import helpers  # noqa: F401
+
+import symbol_sink
+
+
+def symbol_file(n):
+    name = 'lib{0}.dylib/{0:032X}0/lib{0}.dylib.sym'.format(n)
+    contents = 'MODULE mac x86_64 {0:032X}0 lib{0}.dylib\n'.format(n).encode('ascii') * (n % 7 + 1)
+    return name, contents
+
+
+class ZipSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'symbols.zip')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def write(self, files, **kwargs):
+        sink = symbol_sink.ZipSink(self.path, **kwargs)
+        for name, contents in files:
+            sink.add(name, contents)
+        sink.close()
+        return sink
+
+    def check(self, files):
+        '''
+        Check that the archive holds files, in order, with good CRCs.
+        '''
+        with zipfile.ZipFile(self.path) as z:
+            self.assertIsNone(z.testzip())
+            self.assertEqual(z.namelist(), [name for name, _ in files])
+            for name, contents in files:
+                self.assertEqual(z.read(name), contents)
+
+    def test_write(self):
+        files = [symbol_file(n) for n in range(10)]
+        self.write(files + [files[3]])
+        self.check(files)
+
+    def test_threads_keep_order(self):
+        files = [symbol_file(n) for n in range(200)]
+        sink = self.write(files, threads=4)
+        self.assertEqual(sink.count, 200)
+        self.check(files)
+
+    def test_zip64_entry_count(self):
+        files = [symbol_file(n) for n in range(symbol_sink.ZIP64_COUNT_LIMIT + 10)]
+        self.write(files, level=1)
+        with open(self.path, 'rb') as f:
+            self.assertIn(b'PK\x06\x06', f.read()[-200:])
+        with zipfile.ZipFile(self.path) as z:
+            infos = z.infolist()
+            self.assertEqual(len(infos), len(files))
+            self.assertEqual(infos[-1].filename, files[-1][0])
+            self.assertEqual(z.read(files[-1][0]), files[-1][1])
+
+    def test_append(self):
+        files = [symbol_file(n) for n in range(6)]
+        self.write(files[:3])
+        sink = symbol_sink.ZipSink(self.path, append=True)
+        self.assertEqual(sink.recovered, [name for name, _ in files[:3]])
+        for name, contents in files[2:]:
+            sink.add(name, contents)
+        sink.close()
+        self.check(files)
+
+    def test_recover_truncated_archive(self):
+        files = [symbol_file(n) for n in range(6)]
+        sink = symbol_sink.ZipSink(self.path, threads=2)
+        for name, contents in files[:4]:
+            sink.add(name, contents)
+        sink.flush()
+        size = os.path.getsize(self.path)
+        sink.close()
+        # Cut off in the last file, before any central directory.
+        with open(self.path, 'r+b') as f:
+            f.truncate(size - 10)
+        self.assertRaises(zipfile.BadZipfile, zipfile.ZipFile, self.path)
+
+        sink = symbol_sink.ZipSink(self.path, append=True)
+        self.assertEqual(sink.recovered, [name for name, _ in files[:3]])
+        for name, contents in files[3:]:
+            sink.add(name, contents)
+        sink.close()
+        self.check(files)
+
+    def test_empty_archive_is_removed(self):
+        self.write([])
+        self.assertFalse(os.path.exists(self.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+udif.py
+
+Reads Apple UDIF disk images (.dmg) in place. The koly trailer and the blkx
+tables in the XML resource fork are parsed up front; each partition is then
+exposed as a seekable file object whose chunks are decompressed on demand,
+so the raw disk image is never written out.
+'''
+import bisect
+import bz2
+import os
+import plistlib
+import struct
+import threading
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    from backports import lzma
+
+KOLY_MAGIC = b'koly'
+KOLY = struct.Struct('>4sIIIQQQQQII16sII128sQQ')
+KOLY_SIZE = 512
+MISH_MAGIC = b'mish'
+MISH = struct.Struct('>4sIQQQII24sII128sI')
+CHUNK = struct.Struct('>IIQQQQ')
+SECTOR_SIZE = 512
+
+CHUNK_ZERO = 0x00000000
+CHUNK_RAW = 0x00000001
+CHUNK_IGNORE = 0x00000002
+CHUNK_ADC = 0x80000004
+CHUNK_ZLIB = 0x80000005
+CHUNK_BZIP2 = 0x80000006
+CHUNK_LZFSE = 0x80000007
+CHUNK_LZMA = 0x80000008
+CHUNK_COMMENT = 0x7ffffffe
+CHUNK_END = 0xffffffff
+
+# The number of decoded chunks each partition keeps around. Reads of file
+# data and of filesystem metadata tend to revisit the same few chunks.
+CACHED_CHUNKS = 4
+
+
+class UdifError(Exception):
+    '''The input is not a UDIF disk image this module can read.'''
+    pass
+
+
+class Chunk(object):
+    '''
+    A run of sectors of a partition and where its (possibly compressed) data
+    is in the image file.
+    '''
+    def __init__(self, type, offset, size, data_offset, data_length):
+        self.type = type
+        self.offset = offset
+        self.size = size
+        self.data_offset = data_offset
+        self.data_length = data_length
+
+
+def _decode_chunk(f, chunk):
+    if chunk.type in (CHUNK_ZERO, CHUNK_IGNORE):
+        return b'\0' * chunk.size
+    f.seek(chunk.data_offset)
+    data = f.read(chunk.data_length)
+    if len(data) != chunk.data_length:
+        raise UdifError('Chunk at {} is truncated'.format(chunk.data_offset))
+    try:
+        if chunk.type == CHUNK_RAW:
+            decoded = data
+        elif chunk.type == CHUNK_ZLIB:
+            decoded = zlib.decompress(data)
+        elif chunk.type == CHUNK_BZIP2:
+            decoded = bz2.decompress(data)
+        elif chunk.type == CHUNK_LZMA:
+            decoded = lzma.decompress(data)
+        else:
+            raise UdifError('Unsupported chunk type 0x{0:08x}'.format(chunk.type))
+    except (zlib.error, IOError, EOFError, lzma.LZMAError) as e:
+        raise UdifError('Could not decompress chunk at {}: {}'.format(chunk.data_offset, e))
+    if len(decoded) < chunk.size:
+        raise UdifError('Chunk at {} decoded to {} bytes, expected {}'.format(
+            chunk.data_offset, len(decoded), chunk.size))
+    return decoded[:chunk.size]
+
+
+class Partition(object):
+    '''
+    A seekable, read-only file object for the decoded contents of one blkx
+    entry of a disk image. Reads from different threads are serialized.
+    '''
+    def __init__(self, f, name, chunks):
+        self._f = f
+        self.name = name
+        self._chunks = chunks
+        self._starts = [c.offset for c in chunks]
+        self._length = chunks[-1].offset + chunks[-1].size if chunks else 0
+        self._pos = 0
+        self._cache = []
+        self.lock = getattr(f, 'lock', None) or threading.RLock()
+
+    def __len__(self):
+        return self._length
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self._length
+        if offset < 0:
+            raise UdifError('Invalid seek offset: {}'.format(offset))
+        self._pos = offset
+        return self._pos
+
+    def _chunk_data(self, index):
+        for cached_index, data in self._cache:
+            if cached_index == index:
+                return data
+        data = _decode_chunk(self._f, self._chunks[index])
+        self._cache.append((index, data))
+        del self._cache[:-CACHED_CHUNKS]
+        return data
+
+    def read(self, size=-1):
+        remaining = max(self._length - self._pos, 0)
+        if size < 0 or size > remaining:
+            size = remaining
+        pieces = []
+        with self.lock:
+            while size:
+                index = bisect.bisect_right(self._starts, self._pos) - 1
+                chunk = self._chunks[index]
+                skip = self._pos - chunk.offset
+                if skip >= chunk.size:
+                    # A gap between chunks; treat it as zeros.
+                    following = self._starts[index + 1] if index + 1 < len(self._starts) else self._length
+                    data = b'\0' * min(following - self._pos, size)
+                else:
+                    data = self._chunk_data(index)[skip:skip + size]
+                pieces.append(data)
+                self._pos += len(data)
+                size -= len(data)
+        return b''.join(pieces)
+
+
+def _parse_blkx(data, data_fork_offset):
+    fields = MISH.unpack_from(data)
+    magic, sector_number, data_offset, chunk_count = fields[0], fields[2], fields[4], fields[11]
+    if magic != MISH_MAGIC:
+        raise UdifError('Bad blkx table magic {0!r}'.format(magic))
+    if len(data) < MISH.size + chunk_count * CHUNK.size:
+        raise UdifError('Truncated blkx table')
+    chunks = []
+    for i in range(chunk_count):
+        (type, _comment, sector, sectors,
+         compressed_offset, compressed_length) = CHUNK.unpack_from(data, MISH.size + i * CHUNK.size)
+        if type == CHUNK_END:
+            break
+        if type == CHUNK_COMMENT:
+            continue
+        chunks.append(Chunk(type, sector * SECTOR_SIZE, sectors * SECTOR_SIZE,
+                            data_fork_offset + data_offset + compressed_offset,
+                            compressed_length))
+    return sector_number, chunks
+
+
+class UdifImage(object):
+    '''
+    A UDIF disk image read from the seekable file object f.
+    '''
+    def __init__(self, f):
+        self._f = f
+        f.seek(0, os.SEEK_END)
+        length = f.tell()
+        if length < KOLY_SIZE:
+            raise UdifError('Too small to be a disk image')
+        f.seek(length - KOLY_SIZE)
+        fields = KOLY.unpack(f.read(KOLY.size))
+        magic, data_fork_offset, xml_offset, xml_length = fields[0], fields[5], fields[15], fields[16]
+        if magic != KOLY_MAGIC:
+            raise UdifError('Not a UDIF disk image')
+        if not xml_length or xml_offset + xml_length > length:
+            raise UdifError('Disk image has no usable resource fork')
+        f.seek(xml_offset)
+        xml = f.read(xml_length)
+        try:
+            if hasattr(plistlib, 'loads'):
+                plist = plistlib.loads(xml)
+            else:
+                plist = plistlib.readPlistFromString(xml)
+            entries = plist['resource-fork']['blkx']
+        except Exception as e:
+            raise UdifError('Could not parse resource fork: {}'.format(e))
+        self.partitions = []
+        for entry in entries:
+            data = entry.get('Data')
+            # plistlib wraps <data> in a Data object on Python 2.
+            data = getattr(data, 'data', data)
+            if not data or len(data) < MISH.size:
+                raise UdifError('Malformed blkx entry {0!r}'.format(entry.get('Name')))
+            _sector, chunks = _parse_blkx(data, data_fork_offset)
+            self.partitions.append(Partition(f, entry.get('Name', entry.get('CFName', '')), chunks))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# See the LICENSE file at the top-level directory of this distribution.
+'''
+xar.py
+
+Reads xar archives (flat installer packages) in place. The header and the
+zlib-compressed XML table of contents are parsed up front; members are then
+read straight from their offset in the heap, without extracting the archive.
+'''
+import binascii
+import bz2
+import posixpath
+import struct
+import zlib
+import xml.etree.ElementTree as ElementTree
+
+from streams import IterReader, SectionReader
+
+XAR_MAGIC = b'xar!'
+HEADER = struct.Struct('>4sHHQQI')
+BLOCK_SIZE = 1024 * 1024
+
+ENCODING_NONE = 'application/octet-stream'
+ENCODING_GZIP = 'application/x-gzip'
+ENCODING_BZIP2 = 'application/x-bzip2'
+
+
+class XarError(Exception):
+    '''The input is not a well-formed xar archive.'''
+    pass
+
+
+class XarMember(object):
+    '''
+    A file or directory in a xar archive.
+
+    name is the full path of the member within the archive. For files,
+    offset and length locate the (possibly encoded) data in the heap, size is
+    the decoded size, and archived_checksum/extracted_checksum are
+    (algorithm, hex digest) tuples, or None if the TOC doesn't list them.
+    '''
+    def __init__(self, name, type, offset=0, length=0, size=0,
+                 encoding=ENCODING_NONE, archived_checksum=None,
+                 extracted_checksum=None):
+        self.name = name
+        self.type = type
+        self.offset = offset
+        self.length = length
+        self.size = size
+        self.encoding = encoding
+        self.archived_checksum = archived_checksum
+        self.extracted_checksum = extracted_checksum
+
+    @property
+    def basename(self):
+        return posixpath.basename(self.name)
+
+    def isfile(self):
+        return self.type == 'file'
+
+    def isdir(self):
+        return self.type == 'directory'
+
+    def __repr__(self):
+        return '<XarMember {0!r} {1} {2} bytes>'.format(self.name, self.type, self.size)
+
+
+def _checksum(element):
+    if element is None:
+        return None
+    return element.get('style', ''), (element.text or '').strip().lower()
+
+
+def _parse_files(parent, prefix, members):
+    for element in parent.findall('file'):
+        name = posixpath.join(prefix, element.findtext('name', ''))
+        data = element.find('data')
+        if data is None:
+            member = XarMember(name, element.findtext('type', ''))
+        else:
+            encoding = data.find('encoding')
+            try:
+                member = XarMember(
+                    name, element.findtext('type', ''),
+                    offset=int(data.findtext('offset', '0')),
+                    length=int(data.findtext('length', '0')),
+                    size=int(data.findtext('size', '0')),
+                    encoding=ENCODING_NONE if encoding is None else encoding.get('style', ENCODING_NONE),
+                    archived_checksum=_checksum(data.find('archived-checksum')),
+                    extracted_checksum=_checksum(data.find('extracted-checksum')))
+            except ValueError:
+                raise XarError('Malformed data for {0!r} in table of contents'.format(name))
+        members.append(member)
+        _parse_files(element, name, members)
+
+
+def _decode_blocks(section, decompressor):
+    while True:
+        data = section.read(BLOCK_SIZE)
+        if not data:
+            break
+        yield decompressor.decompress(data)
+    if hasattr(decompressor, 'flush'):
+        yield decompressor.flush()
+
+
+class XarArchive(object):
+    '''
+    A xar archive read from the seekable file object f, which may itself be
+    a member of another archive.
+    '''
+    def __init__(self, f):
+        f.seek(0, 2)
+        length = f.tell()
+        self._f = SectionReader(f, 0, length)
+        header = self._f.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise XarError('Truncated xar header')
+        (magic, header_size, self.version, toc_length, toc_size,
+         self.checksum_algorithm) = HEADER.unpack(header)
+        if magic != XAR_MAGIC:
+            raise XarError('Not a xar archive')
+        self._f.seek(header_size)
+        try:
+            toc = zlib.decompress(self._f.read(toc_length))
+        except zlib.error as e:
+            raise XarError('Could not decompress table of contents: {}'.format(e))
+        if len(toc) != toc_size:
+            raise XarError('Table of contents is {} bytes, expected {}'.format(len(toc), toc_size))
+        try:
+            root = ElementTree.fromstring(toc)
+        except ElementTree.ParseError as e:
+            raise XarError('Could not parse table of contents: {}'.format(e))
+        self._heap_offset = header_size + toc_length
+        self._heap_length = length - self._heap_offset
+        toc_element = root.find('toc')
+        if toc_element is None:
+            raise XarError('Missing table of contents')
+        # The checksum of the TOC itself is stored at the start of the heap.
+        self.toc_checksum = None
+        checksum = toc_element.find('checksum')
+        if checksum is not None:
+            try:
+                offset = int(checksum.findtext('offset', '0'))
+                size = int(checksum.findtext('size', '0'))
+            except ValueError:
+                raise XarError('Malformed table of contents checksum')
+            self._f.seek(self._heap_offset + offset)
+            self.toc_checksum = (checksum.get('style', ''),
+                                 binascii.hexlify(self._f.read(size)).decode('ascii'))
+        self.members = []
+        _parse_files(toc_element, '', self.members)
+
+    def files(self):
+        '''
+        Return the file members of the archive.
+        '''
+        return [m for m in self.members if m.isfile()]
+
+    def open(self, member):
+        '''
+        Return a file object for the decoded contents of member. Members
+        stored without encoding (such as payloads, which are already
+        compressed) are returned as seekable views of the archive itself.
+        '''
+        if member.offset + member.length > self._heap_length:
+            raise XarError('Data for {0!r} is outside the archive'.format(member.name))
+        section = SectionReader(self._f, self._heap_offset + member.offset, member.length)
+        if member.encoding == ENCODING_NONE:
+            return section
+        elif member.encoding == ENCODING_GZIP:
+            # Despite the name, xar stores these as zlib streams.
+            return IterReader(_decode_blocks(section, zlib.decompressobj()))
+        elif member.encoding == ENCODING_BZIP2:
+            return IterReader(_decode_blocks(section, bz2.BZ2Decompressor()))
+        raise XarError('Unsupported encoding {0!r} for {1!r}'.format(member.encoding, member.name))